@@ -1,20 +1,34 @@
-import csv
-from collections import Counter
+import os
+import sys
 
-# Read CSV file
-with open('backend/rawbusinessdata.csv', 'r', encoding='utf-8') as f:
-    reader = csv.DictReader(f)
-    data = list(reader)
+import pandas as pd
 
-# Extract and normalize categories
-categories = []
-for row in data:
-    if row.get('general_category'):
-        cat = row['general_category'].strip()
-        categories.append(cat)
+# Same cleaning as the importer and the ML service
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml"))
+from normalize import normalize_businesses
+from stats import fetch_stats
 
-# Count occurrences
-count_dict = Counter(categories)
+# --live: counts of the businesses table as of the ML service's last
+# training run (GET /stats) instead of the CSV
+live = fetch_stats() if '--live' in sys.argv else None
+if '--live' in sys.argv and live is None:
+    sys.exit("Could not fetch /stats from the ML service (ML_SERVICE_URL)")
+
+if live is not None:
+    source = f"businesses, ML service stats of {live['generated_at']}"
+    count_dict = live['by_category']
+    rejected = []
+else:
+    source = "from rawbusinessdata.csv"
+    # Read CSV file
+    data = pd.read_csv('backend/rawbusinessdata.csv', dtype={'general_category': 'category'},
+                       keep_default_na=False, na_values=[''])
+
+    # Normalize categories and drop invalid rows
+    clean, rejected = normalize_businesses(data)
+
+    # Count occurrences
+    count_dict = clean['general_category'].value_counts().to_dict()
 
 # Valid categories from user
 valid_categories = [
@@ -27,7 +41,7 @@ valid_categories = [
 ]
 
 print("=" * 70)
-print("BUSINESS COUNT BY CATEGORY (from rawbusinessdata.csv)")
+print(f"BUSINESS COUNT BY CATEGORY ({source})")
 print("=" * 70)
 print()
 
@@ -39,4 +53,6 @@ for category in sorted(count_dict.keys()):
 print()
 print("=" * 70)
 print(f"TOTAL BUSINESSES: {sum(count_dict.values())}")
+if len(rejected):
+    print(f"SKIPPED INVALID ROWS: {len(rejected)} ({rejected['reason'].value_counts().to_dict()})")
 print("=" * 70)
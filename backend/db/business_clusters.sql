@@ -0,0 +1,61 @@
+-- Cluster-level training output, one row per cluster
+-- The ML service (backend/ml/clusters.py) used to repeat each cluster's
+-- category_distribution and cluster_center (JSON) on every businesses row.
+-- They are now written once per cluster to business_clusters, together
+-- with the cluster's population and mean distance / radius densities, and
+-- businesses rows keep only the cluster id and numeric features. Join on
+-- businesses.cluster = business_clusters.cluster_id (or read the
+-- businesses_with_clusters view) where the old columns are still needed.
+
+CREATE TABLE IF NOT EXISTS public.business_clusters (
+  cluster_id integer PRIMARY KEY,
+  center_latitude double precision,
+  center_longitude double precision,
+  population integer,
+  category_distribution jsonb,
+  mean_distance_to_center double precision,
+  mean_business_density_50m double precision,
+  mean_business_density_100m double precision,
+  mean_business_density_200m double precision,
+  mean_competitor_density_50m double precision,
+  mean_competitor_density_100m double precision,
+  mean_competitor_density_200m double precision,
+  -- Set by PARTITION_BY training (see partitioned_training.sql)
+  partition_key text,
+  updated_at timestamptz DEFAULT now()
+);
+
+ALTER TABLE public.business_clusters ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service Role Full Access" ON public.business_clusters;
+CREATE POLICY "Service Role Full Access" ON public.business_clusters
+    FOR ALL
+    USING (auth.role() = 'service_role')
+    WITH CHECK (auth.role() = 'service_role');
+
+DROP POLICY IF EXISTS "Enable read access for authenticated users" ON public.business_clusters;
+CREATE POLICY "Enable read access for authenticated users" ON public.business_clusters
+    FOR SELECT
+    TO authenticated
+    USING (true);
+
+-- The per-row copies are no longer written. Staging loses them too, since
+-- the swap copies every businesses column out of staging.
+ALTER TABLE public.businesses DROP COLUMN IF EXISTS category_distribution;
+ALTER TABLE public.businesses DROP COLUMN IF EXISTS cluster_center;
+ALTER TABLE public.businesses_staging DROP COLUMN IF EXISTS category_distribution;
+ALTER TABLE public.businesses_staging DROP COLUMN IF EXISTS cluster_center;
+
+-- Old row shape for readers that still expect the per-row columns
+CREATE OR REPLACE VIEW public.businesses_with_clusters
+WITH (security_invoker = true) AS
+SELECT b.*,
+       c.category_distribution,
+       jsonb_build_object(
+         'latitude', c.center_latitude,
+         'longitude', c.center_longitude
+       ) AS cluster_center
+  FROM public.businesses b
+  LEFT JOIN public.business_clusters c ON c.cluster_id = b.cluster;
+
+NOTIFY pgrst, 'reload schema';
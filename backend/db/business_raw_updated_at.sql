@@ -0,0 +1,22 @@
+-- Keep business_raw.updated_at current
+-- The ML service keeps a local snapshot of business_raw
+-- (backend/ml/snapshot_cache.py) and refreshes it by fetching only rows with
+-- updated_at at or after the newest one it has seen, so every UPDATE has to
+-- bump the column.
+
+CREATE OR REPLACE FUNCTION public.touch_business_raw_updated_at()
+RETURNS trigger AS $$
+BEGIN
+  NEW.updated_at := now();
+  RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS business_raw_touch_updated_at ON public.business_raw;
+CREATE TRIGGER business_raw_touch_updated_at
+  BEFORE UPDATE ON public.business_raw
+  FOR EACH ROW EXECUTE FUNCTION public.touch_business_raw_updated_at();
+
+-- Incremental snapshot refreshes filter on updated_at
+CREATE INDEX IF NOT EXISTS business_raw_updated_at_idx
+  ON public.business_raw (updated_at);
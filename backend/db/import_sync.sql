@@ -0,0 +1,32 @@
+-- Row hashes for `import_csv_to_supabase.py --sync`
+-- The importer diffs the CSV against businesses by business_id and only
+-- writes rows whose content changed. This function returns one md5 per row
+-- so the comparison doesn't have to download the table. The hash input must
+-- match row_hash() in the importer: the CONTENT_FIELDS joined with '|',
+-- NULLs as '', coordinates with six decimals. A float that rounds
+-- differently on either side only costs one redundant upsert.
+
+-- Upserts conflict on business_id (also created by publish_businesses.sql)
+CREATE UNIQUE INDEX IF NOT EXISTS businesses_business_id_key
+  ON public.businesses (business_id);
+
+CREATE OR REPLACE FUNCTION public.business_row_hashes(p_after bigint, p_limit integer)
+RETURNS TABLE (business_id bigint, row_hash text) AS $$
+  SELECT b.business_id::bigint,
+         md5(concat_ws('|',
+           coalesce(b.business_name, ''),
+           coalesce(b.general_category, ''),
+           coalesce(round(b.latitude::numeric, 6)::text, ''),
+           coalesce(round(b.longitude::numeric, 6)::text, ''),
+           coalesce(b.street, ''),
+           coalesce(b.zone_type, ''),
+           coalesce(b.status, '')
+         ))
+    FROM public.businesses b
+   WHERE b.business_id IS NOT NULL
+     AND (p_after IS NULL OR b.business_id > p_after)
+   ORDER BY b.business_id
+   LIMIT p_limit;
+$$ LANGUAGE sql STABLE SECURITY DEFINER SET search_path = public;
+
+NOTIFY pgrst, 'reload schema';
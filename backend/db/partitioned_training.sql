@@ -0,0 +1,15 @@
+-- Partition column for PARTITION_BY training
+-- With PARTITION_BY set, the ML service (backend/ml/partitioned.py) clusters
+-- each region or map tile separately. Every published row carries the
+-- partition it was clustered in, and cluster ids are
+-- partition index * 100 + cluster within the partition, so they stay
+-- unique across regions. Staging needs the column too, because the swap
+-- copies the columns the two tables share.
+
+ALTER TABLE public.businesses ADD COLUMN IF NOT EXISTS partition_key text;
+ALTER TABLE public.businesses_staging ADD COLUMN IF NOT EXISTS partition_key text;
+
+CREATE INDEX IF NOT EXISTS businesses_partition_key_idx
+  ON public.businesses (partition_key);
+
+NOTIFY pgrst, 'reload schema';
@@ -0,0 +1,66 @@
+-- Atomic publish of the enhanced businesses table
+-- The ML service (backend/ml/publish.py) writes each training run into
+-- businesses_staging in large batches, tagged with a run_id, and then calls
+-- swap_businesses_staging(run_id). The swap runs in a single transaction,
+-- so readers of businesses only ever see the previous or the new snapshot.
+
+-- Incremental training upserts changed rows keyed on business_id
+CREATE UNIQUE INDEX IF NOT EXISTS businesses_business_id_key
+  ON public.businesses (business_id);
+
+-- Staging table: same shape as businesses plus the run that produced the row
+CREATE TABLE IF NOT EXISTS public.businesses_staging
+  (LIKE public.businesses INCLUDING DEFAULTS INCLUDING IDENTITY);
+
+ALTER TABLE public.businesses_staging ADD COLUMN IF NOT EXISTS run_id text;
+ALTER TABLE public.businesses_staging ADD COLUMN IF NOT EXISTS staged_at timestamptz DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS businesses_staging_run_id_idx
+  ON public.businesses_staging (run_id);
+
+ALTER TABLE public.businesses_staging ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Service Role Full Access" ON public.businesses_staging;
+CREATE POLICY "Service Role Full Access" ON public.businesses_staging
+    FOR ALL
+    USING (auth.role() = 'service_role')
+    WITH CHECK (auth.role() = 'service_role');
+
+-- Swap a fully staged run into businesses
+CREATE OR REPLACE FUNCTION public.swap_businesses_staging(p_run_id text)
+RETURNS integer AS $$
+DECLARE
+  cols text;
+  published integer;
+BEGIN
+  -- Copy every businesses column (except id); staging is created LIKE
+  -- businesses and later migrations change both tables together
+  SELECT string_agg(quote_ident(c.column_name), ', ' ORDER BY c.ordinal_position)
+    INTO cols
+    FROM information_schema.columns c
+   WHERE c.table_schema = 'public'
+     AND c.table_name = 'businesses'
+     AND c.column_name <> 'id';
+
+  IF NOT EXISTS (SELECT 1 FROM public.businesses_staging WHERE run_id = p_run_id) THEN
+    RAISE EXCEPTION 'No staged rows for run %', p_run_id;
+  END IF;
+
+  DELETE FROM public.businesses WHERE true;
+
+  EXECUTE format(
+    'INSERT INTO public.businesses (%s) SELECT %s FROM public.businesses_staging WHERE run_id = $1',
+    cols, cols
+  ) USING p_run_id;
+  GET DIAGNOSTICS published = ROW_COUNT;
+
+  -- Drop this run and anything abandoned by earlier failed runs
+  DELETE FROM public.businesses_staging
+   WHERE run_id = p_run_id
+      OR staged_at < now() - interval '1 day';
+
+  RETURN published;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+NOTIFY pgrst, 'reload schema';
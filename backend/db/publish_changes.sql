@@ -0,0 +1,53 @@
+-- Change-only publish of the enhanced businesses table
+-- businesses is in the supabase_realtime publication
+-- (trigger_ml_training.sql), so swapping in a whole snapshot sends an event
+-- per row to every map client. With PUBLISH_DIFF=1 (the default) the ML
+-- service (backend/ml/publish.py) diffs its results against businesses,
+-- stages only new and changed rows under a run_id and calls
+-- merge_businesses_staging(run_id, deleted ids). The merge runs in a single
+-- transaction like the swap in publish_businesses.sql, which it relies on
+-- for the staging table and the unique business_id index.
+
+CREATE OR REPLACE FUNCTION public.merge_businesses_staging(p_run_id text, p_deleted bigint[])
+RETURNS integer AS $$
+DECLARE
+  cols text;
+  updates text;
+  published integer;
+BEGIN
+  -- Copy every businesses column that also exists in staging (except id)
+  SELECT string_agg(quote_ident(c.column_name), ', ' ORDER BY c.ordinal_position),
+         string_agg(format('%1$I = EXCLUDED.%1$I', c.column_name), ', ' ORDER BY c.ordinal_position)
+    INTO cols, updates
+    FROM information_schema.columns c
+   WHERE c.table_schema = 'public'
+     AND c.table_name = 'businesses'
+     AND c.column_name <> 'id'
+     AND EXISTS (
+       SELECT 1 FROM information_schema.columns s
+        WHERE s.table_schema = 'public'
+          AND s.table_name = 'businesses_staging'
+          AND s.column_name = c.column_name
+     );
+
+  EXECUTE format(
+    'INSERT INTO public.businesses (%s) SELECT %s FROM public.businesses_staging WHERE run_id = $1
+     ON CONFLICT (business_id) DO UPDATE SET %s',
+    cols, cols, updates
+  ) USING p_run_id;
+  GET DIAGNOSTICS published = ROW_COUNT;
+
+  -- Businesses that are gone, plus rows a full swap would also have dropped
+  DELETE FROM public.businesses
+   WHERE business_id = ANY(COALESCE(p_deleted, '{}'))
+      OR business_id IS NULL;
+
+  DELETE FROM public.businesses_staging
+   WHERE run_id = p_run_id
+      OR staged_at < now() - interval '1 day';
+
+  RETURN published;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+NOTIFY pgrst, 'reload schema';
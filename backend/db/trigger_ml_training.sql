@@ -31,3 +31,7 @@ ALTER PUBLICATION supabase_realtime ADD TABLE businesses;
 -- 3. Events: INSERT, UPDATE, DELETE
 -- 4. HTTP Request: POST to http://localhost:8000/train
 -- 5. This will automatically trigger ML training on any change
+--    The webhook body ({type, record, old_record}) is applied incrementally:
+--    changed rows are assigned to the existing clusters and a full re-cluster
+--    only runs once INCREMENTAL_MAX_CHANGE_RATIO / INCREMENTAL_DRIFT_FACTOR
+--    are crossed. POST /train with an empty body (or ?full=true) to force one.
@@ -1,28 +1,39 @@
 import os
+import sys
 from supabase import create_client, Client
 from dotenv import load_dotenv
 from collections import Counter
 
+# Shared business_raw snapshot (local Arrow cache) from the ML service
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml"))
+from snapshot_cache import load_snapshot
+from stats import fetch_stats
+
 load_dotenv(override=True)
 
 url = os.getenv("SUPABASE_URL")
 key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-print(f"Connecting to: {url}")
-supabase: Client = create_client(url, key)
-
 try:
-    print("Fetching categories and zones...")
-    response = supabase.table("business_raw").select("general_category, zone_type").execute()
-    
-    data = response.data
-    print(f"Total rows fetched: {len(data)}")
-    
-    categories = [row['general_category'] for row in data]
-    zones = [row['zone_type'] for row in data]
-    
-    unique_categories = set(categories)
-    unique_zones = set(zones)
+    # Counts kept by the ML service (as of its last training run); fall
+    # back to reading the snapshot when the service isn't running
+    stats = fetch_stats()
+    if stats is not None:
+        print(f"Stats from the ML service (generated {stats['generated_at']})")
+        print(f"Total rows: {stats['total']}")
+        unique_categories = set(stats["by_category"])
+        unique_zones = set(stats["by_zone"])
+        print("Category counts:", stats["by_category"])
+        print("Zone counts:", stats["by_zone"])
+    else:
+        print(f"Connecting to: {url}")
+        supabase: Client = create_client(url, key)
+        print("Fetching categories and zones...")
+        data = load_snapshot(supabase, columns=["general_category", "zone_type"])
+        print(f"Total rows fetched: {len(data)}")
+
+        unique_categories = set(data["general_category"].tolist())
+        unique_zones = set(data["zone_type"].tolist())
     
     print(f"\nUnique Categories Count: {len(unique_categories)}")
     print("Categories:", unique_categories)
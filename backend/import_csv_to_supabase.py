@@ -2,15 +2,33 @@
 """
 Import CSV data to Supabase businesses table.
 
-This script reads rawbusinessdata.csv and imports all businesses into Supabase.
-It handles category normalization and clears existing data before import.
+This script streams rawbusinessdata.csv into the businesses table. Rows
+are cleaned by ml/normalize.py (invalid ones go to <csv>.rejected.csv) and
+existing data is cleared before a fresh import. Batches are uploaded
+concurrently and retried with backoff; a checkpoint file records committed
+batches, so a failed run picks up where it stopped when started again.
+
+With --sync the table is not cleared: rows are matched by business_id and
+only new, edited and removed businesses are written.
 """
 
-import csv
+import argparse
+import hashlib
+import json
 import os
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import pandas as pd
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+# Shared record cleaning from the ML service
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "ml"))
+from normalize import normalize_businesses, write_quarantine
+from stats import fetch_stats
+
 # Load environment variables
 load_dotenv(override=True)
 
@@ -18,249 +36,506 @@ load_dotenv(override=True)
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
-    print("Error: SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env")
-    exit(1)
+# Upload tuning
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "500"))
+IMPORT_CONCURRENCY = int(os.getenv("IMPORT_CONCURRENCY", "4"))
+IMPORT_RETRIES = int(os.getenv("IMPORT_RETRIES", "3"))
+IMPORT_BACKOFF_SECONDS = float(os.getenv("IMPORT_BACKOFF_SECONDS", "0.5"))
+
+TARGET_TABLE = "businesses"
+# --sync: server-side row hashes (db/import_sync.sql) and their page size
+HASH_FUNCTION = "business_row_hashes"
+HASH_PAGE_SIZE = int(os.getenv("IMPORT_HASH_PAGE_SIZE", "1000"))
+# Columns compared by --sync; business_row_hashes() hashes the same ones
+CONTENT_FIELDS = [
+    "business_name", "general_category", "latitude", "longitude",
+    "street", "zone_type", "status",
+]
+LOG_FILE = "import_log.txt"
+
+# Rows parsed and cleaned at a time
+CSV_CHUNK_ROWS = int(os.getenv("IMPORT_CHUNK_ROWS", "50000"))
+CSV_DTYPES = {
+    "business_name": str,
+    "general_category": "category",
+    "street": "category",
+    "zone_type": "category",
+    "status": "category",
+}
+
+
+def quarantine_path(csv_file):
+    return csv_file + ".rejected.csv"
+
+
+def iter_batches(csv_file, batch_size, category_counts, rejected):
+    """
+    Stream (batch number, businesses) from the CSV.
+
+    The file is read CSV_CHUNK_ROWS rows at a time and each chunk is cleaned
+    column-wise by normalize_businesses(). Rejected rows are counted by
+    reason in `rejected` and written to quarantine_path(csv_file).
+    """
+    quarantine = quarantine_path(csv_file)
+    if os.path.exists(quarantine):
+        os.remove(quarantine)
+
+    seen = set()
+    pending = []
+    number = 0
+    chunks = pd.read_csv(
+        csv_file, dtype=CSV_DTYPES, chunksize=CSV_CHUNK_ROWS,
+        keep_default_na=False, na_values=[""],
+    )
+    for chunk in chunks:
+        clean, bad = normalize_businesses(chunk, seen=seen)
+        rejected.update(bad["reason"].tolist())
+        write_quarantine(bad, quarantine, append=True)
+        category_counts.update(clean["general_category"].value_counts().to_dict())
+
+        rows = clean[["business_id"] + CONTENT_FIELDS]
+        pending.extend(rows.astype(object).where(rows.notna(), None).to_dict(orient="records"))
+        while len(pending) >= batch_size:
+            yield number, pending[:batch_size]
+            number += 1
+            pending = pending[batch_size:]
+    if pending:
+        yield number, pending
 
-# Initialize Supabase client (using service role key to bypass RLS)
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
 
-def clear_existing_data():
+def log_rejected(log, csv_file, rejected):
+    if not rejected:
+        return
+    reasons = ", ".join(f"{reason}: {count}" for reason, count in rejected.most_common())
+    log(f"Skipped {sum(rejected.values())} invalid rows ({reasons}); see {quarantine_path(csv_file)}")
+
+
+# -----------------------------------------------------------------------------
+# Checkpoint
+# -----------------------------------------------------------------------------
+
+def checkpoint_path(csv_file):
+    return csv_file + ".import-checkpoint.json"
+
+
+def file_fingerprint(csv_file):
+    stat = os.stat(csv_file)
+    return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def load_checkpoint(csv_file, batch_size):
+    """Checkpoint of an unfinished import of this exact file, or None."""
+    path = checkpoint_path(csv_file)
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("fingerprint") != file_fingerprint(csv_file) or checkpoint.get("batch_size") != batch_size:
+        return None
+    return checkpoint
+
+
+def save_checkpoint(csv_file, checkpoint):
+    path = checkpoint_path(csv_file)
+    tmp = path + ".tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(checkpoint, f)
+    os.replace(tmp, path)
+
+
+def clear_checkpoint(csv_file):
+    try:
+        os.remove(checkpoint_path(csv_file))
+    except FileNotFoundError:
+        pass
+
+
+# -----------------------------------------------------------------------------
+# Import
+# -----------------------------------------------------------------------------
+
+def clear_existing_data(client, log):
     """Clear all existing data from businesses table."""
-    print("Clearing existing data from businesses table...")
+    log("Clearing existing data from businesses table...")
     try:
-        result = supabase.table("businesses").delete().neq("id", 0).execute()
-        print("Existing data cleared successfully")
+        client.table(TARGET_TABLE).delete().neq("id", 0).execute()
+        log("Existing data cleared successfully")
     except Exception as e:
-        print(f"Warning: Could not clear existing data: {e}")
-        print("   (Table might be empty, continuing...)")
+        log(f"Warning: Could not clear existing data: {e}")
+        log("   (Table might be empty, continuing...)")
 
-def normalize_category(category: str) -> str:
+
+def with_retries(fn, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+
+def upload_batches(batches, send, concurrency, on_done):
     """
-    Normalize category names to handle spelling variations.
+    Call send(batch) for every (key, batch) with at most `concurrency`
+    requests in flight, so memory stays flat for any file size.
+    on_done(key, rows) runs in the calling thread after each success. Stops
+    submitting after the first failure and returns its message (None if
+    everything went through).
     """
-    category = category.strip()
-    
-    # Handle "Merchandising / Trading" -> "Merchandise / Trading"
-    if "merchandising" in category.lower():
-        return "Merchandise / Trading"
-    
-    # Handle "Food and Beverages" -> "Food & Beverages"
-    if "food" in category.lower() and "beverage" in category.lower():
-        return "Food & Beverages"
-    
-    return category
-
-def import_csv_data(csv_file: str):
-    """Import businesses from CSV file to Supabase."""
-    print(f"Reading CSV file: {csv_file}")
-    
-    businesses = []
-    with open(csv_file, 'r', encoding='utf-8') as f:
-        reader = csv.DictReader(f)
-        first_row = True
-        for row in reader:
-            if first_row:
-                print("\nDEBUG: First row raw data:")
-                print(row)
-                first_row = False
-
-            # Normalize category
-            category = normalize_category(row['general_category'])
-            
-            # Build business object for 'businesses' table
-            # Note: 'id' is auto-generated, so we don't include it
-            business = {
-                'business_name': row['business_name'].strip(),
-                'general_category': category,
-                'latitude': float(row['latitude']),
-                'longitude': float(row['longitude']),
-                'street': row['street'].strip(),
-                'zone_type': row['zone_type'].strip(),
-                'status': row['status'].strip().lower(),  # normalize to lowercase
-            }
-            
-            if len(businesses) == 0:
-                print("\nDEBUG: First constructed business object:")
-                print(business)
-                
-            businesses.append(business)
-    
-    print(f"Found {len(businesses)} businesses to import")
-    
-    # Display category distribution
-    from collections import Counter
-    categories = [b['general_category'] for b in businesses]
-    category_counts = Counter(categories)
-    print("\nCategory Distribution:")
+    failure = None
+    in_flight = {}
+
+    def finish(done):
+        nonlocal failure
+        for future in done:
+            key, rows = in_flight.pop(future)
+            try:
+                future.result()
+                on_done(key, rows)
+            except Exception as e:
+                failure = failure or f"batch {key}: {e}"
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        for key, batch in batches:
+            if failure:
+                break
+            in_flight[pool.submit(send, batch)] = (key, len(batch))
+            if len(in_flight) >= max(1, concurrency):
+                finish(wait(in_flight, return_when=FIRST_COMPLETED).done)
+        while in_flight:
+            finish(wait(in_flight, return_when=FIRST_COMPLETED).done)
+    return failure
+
+
+def log_category_distribution(log, category_counts):
+    log("\nCategory Distribution:")
     for cat, count in sorted(category_counts.items(), key=lambda x: -x[1]):
-        print(f"   {cat}: {count}")
-    print()
-    
-    # Import in batches (Supabase has limits)
-    BATCH_SIZE = 100
-    total_imported = 0
-    
-    for i in range(0, len(businesses), BATCH_SIZE):
-        batch = businesses[i:i + BATCH_SIZE]
-        print(f"Importing batch {i//BATCH_SIZE + 1} ({len(batch)} businesses)...")
-        
-        try:
-            result = supabase.table("businesses").insert(batch).execute()
-            total_imported += len(batch)
-            print(f"   Batch imported successfully")
-        except Exception as e:
-            print(f"   Error importing batch: {e}")
-            raise
-    
-    print(f"\nImport complete! Total businesses imported: {total_imported}")
-    return total_imported
+        log(f"   {cat}: {count}")
+
+
+def import_csv_data(client, csv_file, log, batch_size=IMPORT_BATCH_SIZE,
+                    concurrency=IMPORT_CONCURRENCY, retries=IMPORT_RETRIES,
+                    backoff=IMPORT_BACKOFF_SECONDS, restart=False):
+    """
+    Stream the CSV into businesses.
+
+    At most `concurrency` batches are in flight; each is retried with
+    exponential backoff. Finished batch numbers go to the checkpoint after
+    every completion, and a rerun of the same file skips them instead of
+    clearing the table. Returns (rows imported, category counts).
+    """
+    checkpoint = None if restart else load_checkpoint(csv_file, batch_size)
+    if checkpoint is None:
+        clear_existing_data(client, log)
+        checkpoint = {
+            "fingerprint": file_fingerprint(csv_file),
+            "batch_size": batch_size,
+            "committed_through": 0,
+            "completed_after": [],
+            "rows_imported": 0,
+        }
+        save_checkpoint(csv_file, checkpoint)
+    else:
+        log(f"Resuming import: {checkpoint['rows_imported']} rows already committed")
+    completed = set(range(checkpoint["committed_through"])) | set(checkpoint["completed_after"])
+
+    log(f"Reading CSV file: {csv_file}")
+    category_counts = Counter()
+    rejected = Counter()
+    started = time.perf_counter()
+    uploaded = 0
+
+    def record(number, rows):
+        nonlocal uploaded
+        completed.add(number)
+        uploaded += rows
+        # Batches finish out of order: store the contiguous prefix plus stragglers
+        through = checkpoint["committed_through"]
+        while through in completed:
+            through += 1
+        checkpoint["committed_through"] = through
+        checkpoint["completed_after"] = sorted(n for n in completed if n > through)
+        checkpoint["rows_imported"] += rows
+        save_checkpoint(csv_file, checkpoint)
+        rate = uploaded / max(time.perf_counter() - started, 1e-9)
+        log(f"   Batch {number + 1} imported ({checkpoint['rows_imported']} rows, {rate:.0f} rows/s)")
+
+    def send(batch):
+        return with_retries(
+            lambda: client.table(TARGET_TABLE).insert(batch).execute(), retries, backoff
+        )
+
+    pending = (
+        (number, batch)
+        for number, batch in iter_batches(csv_file, batch_size, category_counts, rejected)
+        if number not in completed
+    )
+    failure = upload_batches(pending, send, concurrency, record)
+
+    elapsed = time.perf_counter() - started
+    if failure:
+        raise RuntimeError(
+            f"{failure} (progress saved to {checkpoint_path(csv_file)}; run again to resume)"
+        )
+
+    clear_checkpoint(csv_file)
+    log_rejected(log, csv_file, rejected)
+    log(f"\nUploaded {uploaded} rows in {elapsed:.1f}s ({uploaded / max(elapsed, 1e-9):.0f} rows/s)")
+    log_category_distribution(log, category_counts)
+    log(f"\nImport complete! Total businesses imported: {checkpoint['rows_imported']}")
+    return checkpoint["rows_imported"], category_counts
 
-def verify_import():
+
+# -----------------------------------------------------------------------------
+# Delta sync
+# -----------------------------------------------------------------------------
+
+def row_hash(business):
+    """md5 of the content columns, formatted exactly like business_row_hashes()."""
+    parts = []
+    for field in CONTENT_FIELDS:
+        value = business.get(field)
+        if value is None:
+            parts.append("")
+        elif field in ("latitude", "longitude"):
+            parts.append(f"{float(value):.6f}")
+        else:
+            parts.append(str(value))
+    return hashlib.md5("|".join(parts).encode("utf-8")).hexdigest()
+
+
+def fetch_current_hashes(client, log, page_size=HASH_PAGE_SIZE):
+    """
+    {business_id: row hash} for the current table, keyset-paginated.
+
+    Uses the business_row_hashes() function so only ids and hashes cross the
+    wire; without it the content columns are fetched and hashed here.
+    """
+    hashes = {}
+    last_id = None
+    use_rpc = True
+    while True:
+        if use_rpc:
+            try:
+                rows = client.rpc(
+                    HASH_FUNCTION, {"p_after": last_id, "p_limit": page_size}
+                ).execute().data or []
+            except Exception as e:
+                log(f"   {HASH_FUNCTION}() unavailable ({e}); hashing rows locally")
+                use_rpc = False
+                continue
+        else:
+            # NULL business_ids never satisfy the comparison, so they're skipped
+            query = (
+                client.table(TARGET_TABLE)
+                .select(", ".join(["business_id"] + CONTENT_FIELDS))
+                .order("business_id")
+                .gt("business_id", -1 if last_id is None else last_id)
+                .limit(page_size)
+            )
+            rows = [
+                {"business_id": r["business_id"], "row_hash": row_hash(r)}
+                for r in query.execute().data or []
+            ]
+        if not rows:
+            return hashes
+        for row in rows:
+            hashes[row["business_id"]] = row["row_hash"]
+        last_id = rows[-1]["business_id"]
+
+
+def sync_csv_data(client, csv_file, log, batch_size=IMPORT_BATCH_SIZE,
+                  concurrency=IMPORT_CONCURRENCY, retries=IMPORT_RETRIES,
+                  backoff=IMPORT_BACKOFF_SECONDS):
+    """
+    Make businesses match the CSV by writing only what changed.
+
+    Row hashes of the current table are diffed against the CSV keyed on
+    business_id: new and edited rows are upserted in batches, rows missing
+    from the CSV are deleted. Nothing else is written, so a rerun after a
+    failure simply picks up the remaining differences. Returns
+    (CSV rows, category counts, stats).
+    """
+    log("Fetching current row hashes...")
+    current = fetch_current_hashes(client, log)
+    log(f"   {len(current)} rows in {TARGET_TABLE}")
+
+    # Rows from imports that predate sync have no business_id to match on
+    try:
+        orphans = client.table(TARGET_TABLE).delete().is_("business_id", "null").execute().data or []
+        if orphans:
+            log(f"   Removed {len(orphans)} rows without a business_id")
+    except Exception as e:
+        log(f"Warning: could not remove rows without a business_id: {e}")
+
+    log(f"Reading CSV file: {csv_file}")
+    category_counts = Counter()
+    rejected = Counter()
+    stats = {"inserted": 0, "updated": 0, "deleted": 0, "unchanged": 0, "requests": 0}
+    seen = set()
+    started = time.perf_counter()
+
+    def changed_batches():
+        batch = []
+        number = 0
+        for _, rows in iter_batches(csv_file, batch_size, category_counts, rejected):
+            for business in rows:
+                business_id = business["business_id"]
+                seen.add(business_id)
+                previous = current.get(business_id)
+                if previous == row_hash(business):
+                    stats["unchanged"] += 1
+                    continue
+                stats["inserted" if previous is None else "updated"] += 1
+                batch.append(business)
+                if len(batch) == batch_size:
+                    number += 1
+                    yield number, batch
+                    batch = []
+        if batch:
+            yield number + 1, batch
+
+    def upsert(batch):
+        return with_retries(
+            lambda: client.table(TARGET_TABLE).upsert(batch, on_conflict="business_id").execute(),
+            retries,
+            backoff,
+        )
+
+    def counted(key, rows):
+        stats["requests"] += 1
+
+    failure = upload_batches(changed_batches(), upsert, concurrency, counted)
+    if failure:
+        raise RuntimeError(f"{failure} (run again to sync the remaining rows)")
+
+    gone = sorted(set(current) - seen)
+
+    def delete(ids):
+        return with_retries(
+            lambda: client.table(TARGET_TABLE).delete().in_("business_id", ids).execute(),
+            retries,
+            backoff,
+        )
+
+    def deleted(key, rows):
+        stats["deleted"] += rows
+        stats["requests"] += 1
+
+    id_batches = ((i, gone[i:i + batch_size]) for i in range(0, len(gone), batch_size))
+    failure = upload_batches(id_batches, delete, concurrency, deleted)
+    if failure:
+        raise RuntimeError(f"{failure} (run again to sync the remaining rows)")
+
+    elapsed = time.perf_counter() - started
+    log_rejected(log, csv_file, rejected)
+    log(f"\nSync complete in {elapsed:.1f}s: {stats['inserted']} inserted, "
+        f"{stats['updated']} updated, {stats['deleted']} deleted, "
+        f"{stats['unchanged']} unchanged ({stats['requests']} write requests)")
+    log_category_distribution(log, category_counts)
+    return len(seen), category_counts, stats
+
+
+def verify_import(client, log, expected_rows, category_counts):
     """Verify the import was successful."""
-    print("\nVerifying import...")
-    
+    log("\nVerifying import...")
+
     try:
         # Count total businesses
-        result = supabase.table("businesses").select("*", count="exact").execute()
+        result = client.table(TARGET_TABLE).select("id", count="exact").limit(1).execute()
         total_count = result.count
-        print(f"Total businesses in database: {total_count}")
-        
-        # Get category distribution
-        all_data = supabase.table("businesses").select("general_category").execute()
-        from collections import Counter
-        categories = [row['general_category'] for row in all_data.data]
-        category_counts = Counter(categories)
-        
-        print(f"Unique categories: {len(category_counts)}")
-        print("\nCategory counts in database:")
-        for cat, count in sorted(category_counts.items(), key=lambda x: -x[1]):
-            print(f"   {cat}: {count}")
-        
-        return total_count == 100
+        log(f"Total businesses in database: {total_count}")
+
+        log(f"Unique categories: {len(category_counts)}")
+        # The ML service's /stats counts are only current once it has
+        # retrained on this import, i.e. when its total matches
+        stats = fetch_stats()
+        if stats is not None and stats["total"] == total_count:
+            log("\nCategory counts in database (ML service stats):")
+            for cat in sorted(category_counts, key=lambda c: -category_counts[c]):
+                log(f"   {cat}: {stats['by_category'].get(cat, 0)}")
+            return total_count == expected_rows
+
+        # Otherwise one counted query per category seen in the CSV
+        log("\nCategory counts in database:")
+        for cat in sorted(category_counts, key=lambda c: -category_counts[c]):
+            result = (
+                client.table(TARGET_TABLE)
+                .select("id", count="exact")
+                .eq("general_category", cat)
+                .limit(1)
+                .execute()
+            )
+            log(f"   {cat}: {result.count}")
+
+        return total_count == expected_rows
     except Exception as e:
-        print(f"Verification error: {e}")
+        log(f"Verification error: {e}")
         return False
 
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Import a business CSV into Supabase.")
+    parser.add_argument("csv_file", nargs="?", default="rawbusinessdata.csv")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    parser.add_argument("--concurrency", type=int, default=IMPORT_CONCURRENCY)
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore any checkpoint and import from scratch")
+    parser.add_argument("--sync", action="store_true",
+                        help="upsert/delete only the rows that differ, matched by business_id")
+    return parser.parse_args()
+
+
 def main():
     """Main import process."""
-    with open("import_log.txt", "w", encoding="utf-8") as log_file:
+    args = parse_args()
+
+    with open(LOG_FILE, "w", encoding="utf-8") as log_file:
         def log(msg):
             print(msg)
             try:
                 log_file.write(msg + "\n")
-            except:
+                log_file.flush()
+            except OSError:
                 pass
 
         log("=" * 70)
         log("CSV TO SUPABASE IMPORT SCRIPT")
         log("=" * 70)
         log("")
-        
-        csv_file = "rawbusinessdata.csv"
-        
-        if not os.path.exists(csv_file):
-            log(f"Error: CSV file not found: {csv_file}")
-            exit(1)
-        
+
+        if not SUPABASE_URL or not SUPABASE_SERVICE_ROLE_KEY:
+            log("Error: SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set in .env")
+            sys.exit(1)
+
+        if not os.path.exists(args.csv_file):
+            log(f"Error: CSV file not found: {args.csv_file}")
+            sys.exit(1)
+
+        # Initialize Supabase client (using service role key to bypass RLS)
+        client: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
+
         try:
-            # Step 1: Clear existing data
-            log("Clearing existing data from businesses table...")
-            try:
-                result = supabase.table("businesses").delete().neq("id", 0).execute()
-                log("Existing data cleared successfully")
-            except Exception as e:
-                log(f"Warning: Could not clear existing data: {e}")
-                log("   (Table might be empty, continuing...)")
-            log("")
-            
-            # Step 2: Import CSV data
-            # Inline import_csv_data logic to use the log function
-            log(f"Reading CSV file: {csv_file}")
-            
-            businesses = []
-            with open(csv_file, 'r', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                first_row = True
-                for row in reader:
-                    if first_row:
-                        print("\nDEBUG: First row raw data:")
-                        print(row)
-                        first_row = False
-        
-                    # Normalize category
-                    category = normalize_category(row['general_category'])
-                    
-                    # Build business object for 'businesses' table
-                    # Note: 'id' is auto-generated, so we don't include it
-                    business = {
-                        'business_name': row['business_name'].strip(),
-                        'general_category': category,
-                        'latitude': float(row['latitude']),
-                        'longitude': float(row['longitude']),
-                        'street': row['street'].strip(),
-                        'zone_type': row['zone_type'].strip(),
-                        'status': row['status'].strip().lower(),  # normalize to lowercase
-                    }
-                    
-                    if len(businesses) == 0:
-                        print("\nDEBUG: First constructed business object:")
-                        print(business)
-                        
-                    businesses.append(business)
-            
-            log(f"Found {len(businesses)} businesses to import")
-            
-            # Display category distribution
-            from collections import Counter
-            categories = [b['general_category'] for b in businesses]
-            category_counts = Counter(categories)
-            log("\nCategory Distribution:")
-            for cat, count in sorted(category_counts.items(), key=lambda x: -x[1]):
-                log(f"   {cat}: {count}")
-            log("")
-            
-            # Import in batches (Supabase has limits)
-            BATCH_SIZE = 100
-            total_imported = 0
-            
-            for i in range(0, len(businesses), BATCH_SIZE):
-                batch = businesses[i:i + BATCH_SIZE]
-                log(f"Importing batch {i//BATCH_SIZE + 1} ({len(batch)} businesses)...")
-                
-                try:
-                    result = supabase.table("businesses").insert(batch).execute()
-                    total_imported += len(batch)
-                    log(f"   Batch imported successfully")
-                except Exception as e:
-                    log(f"   Error importing batch: {e}")
-                    raise
-            
-            log(f"\nImport complete! Total businesses imported: {total_imported}")
-            
-            # Step 3: Verify import
-            log("\nVerifying import...")
-            try:
-                # Count total businesses
-                result = supabase.table("businesses").select("*", count="exact").execute()
-                total_count = result.count
-                log(f"Total businesses in database: {total_count}")
-                
-                # Get category distribution
-                all_data = supabase.table("businesses").select("general_category").execute()
-                categories = [row['general_category'] for row in all_data.data]
-                category_counts = Counter(categories)
-                
-                log(f"Unique categories: {len(category_counts)}")
-                log("\nCategory counts in database:")
-                for cat, count in sorted(category_counts.items(), key=lambda x: -x[1]):
-                    log(f"   {cat}: {count}")
-                
-                verified = total_count == 100
-            except Exception as e:
-                log(f"Verification error: {e}")
-                verified = False
-            
+            if args.sync:
+                imported, category_counts, _ = sync_csv_data(
+                    client,
+                    args.csv_file,
+                    log,
+                    batch_size=args.batch_size,
+                    concurrency=args.concurrency,
+                )
+            else:
+                imported, category_counts = import_csv_data(
+                    client,
+                    args.csv_file,
+                    log,
+                    batch_size=args.batch_size,
+                    concurrency=args.concurrency,
+                    restart=args.restart,
+                )
+            verified = verify_import(client, log, imported, category_counts)
+
             log("")
             log("=" * 70)
             if verified:
@@ -268,13 +543,13 @@ def main():
             else:
                 log("IMPORT COMPLETED WITH WARNINGS")
             log("=" * 70)
-            
+
         except Exception as e:
             log("")
             log("=" * 70)
             log(f"IMPORT FAILED: {e}")
             log("=" * 70)
-            exit(1)
+            sys.exit(1)
 
 if __name__ == "__main__":
     main()
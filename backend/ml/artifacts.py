@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+
+# joblib and pandas are imported where they are used: jobs.py, stats.py and
+# the service's startup only need ARTIFACT_DIR
+
+ARTIFACT_DIR = os.getenv(
+    "ML_ARTIFACT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "artifacts")
+)
+LATEST_POINTER = "latest.json"
+# Model artifacts kept on disk (newest first); older ones are deleted
+ARTIFACT_KEEP = max(1, int(os.getenv("ML_ARTIFACT_KEEP", "3")))
+
+
+def snapshot_hash(df):
+    """Content hash of a business_raw snapshot, independent of row order."""
+    import pandas as pd
+
+    ordered = df.sort_values("business_id").reset_index(drop=True)
+    ordered = ordered[sorted(ordered.columns)]
+    row_hashes = pd.util.hash_pandas_object(ordered, index=False).to_numpy()
+    digest = hashlib.sha256(",".join(ordered.columns).encode("utf-8"))
+    digest.update(row_hashes.tobytes())
+    return digest.hexdigest()
+
+
+def save_artifact(state, artifact_dir=None):
+    """
+    Persist a ModelState and point latest.json at it. States edited by
+    incremental runs have no snapshot hash and get a random name.
+    """
+    import joblib
+
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    os.makedirs(artifact_dir, exist_ok=True)
+
+    name = f"model-{(state.snapshot_hash or uuid.uuid4().hex)[:16]}.joblib"
+    path = os.path.join(artifact_dir, name)
+    # Dump next to the target and rename, so a forced retrain with the same
+    # hash never leaves latest.json pointing at a half-written file
+    tmp = path + ".tmp"
+    joblib.dump({
+        "encoder": state.encoder,
+        "kmeans": state.kmeans,
+        "optimal_k": state.optimal_k,
+        "centroids": state.kmeans.cluster_centers_,
+        "snapshot_hash": state.snapshot_hash,
+        "snapshot": state.snapshot,
+        "fit_rows": state.fit_rows,
+        "baseline_distance": state.baseline_distance,
+        "zone_categories": state.zone_categories,
+        "feature_weights": state.feature_weights,
+        "changed_since_fit": state.changed_since_fit,
+    }, tmp)
+    os.replace(tmp, path)
+
+    # Write the pointer last (atomically) so a crash never leaves it dangling
+    pointer = os.path.join(artifact_dir, LATEST_POINTER)
+    tmp = pointer + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({
+            "artifact": name,
+            "snapshot_hash": state.snapshot_hash,
+            "optimal_k": state.optimal_k,
+            "saved_at": datetime.utcnow().isoformat() + "Z",
+        }, f)
+    os.replace(tmp, pointer)
+    prune_artifacts(artifact_dir, keep=name)
+    return path
+
+
+def prune_artifacts(artifact_dir=None, keep=None, count=ARTIFACT_KEEP):
+    """Delete all but the newest `count` model artifacts (never `keep`)."""
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    names = [
+        name for name in os.listdir(artifact_dir)
+        if name.startswith("model-") and name.endswith(".joblib") and name != keep
+    ]
+    names.sort(key=lambda name: os.path.getmtime(os.path.join(artifact_dir, name)), reverse=True)
+    for name in names[max(0, count - (keep is not None)):]:
+        try:
+            os.remove(os.path.join(artifact_dir, name))
+        except OSError:
+            pass
+
+
+def load_latest_artifact(artifact_dir=None):
+    """Load the artifact latest.json points at, or None if there isn't one."""
+    artifact_dir = artifact_dir or ARTIFACT_DIR
+    pointer = os.path.join(artifact_dir, LATEST_POINTER)
+    if not os.path.exists(pointer):
+        return None
+
+    with open(pointer, "r", encoding="utf-8") as f:
+        latest = json.load(f)
+
+    path = os.path.join(artifact_dir, latest["artifact"])
+    if not os.path.exists(path):
+        return None
+    import joblib
+
+    return joblib.load(path)
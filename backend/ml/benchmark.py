@@ -0,0 +1,201 @@
+"""
+Benchmark train_model on synthetic data.
+
+Runs the full training pipeline against an in-process stand-in for
+Supabase (fake_supabase.FakeSupabase) at several table sizes and records
+wall time and peak traced memory per stage. Results are written as JSON
+so runs on different commits can be compared:
+
+    python benchmark.py --sizes 1000,10000,100000,1000000
+    python benchmark.py --sizes 1000,10000 --compare benchmark_results/<old>.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# Artifacts and inertia caches go to a scratch directory, never the real one
+SCRATCH_DIR = tempfile.mkdtemp(prefix="ml-benchmark-")
+os.environ["ML_ARTIFACT_DIR"] = SCRATCH_DIR
+# Measure the HTTP fetch path; the stand-in has no updated_at column
+os.environ["SNAPSHOT_CACHE"] = "0"
+
+import kselect  # noqa: E402
+from fake_supabase import FakeSupabase  # noqa: E402
+from metrics import peak_rss_mb  # noqa: E402
+from model_state import set_state  # noqa: E402
+from synthetic_data import generate_businesses  # noqa: E402
+from train import ignore_stage, train_model  # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000, 1000000]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_results")
+
+# A stage this much slower than in the --compare run is reported as a regression
+REGRESSION_RATIO = 1.25
+
+
+class TracedPeaks:
+    """
+    on_stage callback that tracks each stage's peak traced memory. Stage
+    times, rows and RSS come from train_model's result["stages"].
+    """
+
+    def __init__(self):
+        self.peaks = {}
+        self.current = None
+
+    def __call__(self, name):
+        self.close()
+        self.current = name
+        tracemalloc.reset_peak()
+
+    def close(self):
+        if self.current is None:
+            return
+        self.peaks[self.current] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        self.current = None
+
+
+def reset_training_state():
+    """Make every run a cold full retrain."""
+    set_state(None)
+    kselect._curve_cache.clear()
+    for name in os.listdir(SCRATCH_DIR):
+        path = os.path.join(SCRATCH_DIR, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+def run_once(rows, seed, trace_memory):
+    client = FakeSupabase({"business_raw": generate_businesses(rows, seed=seed)})
+    reset_training_state()
+
+    peaks = TracedPeaks() if trace_memory else None
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = train_model(force=True, on_stage=peaks or ignore_stage, client=client)
+    finally:
+        if trace_memory:
+            peaks.close()
+            tracemalloc.stop()
+    total = time.perf_counter() - started
+
+    stages = result.get("stages", {})
+    for name, peak in (peaks.peaks if peaks else {}).items():
+        if name in stages:
+            stages[name]["peak_mb"] = peak
+
+    return {
+        "rows": rows,
+        "status": result["status"],
+        "optimal_k": result.get("optimal_k"),
+        "total_seconds": round(total, 4),
+        "stages": stages,
+        "requests": client.request_counts(),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL,
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current, previous_path):
+    """Print per-stage time ratios against an earlier results file."""
+    with open(previous_path, "r", encoding="utf-8") as f:
+        earlier = json.load(f)
+    previous = {r["rows"]: r for r in earlier["results"]}
+
+    regressions = 0
+    print(f"\nCompared with {previous_path} (commit {earlier.get('commit')}):")
+    if earlier.get("trace_memory") != current.get("trace_memory"):
+        print("  note: memory tracing differs between the runs; timings are not comparable")
+    for result in current["results"]:
+        before = previous.get(result["rows"])
+        if before is None:
+            continue
+        pairs = [("total", before["total_seconds"], result["total_seconds"])]
+        pairs += [
+            (name, before["stages"][name]["seconds"], stage["seconds"])
+            for name, stage in result["stages"].items()
+            if name in before["stages"]
+        ]
+        for name, old, new in pairs:
+            ratio = new / old if old > 0 else float("inf")
+            flag = ""
+            if ratio > REGRESSION_RATIO and new - old > 0.01:
+                flag = "  <-- regression"
+                regressions += 1
+            print(f"  {result['rows']:>9} {name:<10} {old:>9.3f}s -> {new:>9.3f}s  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", default=",".join(str(s) for s in DEFAULT_SIZES),
+                        help="comma-separated row counts")
+    parser.add_argument("--repeat", type=int, default=1, help="runs per size (fastest kept)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc (it slows Python-heavy stages)")
+    parser.add_argument("--output", help="results file (default: benchmark_results/<commit>-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    commit = git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "trace_memory": not args.no_memory,
+        "results": [],
+    }
+
+    try:
+        for rows in sizes:
+            runs = [run_once(rows, args.seed, not args.no_memory) for _ in range(max(1, args.repeat))]
+            best = min(runs, key=lambda r: r["total_seconds"])
+            report["results"].append(best)
+            stages = ", ".join(f"{k} {v['seconds']:.2f}s" for k, v in best["stages"].items())
+            print(f"{rows:>9} rows: {best['total_seconds']:.2f}s (k={best['optimal_k']}) [{stages}]")
+    finally:
+        shutil.rmtree(SCRATCH_DIR, ignore_errors=True)
+
+    output = args.output
+    if output is None:
+        stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+        output = os.path.join(RESULTS_DIR, f"{commit or 'nocommit'}-{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"Saved {output}")
+
+    if args.compare:
+        regressions = compare(report, args.compare)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Cluster-level training output, one row per cluster.
+
+A cluster's center, population, category shares and mean distance /
+radius densities used to be copied onto every business row of the
+cluster (category_distribution and cluster_center). They are now computed
+once per cluster, published to the business_clusters table and served by
+/clusters; business rows keep only their cluster id and numeric features.
+The latest summaries are also kept in memory and in
+ARTIFACT_DIR/clusters.json like the stats. main.py imports this module at
+startup, so numpy/pandas are only imported by the functions that need them.
+"""
+from datetime import datetime
+
+from stats import JsonSnapshotStore
+
+CLUSTERS_FILE = "clusters.json"
+
+
+def cluster_centers(kmeans, weights=None, offset=0):
+    """{cluster id: (latitude, longitude)} of a fitted model's centroids."""
+    from features import center_coordinates
+
+    coords = center_coordinates(kmeans.cluster_centers_, weights)
+    return {offset + i: (float(lat), float(lng)) for i, (lat, lng) in enumerate(coords)}
+
+
+def cluster_summaries(df_active, centers):
+    """
+    One record per cluster of df_active (clustered active rows with their
+    distance and radius density columns). `centers` maps cluster id to
+    (latitude, longitude), see cluster_centers().
+    """
+    import numpy as np
+    import pandas as pd
+
+    from features import DENSITY_COLUMNS
+
+    if len(df_active) == 0:
+        return []
+    labels = df_active["cluster"].astype(int).to_numpy()
+    ids, codes, population = np.unique(labels, return_inverse=True, return_counts=True)
+
+    summary = pd.DataFrame({
+        "cluster_id": ids,
+        "center_latitude": [centers[c][0] for c in ids],
+        "center_longitude": [centers[c][1] for c in ids],
+        "population": population,
+    })
+    # Categorical columns report unseen categories as 0 shares; drop them
+    shares = (
+        df_active["general_category"].astype(object)
+        .groupby(labels).value_counts(normalize=True)
+    )
+    shares = shares[shares > 0]
+    summary["category_distribution"] = [
+        {str(category): float(share) for category, share in shares.xs(c, level=0).items()}
+        for c in ids
+    ]
+    for column in ["distance_to_center", *DENSITY_COLUMNS]:
+        if column in df_active.columns:
+            values = pd.to_numeric(df_active[column], errors="coerce").to_numpy(dtype=float)
+            summary[f"mean_{column}"] = pd.Series(values).groupby(codes).mean().to_numpy()
+    if "partition_key" in df_active.columns:
+        first = np.unique(codes, return_index=True)[1]
+        summary["partition_key"] = df_active["partition_key"].astype(object).to_numpy()[first]
+
+    records = summary.to_dict(orient="records")
+    for record in records:
+        for key, value in record.items():
+            if isinstance(value, np.generic):
+                record[key] = value.item()
+            if isinstance(record[key], float) and np.isnan(record[key]):
+                record[key] = None
+    return records
+
+
+def carry_summaries(records, previous, keep):
+    """
+    records plus the previous records whose cluster id passes keep(id) and
+    was not recomputed (for runs that only refit some clusters).
+    """
+    fresh = {record["cluster_id"] for record in records}
+    carried = [
+        record for record in (previous or [])
+        if keep(int(record["cluster_id"])) and record["cluster_id"] not in fresh
+    ]
+    return sorted(records + carried, key=lambda record: record["cluster_id"])
+
+
+_store = JsonSnapshotStore(CLUSTERS_FILE, "cluster summaries")
+
+
+def save_clusters(records, snapshot_hash=None, artifact_dir=None):
+    """Make `records` the current summaries and write them to clusters.json."""
+    return _store.save({
+        "clusters": records,
+        "snapshot_hash": snapshot_hash,
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+    }, artifact_dir)
+
+
+def get_clusters(artifact_dir=None):
+    """Current summaries as a StatsSnapshot (read from disk on first use), or None."""
+    return _store.get(artifact_dir)
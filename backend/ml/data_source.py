@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+RAW_COLUMNS = "business_id, business_name, general_category, latitude, longitude, street, zone_type, status"
+
+# Rows per request; keep at or below PostgREST's max-rows (1000 by default)
+FETCH_PAGE_SIZE = int(os.getenv("FETCH_PAGE_SIZE", "1000"))
+
+# Low-cardinality text columns stored as pandas categoricals
+CATEGORICAL_COLUMNS = ["general_category", "zone_type", "street", "status"]
+COLUMN_DTYPES = {
+    "business_id": "int64",
+    "latitude": "float64",
+    "longitude": "float64",
+}
+
+
+def iter_business_raw_pages(client, columns=RAW_COLUMNS, page_size=FETCH_PAGE_SIZE,
+                            table="business_raw", since=None):
+    """
+    Yield business_raw rows page by page, keyset-paginated on business_id.
+
+    Stops only on an empty page, so a server-side max-rows cap smaller than
+    page_size shortens pages instead of silently truncating the result.
+    With `since`, only rows whose updated_at is at or after it are returned.
+    """
+    last_id = None
+    while True:
+        query = client.table(table).select(columns).order("business_id").limit(page_size)
+        if since is not None:
+            query = query.gte("updated_at", since)
+        if last_id is not None:
+            query = query.gt("business_id", last_id)
+        rows = query.execute().data or []
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1]["business_id"]
+
+
+def typed_frame(rows, columns=RAW_COLUMNS):
+    """Build one compact DataFrame chunk from a page of JSON rows."""
+    fields = [c.strip() for c in columns.split(",")]
+    frame = pd.DataFrame.from_records(rows, columns=fields)
+    for column in fields:
+        if column in COLUMN_DTYPES:
+            frame[column] = frame[column].astype(COLUMN_DTYPES[column])
+        elif column in CATEGORICAL_COLUMNS:
+            frame[column] = frame[column].astype("category")
+    return frame
+
+
+def concat_typed(frames):
+    """Concatenate typed chunks, merging categoricals instead of widening to object."""
+    if not frames:
+        return None
+    if len(frames) == 1:
+        return frames[0].reset_index(drop=True)
+
+    categorical = [c for c in frames[0].columns if isinstance(frames[0][c].dtype, pd.CategoricalDtype)]
+    plain = [c for c in frames[0].columns if c not in categorical]
+
+    df = pd.concat([f[plain] for f in frames], ignore_index=True)
+    for column in categorical:
+        df[column] = union_categoricals([f[column] for f in frames])
+    return df[list(frames[0].columns)]
+
+
+def load_business_raw(client, columns=RAW_COLUMNS, page_size=FETCH_PAGE_SIZE):
+    """
+    Fetch every business_raw row into a compact DataFrame (None if empty).
+
+    Each page is converted to typed columns as soon as it arrives, so the
+    JSON for only one page is alive at a time.
+    """
+    frames = [
+        typed_frame(page, columns)
+        for page in iter_business_raw_pages(client, columns, page_size)
+    ]
+    return concat_typed(frames)
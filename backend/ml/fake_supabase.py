@@ -0,0 +1,300 @@
+"""
+In-process stand-in for the supabase-py table client, for benchmarks.
+
+Supports the subset of the query builder the ML service uses (select,
+insert, upsert, delete, eq/neq/gt/gte/is_/in_ filters, order, limit, rpc) over
+in-memory tables, and counts requests per table and operation so the cost
+of round trips shows up next to the timings.
+"""
+from collections import Counter
+
+import pandas as pd
+
+
+class FakeResponse:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeTable:
+    """
+    Rows as a list of dicts, with DataFrame views cached for reads. Tables
+    seeded from a DataFrame only build the dicts once something writes.
+    """
+
+    def __init__(self, rows=None):
+        self._rows = list(rows or [])
+        self._frames = {}
+        self._last_id = max((r.get("id") or 0 for r in self._rows), default=0)
+
+    def add(self, row):
+        """Append a row, filling the identity column like Postgres would."""
+        row = dict(row)
+        if row.get("id") is None:
+            self._last_id += 1
+            row["id"] = self._last_id
+        self.rows.append(row)
+
+    @classmethod
+    def from_frame(cls, df):
+        table = cls()
+        table._rows = None
+        table._frames[None] = df.reset_index(drop=True)
+        return table
+
+    @property
+    def rows(self):
+        if self._rows is None:
+            self._rows = self._frames[None].to_dict(orient="records")
+            self._last_id = max((r.get("id") or 0 for r in self._rows), default=0)
+        return self._rows
+
+    @rows.setter
+    def rows(self, rows):
+        self._rows = rows
+
+    def changed(self):
+        self._frames = {}
+
+    def frame(self, order=None):
+        if order not in self._frames:
+            base = self._frames.get(None)
+            if base is None:
+                base = pd.DataFrame.from_records(self._rows)
+                self._frames[None] = base
+            if order is not None and order in base.columns:
+                self._frames[order] = base.sort_values(order, kind="stable").reset_index(drop=True)
+        return self._frames.get(order, self._frames[None])
+
+
+class FakeQuery:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.op = "select"
+        self.columns = "*"
+        self.payload = None
+        self.on_conflict = None
+        self.filters = []
+        self.order_by = None
+        self.row_limit = None
+
+    def select(self, columns="*", count=None):
+        self.columns = columns
+        return self
+
+    def insert(self, payload):
+        self.op, self.payload = "insert", payload
+        return self
+
+    def upsert(self, payload, on_conflict="id"):
+        self.op, self.payload, self.on_conflict = "upsert", payload, on_conflict
+        return self
+
+    def update(self, payload):
+        self.op, self.payload = "update", payload
+        return self
+
+    def delete(self):
+        self.op = "delete"
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(("eq", column, value))
+        return self
+
+    def neq(self, column, value):
+        self.filters.append(("neq", column, value))
+        return self
+
+    def gt(self, column, value):
+        self.filters.append(("gt", column, value))
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(("gte", column, value))
+        return self
+
+    def is_(self, column, value):
+        self.filters.append(("is", column, value))
+        return self
+
+    def in_(self, column, values):
+        self.filters.append(("in", column, list(values)))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = column
+        return self
+
+    def limit(self, count):
+        self.row_limit = count
+        return self
+
+    def _mask(self, df, filters):
+        mask = pd.Series(True, index=df.index)
+        for op, column, value in filters:
+            values = df[column]
+            if op == "eq":
+                mask &= values == value
+            elif op == "neq":
+                mask &= values != value
+            elif op == "gt":
+                mask &= values > value
+            elif op == "gte":
+                mask &= values >= value
+            elif op == "is":
+                mask &= values.isna() if value in (None, "null") else values == value
+            else:
+                mask &= values.isin(value)
+        return mask
+
+    def execute(self):
+        self.client.requests[(self.name, self.op)] += 1
+        table = self.client.tables.setdefault(self.name, FakeTable())
+        return getattr(self, f"_{self.op}")(table)
+
+    def _select(self, table):
+        df = table.frame(self.order_by)
+        if len(df) == 0:
+            return FakeResponse([], 0)
+        filters = list(self.filters)
+        # Keyset pages (order by a column, > last value) slice the sorted view
+        # instead of scanning the whole table
+        keyset = [f for f in filters if f[0] == "gt" and f[1] == self.order_by]
+        if keyset:
+            filters.remove(keyset[0])
+            start = df[self.order_by].searchsorted(keyset[0][2], side="right")
+            df = df.iloc[start:]
+        if filters:
+            df = df[self._mask(df, filters)]
+        # count="exact" reports every matching row, not just the returned page
+        matched = len(df)
+        if self.row_limit is not None:
+            df = df.head(self.row_limit)
+        if self.columns != "*":
+            df = df[[c.strip() for c in self.columns.split(",")]]
+        return FakeResponse(df.to_dict(orient="records"), matched)
+
+    def _insert(self, table):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        for row in rows:
+            table.add(row)
+        table.changed()
+        return FakeResponse(rows)
+
+    def _upsert(self, table):
+        rows = self.payload if isinstance(self.payload, list) else [self.payload]
+        key = self.on_conflict
+        position = {r.get(key): i for i, r in enumerate(table.rows)}
+        for row in rows:
+            if row.get(key) in position:
+                table.rows[position[row[key]]].update(row)
+            else:
+                table.add(row)
+        table.changed()
+        return FakeResponse(rows)
+
+    def _matching(self, table):
+        df = table.frame()
+        if len(df) == 0:
+            return []
+        return df.index[self._mask(df, self.filters)].tolist()
+
+    def _update(self, table):
+        for i in self._matching(table):
+            table.rows[i].update(self.payload)
+        table.changed()
+        return FakeResponse([])
+
+    def _delete(self, table):
+        gone = set(self._matching(table))
+        table.rows = [r for i, r in enumerate(table.rows) if i not in gone]
+        table.changed()
+        return FakeResponse([None] * len(gone))
+
+
+class FakeRpc:
+    def __init__(self, client, name, params):
+        self.client = client
+        self.name = name
+        self.params = params or {}
+
+    def execute(self):
+        self.client.requests[("rpc", self.name)] += 1
+        return FakeResponse(self.client.functions[self.name](self.client, self.params))
+
+
+def swap_businesses_staging(client, params):
+    """Same effect as the plpgsql function in backend/db/publish_businesses.sql."""
+    staging = client.tables.setdefault("businesses_staging", FakeTable())
+    run_id = params["p_run_id"]
+    published = [
+        {k: v for k, v in r.items() if k not in ("run_id", "id")}
+        for r in staging.rows if r.get("run_id") == run_id
+    ]
+    if not published:
+        raise RuntimeError(f"No staged rows for run {run_id}")
+    businesses = FakeTable()
+    for row in published:
+        businesses.add(row)
+    client.tables["businesses"] = businesses
+    staging.rows = [r for r in staging.rows if r.get("run_id") != run_id]
+    staging.changed()
+    return len(published)
+
+
+def merge_businesses_staging(client, params):
+    """Same effect as the plpgsql function in backend/db/publish_changes.sql."""
+    staging = client.tables.setdefault("businesses_staging", FakeTable())
+    businesses = client.tables.setdefault("businesses", FakeTable())
+    run_id = params["p_run_id"]
+    merged = [
+        {k: v for k, v in r.items() if k not in ("run_id", "id")}
+        for r in staging.rows if r.get("run_id") == run_id
+    ]
+    position = {r.get("business_id"): i for i, r in enumerate(businesses.rows)}
+    for row in merged:
+        if row["business_id"] in position:
+            businesses.rows[position[row["business_id"]]].update(row)
+        else:
+            businesses.add(row)
+    deleted = set(params.get("p_deleted") or [])
+    businesses.rows = [
+        r for r in businesses.rows
+        if r.get("business_id") is not None and r.get("business_id") not in deleted
+    ]
+    businesses.changed()
+    staging.rows = [r for r in staging.rows if r.get("run_id") != run_id]
+    staging.changed()
+    return len(merged)
+
+
+class FakeSupabase:
+    """Drop-in for a supabase Client backed by in-memory tables."""
+
+    def __init__(self, tables=None):
+        self.tables = {}
+        for name, data in (tables or {}).items():
+            self.load(name, data)
+        self.functions = {
+            "swap_businesses_staging": swap_businesses_staging,
+            "merge_businesses_staging": merge_businesses_staging,
+        }
+        self.requests = Counter()
+
+    def load(self, name, data):
+        if isinstance(data, pd.DataFrame):
+            self.tables[name] = FakeTable.from_frame(data)
+        else:
+            self.tables[name] = FakeTable(data)
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    def rpc(self, name, params=None):
+        return FakeRpc(self, name, params)
+
+    def request_counts(self):
+        return {f"{table}.{op}": n for (table, op), n in sorted(self.requests.items())}
@@ -0,0 +1,95 @@
+"""
+Fast-start entry point for the ML service:
+
+    uvicorn fast_start:app
+
+A standard-library-only ASGI app that answers GET /health straight away and
+imports main (FastAPI, then the ML stack through main's warm-up) in a
+background thread. Every other request waits for that import and is then
+handed to main.app. Use it where cold starts matter (serverless hosts,
+autoscaling); `uvicorn main:app` still works and imports FastAPI before it
+serves anything.
+"""
+import asyncio
+import json
+import threading
+import time
+
+_loaded = threading.Event()
+_load_lock = threading.Lock()
+_loader = None
+_app = None
+_error = None
+_started = time.perf_counter()
+
+
+def _load():
+    global _app, _error
+    try:
+        import main
+
+        main.startup_timings["fast_start_ready_ms"] = round(
+            (time.perf_counter() - _started) * 1000, 1
+        )
+        # main.app's lifespan never runs behind this wrapper, so start its
+        # warm-up (ML_WARMUP) here
+        main.start_warm_up()
+        _app = main.app
+    except Exception as e:
+        _error = f"{type(e).__name__}: {e}"
+        from metrics import log
+
+        log.error(f"could not load the ML service: {_error}")
+    finally:
+        _loaded.set()
+
+
+def start_loading():
+    global _loader
+    with _load_lock:
+        if _loader is None:
+            _loader = threading.Thread(target=_load, name="ml-service-import", daemon=True)
+            _loader.start()
+
+
+async def _send_json(send, status, body):
+    payload = json.dumps(body).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(payload)).encode("ascii")),
+        ],
+    })
+    await send({"type": "http.response.body", "body": payload})
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            start_loading()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+
+    start_loading()
+    if not _loaded.is_set():
+        if scope["type"] == "http" and scope["path"] == "/health":
+            await _send_json(send, 200, {"status": "ok", "warm": False, "model_loaded": False})
+            return
+        await asyncio.get_running_loop().run_in_executor(None, _loaded.wait)
+
+    if _app is None:
+        if scope["type"] == "http":
+            await _send_json(send, 503, {"detail": f"ML service failed to load: {_error}"})
+        return
+    await _app(scope, receive, send)
@@ -0,0 +1,232 @@
+import os
+
+import numpy as np
+from scipy import sparse
+from sklearn.neighbors import BallTree
+from sklearn.preprocessing import OneHotEncoder
+
+EARTH_RADIUS_M = 6371000
+
+# One-hot encode zone_type next to general_category in the KMeans features
+FEATURE_ZONE = os.getenv("FEATURE_ZONE", "0") == "1"
+# Multipliers for the lat/lng columns and each one-hot block, to balance
+# geography against category (1.0 everywhere is the original layout)
+FEATURE_GEO_WEIGHT = float(os.getenv("FEATURE_GEO_WEIGHT", "1.0"))
+FEATURE_CATEGORY_WEIGHT = float(os.getenv("FEATURE_CATEGORY_WEIGHT", "1.0"))
+FEATURE_ZONE_WEIGHT = float(os.getenv("FEATURE_ZONE_WEIGHT", "1.0"))
+
+# Weight key of each encoded column
+ENCODED_BLOCKS = {"general_category": "category", "zone_type": "zone"}
+
+# Neighbourhood radii for the business/competitor density columns
+DENSITY_RADII_M = {"50m": 50, "100m": 100, "200m": 200}
+
+# Rows per BallTree query batch in radius_densities
+DENSITY_QUERY_CHUNK = 20000
+
+DENSITY_COLUMNS = [
+    f"{kind}_density_{label}"
+    for kind in ("business", "competitor")
+    for label in DENSITY_RADII_M
+]
+
+# Columns train_model adds on top of the business_raw columns
+ENHANCED_COLUMNS = [
+    "cluster",
+    "distance_to_center",
+    "business_density",
+    "competitor_density",
+    "zone_encoded",
+    *DENSITY_COLUMNS,
+]
+
+# Per-cluster dicts that used to be repeated on every row; they now live
+# once per cluster in business_clusters (clusters.py). Dropped from frames
+# saved by older runs.
+LEGACY_ROW_COLUMNS = ["category_distribution", "cluster_center"]
+
+
+def default_feature_weights():
+    return {
+        "geo": FEATURE_GEO_WEIGHT,
+        "category": FEATURE_CATEGORY_WEIGHT,
+        "zone": FEATURE_ZONE_WEIGHT,
+    }
+
+
+def fit_encoder(df, zone=FEATURE_ZONE):
+    """One-hot encoder over general_category (and zone_type with `zone`)."""
+    columns = list(ENCODED_BLOCKS) if zone else ["general_category"]
+    # Callers reject unknown categories up front; an unseen zone encodes as zeros
+    return OneHotEncoder(handle_unknown="ignore").fit(df[columns])
+
+
+def build_feature_matrix(df, encoder, weights=None):
+    """
+    Latitude, longitude and the one-hot blocks: the layout KMeans is fit on.
+
+    Returned as CSR, so memory grows with the nonzeros (two coordinates and
+    one entry per encoded column per row), not with the category count.
+    `weights` scales each part (see default_feature_weights); None leaves
+    everything at 1, which is also how models saved before weighting load.
+    """
+    # Encoders from older artifacts were fit on general_category alone
+    columns = list(getattr(encoder, "feature_names_in_", ["general_category"]))
+    onehot = sparse.csr_matrix(encoder.transform(df[columns]), dtype=float)
+    geo = sparse.csr_matrix(df[["latitude", "longitude"]].to_numpy(dtype=float))
+    if weights:
+        geo = geo * weights["geo"]
+        scale = np.concatenate([
+            np.full(len(categories), weights[ENCODED_BLOCKS[column]])
+            for column, categories in zip(columns, encoder.categories_)
+        ])
+        onehot.data *= scale[onehot.indices]
+    return sparse.hstack([geo, onehot], format="csr")
+
+
+def squared_distances(features, center):
+    """Squared Euclidean distance of every row to one center (sparse-safe)."""
+    center = np.asarray(center, dtype=float)
+    if not sparse.issparse(features):
+        diff = features - center
+        return np.einsum("ij,ij->i", diff, diff)
+    row_sq = np.asarray(features.multiply(features).sum(axis=1)).ravel()
+    return np.maximum(row_sq - 2 * (features @ center) + center @ center, 0)
+
+
+def center_distances(features, centers, labels):
+    """
+    Euclidean distance of each row to centers[labels]. Sparse rows are
+    expanded as |x|^2 - 2 x.c + |c|^2 over their nonzeros only, so no dense
+    rows x features array is ever built.
+    """
+    centers = np.asarray(centers, dtype=float)
+    labels = np.asarray(labels)
+    if not sparse.issparse(features):
+        diff = features - centers[labels]
+        return np.sqrt(np.einsum("ij,ij->i", diff, diff))
+    csr = sparse.csr_matrix(features)
+    n = csr.shape[0]
+    rows = np.repeat(np.arange(n), np.diff(csr.indptr))
+    row_sq = np.bincount(rows, weights=csr.data ** 2, minlength=n)
+    cross = np.bincount(rows, weights=csr.data * centers[labels[rows], csr.indices], minlength=n)
+    center_sq = np.einsum("ij,ij->i", centers, centers)[labels]
+    return np.sqrt(np.maximum(row_sq - 2 * cross + center_sq, 0))
+
+
+def dense_row(features, i):
+    if sparse.issparse(features):
+        return features[i].toarray().ravel()
+    return features[i]
+
+
+def center_coordinates(centers, weights=None):
+    """(latitude, longitude) of each centroid, undoing the geo weight."""
+    coords = np.asarray(centers, dtype=float)[:, :2]
+    if weights:
+        coords = coords / weights["geo"]
+    return coords
+
+
+def build_enhanced_features(df_active, features, centers, clusters, zone_categories):
+    """
+    Compute the cluster-level enhanced ML columns for the active businesses
+    in one batched pass. Adds cluster, distance_to_center, business_density,
+    competitor_density and zone_encoded to df_active (in place) and returns
+    it. The radius density columns come from add_radius_densities; the
+    per-cluster center and category shares from clusters.cluster_summaries.
+    """
+    clusters = np.asarray(clusters)
+    centers = np.asarray(centers)
+
+    df_active["cluster"] = clusters
+
+    # Distance to own centroid (gather each row's center, no Python loop)
+    df_active["distance_to_center"] = center_distances(features, centers, clusters)
+
+    # Business density (cluster population)
+    df_active["business_density"] = (
+        df_active.groupby("cluster")["cluster"].transform("size")
+    )
+
+    # Competitor density (same category, same cluster)
+    df_active["competitor_density"] = (
+        df_active.groupby(["cluster", "general_category"], observed=True)["cluster"]
+        .transform("size")
+    )
+
+    df_active["zone_encoded"] = zone_codes(df_active, zone_categories)
+
+    return df_active
+
+
+def zone_codes(df, zone_categories):
+    """Integer code of zone_type within the sorted zone list (-1 if unknown)."""
+    lookup = {zone: code for code, zone in enumerate(zone_categories)}
+    return df["zone_type"].astype(object).map(lookup).fillna(-1).astype(int)
+
+
+def radians_coords(df):
+    return np.radians(df[["latitude", "longitude"]].to_numpy(dtype=float))
+
+
+def rows_within(df, points, radius_m):
+    """Positions of df rows within radius_m of any of the (lat, lng) points."""
+    if len(df) == 0 or len(points) == 0:
+        return np.empty(0, dtype=int)
+    tree = BallTree(radians_coords(df), metric="haversine")
+    hits = tree.query_radius(np.radians(np.asarray(points, dtype=float)),
+                             r=radius_m / EARTH_RADIUS_M)
+    return np.unique(np.concatenate(hits)).astype(int)
+
+
+def radius_densities(df_active, positions=None, chunk_size=DENSITY_QUERY_CHUNK):
+    """
+    Count businesses and same-category competitors within each radius of
+    DENSITY_RADII_M, excluding the business itself.
+
+    One haversine BallTree is queried in batches at the largest radius; the
+    smaller radii and the competitor counts are then read off the returned
+    neighbour distances with bincount instead of separate tree walks.
+    `positions` limits which rows are queried (all rows still count as
+    neighbours). Returns {column: int array aligned with positions}.
+    """
+    coords = radians_coords(df_active)
+    if positions is None:
+        positions = np.arange(len(df_active))
+    positions = np.asarray(positions, dtype=int)
+    out = {column: np.zeros(len(positions), dtype=int) for column in DENSITY_COLUMNS}
+    if len(positions) == 0:
+        return out
+
+    tree = BallTree(coords, metric="haversine")
+    category_codes = df_active["general_category"].astype("category").cat.codes.to_numpy()
+    max_radius = max(DENSITY_RADII_M.values()) / EARTH_RADIUS_M
+
+    # Chunked so dense areas can't blow up the neighbour lists
+    for start in range(0, len(positions), chunk_size):
+        chunk = positions[start:start + chunk_size]
+        neighbours, distances = tree.query_radius(
+            coords[chunk], r=max_radius, return_distance=True
+        )
+        owner = np.repeat(np.arange(len(chunk)), [len(n) for n in neighbours])
+        neighbours = np.concatenate(neighbours)
+        distances = np.concatenate(distances)
+        same = category_codes[neighbours] == category_codes[chunk][owner]
+
+        for label, meters in DENSITY_RADII_M.items():
+            within = distances <= meters / EARTH_RADIUS_M
+            out[f"business_density_{label}"][start:start + len(chunk)] = (
+                np.bincount(owner[within], minlength=len(chunk)) - 1
+            )
+            out[f"competitor_density_{label}"][start:start + len(chunk)] = (
+                np.bincount(owner[within & same], minlength=len(chunk)) - 1
+            )
+    return out
+
+
+def add_radius_densities(df_active):
+    """Fill the density columns for every active business (in place)."""
+    for column, values in radius_densities(df_active).items():
+        df_active[column] = values
+    return df_active
@@ -0,0 +1,277 @@
+import os
+from dataclasses import replace
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from features import (
+    DENSITY_COLUMNS,
+    DENSITY_RADII_M,
+    ENHANCED_COLUMNS,
+    build_enhanced_features,
+    build_feature_matrix,
+    center_distances,
+    radius_densities,
+    rows_within,
+)
+from artifacts import save_artifact
+from metrics import log
+from model_state import get_state, set_state
+from spatial_index import refresh_index
+from publish import publish_clusters, same_value, upsert_changed_rows
+from data_source import RAW_COLUMNS
+from normalize import normalize_businesses
+from stats import compute_stats, save_stats
+from clusters import cluster_centers, cluster_summaries, save_clusters
+from supabase_client import get_client
+from train import ignore_stage, train_model
+
+# Full re-cluster once this share of rows changed since the last full fit
+INCREMENTAL_MAX_CHANGE_RATIO = float(os.getenv("INCREMENTAL_MAX_CHANGE_RATIO", "0.1"))
+# ...or when new rows sit this many times further from their centroid than
+# the average business did at fit time
+INCREMENTAL_DRIFT_FACTOR = float(os.getenv("INCREMENTAL_DRIFT_FACTOR", "3.0"))
+
+RAW_FIELDS = [c.strip() for c in RAW_COLUMNS.split(",")]
+# Raw fields the cluster, distance and density columns depend on
+CLUSTER_FIELDS = ["latitude", "longitude", "general_category", "zone_type", "status"]
+
+
+def has_changes(payload):
+    """True when a /train body names specific business_raw rows."""
+    if isinstance(payload, list):
+        return len(payload) > 0
+    if not isinstance(payload, dict):
+        return False
+    return "business_ids" in payload or "record" in payload or "old_record" in payload
+
+
+def resolve_changes(payload):
+    """
+    Turn a /train body into ({business_id: raw row}, {deleted business_id}).
+
+    Accepts a Supabase database webhook payload ({type, record, old_record}),
+    a list of them, or {"business_ids": [...]} in which case the current rows
+    are fetched from business_raw.
+    """
+    records = {}
+    deleted = set()
+    events = payload if isinstance(payload, list) else [payload]
+
+    fetch_ids = []
+    for event in events:
+        if "business_ids" in event:
+            fetch_ids.extend(event["business_ids"])
+            continue
+
+        record = event.get("record")
+        old_record = event.get("old_record")
+        if event.get("type") == "DELETE" or record is None:
+            if old_record:
+                deleted.add(old_record["business_id"])
+            continue
+
+        records[record["business_id"]] = {k: record.get(k) for k in RAW_FIELDS}
+        deleted.discard(record["business_id"])
+        if old_record and old_record.get("business_id") != record["business_id"]:
+            deleted.add(old_record["business_id"])
+
+    if fetch_ids:
+        resp = get_client().table("business_raw").select(RAW_COLUMNS).in_(
+            "business_id", fetch_ids
+        ).execute()
+        found = {row["business_id"]: row for row in resp.data or []}
+        records.update(found)
+        deleted.update(set(fetch_ids) - set(found))
+
+    return records, deleted - set(records)
+
+
+def raw_only_edits(snapshot, new):
+    """
+    business_ids of `new` rows whose CLUSTER_FIELDS match their snapshot
+    row (a rename, a corrected street): every computed column stays valid.
+    """
+    current = snapshot[snapshot["business_id"].isin(new["business_id"])]
+    if len(current) == 0:
+        return set()
+    incoming = new.set_index("business_id").loc[current["business_id"]]
+    same = np.ones(len(current), dtype=bool)
+    for column in CLUSTER_FIELDS:
+        same &= np.array([
+            same_value(a, b)
+            for a, b in zip(current[column].astype(object), incoming[column].astype(object))
+        ])
+    return set(current["business_id"][same].tolist())
+
+
+def _concat(frames):
+    """pd.concat of the non-empty frames (pandas warns about empty ones)."""
+    parts = [frame for frame in frames if len(frame)]
+    return pd.concat(parts or frames[:1], ignore_index=True)
+
+
+def _full_retrain(reason, on_stage):
+    result = train_model(on_stage=on_stage)
+    result["mode"] = "full"
+    result["full_retrain_reason"] = reason
+    return result
+
+
+def train_incremental(payload, on_stage=ignore_stage):
+    """
+    Apply changed business_raw rows to the current model without refitting.
+
+    New or moved businesses are assigned to the existing centroids and only
+    the clusters they leave or join have their densities and category shares
+    recomputed. Edits to fields clustering ignores (raw_only_edits) only
+    rewrite the edited row. Falls back to a full train_model() when no model is loaded or
+    the change/drift thresholds are crossed.
+    """
+    state = get_state()
+    if state is None:
+        return _full_retrain("no_model_loaded", on_stage)
+
+    on_stage("fetch")
+    records, deleted_ids = resolve_changes(payload)
+    changed_ids = set(records) | deleted_ids
+    if not changed_ids:
+        return {
+            "status": "success",
+            "trigger": "raw_data_change",
+            "mode": "incremental",
+            "changed": 0,
+            "enhanced_table": "businesses",
+            "timestamp": datetime.utcnow().isoformat() + "Z"
+        }
+
+    on_stage("check_thresholds")
+    # 1. Size-change threshold
+    pending = state.changed_since_fit + len(changed_ids)
+    if pending > INCREMENTAL_MAX_CHANGE_RATIO * state.fit_rows:
+        return _full_retrain("change_threshold", on_stage)
+
+    # Rows that fail validation are dropped from businesses like deletions
+    new, rejected = normalize_businesses(pd.DataFrame(list(records.values()), columns=RAW_FIELDS))
+    snapshot = state.snapshot
+    # Rows that only changed fields clustering ignores keep their computed
+    # columns and are not reassigned; no other row is recomputed for them
+    edited = raw_only_edits(snapshot, new)
+    renamed = snapshot[snapshot["business_id"].isin(edited)].copy()
+    incoming = new.set_index("business_id").loc[renamed["business_id"]]
+    for column in incoming.columns:
+        renamed[column] = incoming[column].to_numpy()
+    new = new[~new["business_id"].isin(edited)]
+    new_active = new[new["status"] == "active"].copy()
+    new_inactive = _concat(
+        [new[new["status"] == "inactive"], renamed[renamed["status"] != "active"]]
+    )
+
+    # 2. Categories the encoder has never seen need a refit
+    known = set(state.encoder.categories_[0])
+    if not set(new_active["general_category"]).issubset(known):
+        return _full_retrain("new_category", on_stage)
+    # ...and a new zone type would shift every zone_encoded value
+    zones = state.zone_categories
+    if zones is None or not set(new_active["zone_type"]).issubset(zones):
+        return _full_retrain("new_zone", on_stage)
+
+    on_stage("assign")
+    # 3. Assign new/moved businesses to the existing centroids
+    centers = state.kmeans.cluster_centers_
+    labels = np.empty(0, dtype=int)
+    if len(new_active):
+        new_features = build_feature_matrix(new_active, state.encoder, state.feature_weights)
+        labels = state.kmeans.predict(new_features)
+        distances = center_distances(new_features, centers, labels)
+        if distances.mean() > INCREMENTAL_DRIFT_FACTOR * state.baseline_distance:
+            return _full_retrain("drift_threshold", on_stage)
+
+    on_stage("features")
+    # 4. Recompute only the clusters rows left or joined
+    touched = snapshot["business_id"].isin(changed_ids)
+    relocated = touched & ~snapshot["business_id"].isin(edited)
+    old_clusters = set(snapshot.loc[relocated, "cluster"].dropna().astype(int))
+    affected = old_clusters | set(labels.tolist())
+
+    rest = _concat([snapshot[~touched], renamed[renamed["status"] == "active"]])
+    rest_active = rest["status"] == "active"
+    in_affected = rest_active & rest["cluster"].isin(affected)
+    kept = rest[in_affected]
+
+    group = _concat([kept[RAW_FIELDS + DENSITY_COLUMNS], new_active[RAW_FIELDS]])
+    group_clusters = np.concatenate([kept["cluster"].astype(int).to_numpy(), labels])
+    if len(group):
+        build_enhanced_features(
+            group, build_feature_matrix(group, state.encoder, state.feature_weights), centers,
+            group_clusters, zones
+        )
+
+    # 5. Radius densities change only around the old and new positions
+    active_after = _concat([rest[rest_active & ~in_affected], group])
+    moved = pd.concat([
+        snapshot.loc[relocated & (snapshot["status"] == "active"), ["latitude", "longitude"]],
+        new_active[["latitude", "longitude"]],
+    ]).to_numpy(dtype=float)
+    near = rows_within(active_after, moved, max(DENSITY_RADII_M.values()))
+    for column, values in radius_densities(active_after, near).items():
+        active_after.loc[near, column] = values
+
+    # Inactive rows keep no ML features; the ML columns are added empty
+    # (published as null) instead of as all-None placeholders
+    new_inactive = new_inactive.reindex(columns=[
+        *new_inactive.columns,
+        *[column for column in ENHANCED_COLUMNS if column not in new_inactive.columns],
+    ])
+    active_edited = np.flatnonzero(active_after["business_id"].isin(edited).to_numpy())
+
+    on_stage("publish")
+    # 6. Of the rows whose values can have changed, write the ones that
+    #    differ from the last published snapshot
+    group_start = len(active_after) - len(group)
+    changed_rows = np.union1d(
+        np.union1d(np.arange(group_start, len(active_after)), near), active_edited
+    )
+    written = _concat([active_after.iloc[changed_rows], new_inactive])
+    removed = changed_ids - set(written["business_id"])
+    publish = upsert_changed_rows(get_client(), written, snapshot, deleted_ids=removed)
+    cluster_publish = {"clusters": 0}
+    if affected or len(near):
+        # Cluster summaries are one small row per cluster; rewrite them all
+        summaries = cluster_summaries(
+            active_after, cluster_centers(state.kmeans, state.feature_weights)
+        )
+        cluster_publish = publish_clusters(get_client(), summaries)
+        save_clusters(summaries)
+
+    set_state(replace(
+        state,
+        snapshot=_concat([rest[~rest_active], active_after, new_inactive]),
+        changed_since_fit=pending,
+        # businesses no longer matches a plain fit of any raw snapshot
+        snapshot_hash=None,
+    ))
+    refresh_index(get_state())
+    # A restart must warm-load the edited snapshot, not the last full fit's
+    try:
+        save_artifact(get_state())
+    except OSError as e:
+        log.warning(f"could not save model artifact: {e}")
+    save_stats(compute_stats(get_state().snapshot))
+
+    return {
+        "status": "success",
+        "trigger": "raw_data_change",
+        "mode": "incremental",
+        "changed": len(changed_ids),
+        "deleted": len(removed),
+        "quarantined": len(rejected),
+        "affected_clusters": sorted(int(c) for c in affected),
+        "density_rows_updated": len(near),
+        "rows_written": publish["rows"],
+        "rows_unchanged": publish["unchanged"],
+        "clusters_written": cluster_publish["clusters"],
+        "enhanced_table": "businesses",
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
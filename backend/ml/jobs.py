@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+from artifacts import ARTIFACT_DIR
+from metrics import log, profile_call
+
+# Triggers arriving within this window of each other collapse into one run
+TRAIN_DEBOUNCE_SECONDS = float(os.getenv("TRAIN_DEBOUNCE_SECONDS", "2.0"))
+# ...but a steady stream of triggers can't postpone a run for longer than this
+TRAIN_DEBOUNCE_MAX_WAIT_SECONDS = float(os.getenv("TRAIN_DEBOUNCE_MAX_WAIT_SECONDS", "30.0"))
+# Finished jobs kept around for GET /train/{job_id}
+TRAIN_JOB_HISTORY = int(os.getenv("TRAIN_JOB_HISTORY", "100"))
+# cProfile dumps of jobs queued with profile=True
+PROFILE_DIR = os.getenv("ML_PROFILE_DIR", os.path.join(ARTIFACT_DIR, "profiles"))
+
+
+def _now_iso():
+    return datetime.utcnow().isoformat() + "Z"
+
+
+class TrainingQueue:
+    """
+    Single-worker queue for training runs.
+
+    Every trigger is folded into the one pending (not yet started) job, so a
+    burst of webhooks becomes a single run. A job starts once no trigger has
+    arrived for `debounce` seconds, and only one job runs at a time, so runs
+    never race on the businesses table.
+    """
+
+    def __init__(self, runner, debounce=TRAIN_DEBOUNCE_SECONDS,
+                 max_wait=TRAIN_DEBOUNCE_MAX_WAIT_SECONDS, history=TRAIN_JOB_HISTORY):
+        # runner(events, full, force, on_stage) -> result dict
+        self.runner = runner
+        self.debounce = debounce
+        self.max_wait = max_wait
+        self.history = history
+        self._jobs = OrderedDict()
+        self._pending = None
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def submit(self, events=None, full=False, force=False, profile=False):
+        """Queue a trigger; returns (job, coalesced)."""
+        with self._cond:
+            job = self._pending
+            coalesced = job is not None
+            if job is None:
+                job = {
+                    "job_id": uuid.uuid4().hex,
+                    "status": "queued",
+                    "stage": None,
+                    "triggers": 0,
+                    "full": False,
+                    "force": False,
+                    "profile": False,
+                    "events": [],
+                    "created_at": _now_iso(),
+                    "started_at": None,
+                    "finished_at": None,
+                    "timings": {},
+                    "result": None,
+                    "error": None,
+                    "profile_report": None,
+                    "_first_trigger": time.monotonic(),
+                }
+                self._pending = job
+                self._remember(job)
+
+            job["triggers"] += 1
+            job["_last_trigger"] = time.monotonic()
+            # Any trigger without changed rows upgrades the batch to a full run
+            if full or not events:
+                job["full"] = True
+            else:
+                job["events"].extend(events)
+            job["force"] = job["force"] or force
+            job["profile"] = job["profile"] or profile
+
+            self._ensure_worker()
+            self._cond.notify_all()
+            return self._public(job), coalesced
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return self._public(job) if job else None
+
+    def _remember(self, job):
+        self._jobs[job["job_id"]] = job
+        while len(self._jobs) > self.history:
+            oldest_id, oldest = next(iter(self._jobs.items()))
+            if oldest["status"] in ("queued", "running"):
+                break
+            del self._jobs[oldest_id]
+
+    @staticmethod
+    def _public(job):
+        view = {k: v for k, v in job.items() if not k.startswith("_") and k != "events"}
+        view["changed_events"] = len(job["events"])
+        return view
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._run_forever, name="training-queue", daemon=True
+            )
+            self._worker.start()
+
+    def _next_job(self):
+        """Block until the pending job's debounce window has closed."""
+        with self._cond:
+            while True:
+                job = self._pending
+                if job is None:
+                    self._cond.wait()
+                    continue
+                now = time.monotonic()
+                ready_at = min(
+                    job["_last_trigger"] + self.debounce,
+                    job["_first_trigger"] + self.max_wait,
+                )
+                if now >= ready_at:
+                    self._pending = None
+                    job["status"] = "running"
+                    job["started_at"] = _now_iso()
+                    return job
+                self._cond.wait(timeout=ready_at - now)
+
+    def _run_forever(self):
+        while True:
+            job = self._next_job()
+            self._run(job)
+
+    def _run(self, job):
+        started = time.perf_counter()
+        stage_started = [started]
+
+        def on_stage(name):
+            now = time.perf_counter()
+            with self._cond:
+                if job["stage"] is not None:
+                    job["timings"][job["stage"]] = round(now - stage_started[0], 4)
+                job["stage"] = name
+            stage_started[0] = now
+
+        def run():
+            return self.runner(job["events"], job["full"], job["force"], on_stage)
+
+        report = None
+        try:
+            if job["profile"]:
+                path = os.path.join(PROFILE_DIR, f"{job['job_id']}.prof")
+                result, report = profile_call(run, path)
+            else:
+                result = run()
+            status, error = "succeeded", None
+            if isinstance(result, dict) and result.get("status") == "error":
+                status = "failed"
+                error = result.get("message")
+        except Exception as e:
+            log.exception("training job %s failed", job["job_id"])
+            result, status, error = None, "failed", f"{type(e).__name__}: {e}"
+
+        now = time.perf_counter()
+        with self._cond:
+            if job["stage"] is not None:
+                job["timings"][job["stage"]] = round(now - stage_started[0], 4)
+            job["timings"]["total"] = round(now - started, 4)
+            job["status"] = status
+            job["result"] = result
+            job["error"] = error
+            job["profile_report"] = report
+            job["finished_at"] = _now_iso()
+            job["events"] = []
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+from joblib import Parallel, delayed
+from scipy import sparse
+from sklearn.cluster import KMeans
+
+from artifacts import ARTIFACT_DIR
+from features import dense_row, squared_distances
+
+# "gradient" (steepest inertia drop, what train_model always used) or
+# "delta" (first drop below a share of the first drop, as in elbow_method.txt)
+K_SELECT_RULE = os.getenv("K_SELECT_RULE", "gradient")
+K_SELECT_DELTA_THRESHOLD = float(os.getenv("K_SELECT_DELTA_THRESHOLD", "0.25"))
+K_SELECT_WORKERS = int(os.getenv("K_SELECT_WORKERS", str(os.cpu_count() or 1)))
+# Below this many rows a process pool (and warm seeding) costs more than it
+# saves, so small tables get exactly the plain sequential sweep
+K_SELECT_PARALLEL_MIN_ROWS = int(os.getenv("K_SELECT_PARALLEL_MIN_ROWS", "5000"))
+# Inertia curves kept in memory and as inertia-*.json files (newest first)
+K_SELECT_CACHE_CURVES = max(1, int(os.getenv("K_SELECT_CACHE_CURVES", "16")))
+
+_curve_cache = OrderedDict()
+
+
+def gradient_elbow(ks, inertias):
+    """k where the inertia curve falls fastest (np.gradient minimum)."""
+    if len(ks) < 2:
+        return ks[0]
+    return ks[int(np.argmin(np.gradient(inertias)))]
+
+
+def delta_threshold_elbow(ks, inertias, threshold=K_SELECT_DELTA_THRESHOLD):
+    """
+    First k whose following inertia drop is below `threshold` times the
+    first drop. Returns None while the known curve doesn't satisfy the rule
+    yet, so callers can stop sweeping as soon as it does.
+    """
+    deltas = [inertias[i - 1] - inertias[i] for i in range(1, len(inertias))]
+    if not deltas:
+        return None
+    limit = threshold * deltas[0]
+    for i in range(1, len(deltas)):
+        if deltas[i] < limit:
+            return ks[i]
+    return None
+
+
+def _data_hash(features):
+    digest = hashlib.sha256(str(features.shape).encode("utf-8"))
+    if sparse.issparse(features):
+        csr = sparse.csr_matrix(features)
+        csr.sort_indices()
+        for part in (csr.indptr, csr.indices, csr.data):
+            digest.update(np.ascontiguousarray(part).tobytes())
+    else:
+        digest.update(np.ascontiguousarray(features).tobytes())
+    return digest.hexdigest()
+
+
+def _cache_path(data_hash):
+    return os.path.join(ARTIFACT_DIR, f"inertia-{data_hash[:16]}.json")
+
+
+def _remember(data_hash, curve):
+    _curve_cache[data_hash] = curve
+    _curve_cache.move_to_end(data_hash)
+    while len(_curve_cache) > K_SELECT_CACHE_CURVES:
+        _curve_cache.popitem(last=False)
+
+
+def _load_curve(data_hash):
+    if data_hash in _curve_cache:
+        _curve_cache.move_to_end(data_hash)
+        return _curve_cache[data_hash]
+    path = _cache_path(data_hash)
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            curve = {int(k): v for k, v in json.load(f).items()}
+        _remember(data_hash, curve)
+        return curve
+    return {}
+
+
+def _prune_curve_files():
+    names = [
+        name for name in os.listdir(ARTIFACT_DIR)
+        if name.startswith("inertia-") and name.endswith(".json")
+    ]
+    names.sort(key=lambda name: os.path.getmtime(os.path.join(ARTIFACT_DIR, name)), reverse=True)
+    for name in names[K_SELECT_CACHE_CURVES:]:
+        os.remove(os.path.join(ARTIFACT_DIR, name))
+
+
+def _save_curve(data_hash, curve):
+    _remember(data_hash, curve)
+    try:
+        os.makedirs(ARTIFACT_DIR, exist_ok=True)
+        with open(_cache_path(data_hash), "w", encoding="utf-8") as f:
+            json.dump({str(k): v for k, v in curve.items()}, f)
+        _prune_curve_files()
+    except OSError:
+        pass
+
+
+def seed_centers(features, centers, k, random_state=42):
+    """Previous centroids plus k-means++ (D^2-weighted) picks for the rest."""
+    rng = np.random.RandomState(random_state + k)
+    n = features.shape[0]
+    seeds = [c for c in centers]
+    closest = squared_distances(features, seeds[0])
+    for c in seeds[1:]:
+        closest = np.minimum(closest, squared_distances(features, c))
+    while len(seeds) < k:
+        total = closest.sum()
+        if total > 0:
+            idx = rng.choice(n, p=closest / total)
+        else:
+            idx = rng.randint(n)
+        seeds.append(dense_row(features, idx))
+        closest = np.minimum(closest, squared_distances(features, seeds[-1]))
+    return np.array(seeds)
+
+
+def _fit_inertia(features, k, init):
+    if init is None:
+        kmeans = KMeans(n_clusters=k, random_state=42)
+    else:
+        kmeans = KMeans(n_clusters=k, init=init, n_init=1, random_state=42)
+    kmeans.fit(features)
+    return k, float(kmeans.inertia_), kmeans.cluster_centers_
+
+
+def _choose(rule, ks, inertias, threshold, complete):
+    if rule == "delta":
+        k = delta_threshold_elbow(ks, inertias, threshold)
+        if k is None and complete:
+            return ks[-1]
+        return k
+    # The gradient minimum can move until the whole curve is known
+    return gradient_elbow(ks, inertias) if complete else None
+
+
+def select_k(features, k_range, rule=K_SELECT_RULE, n_jobs=K_SELECT_WORKERS,
+             threshold=K_SELECT_DELTA_THRESHOLD):
+    """
+    Pick the number of clusters for `features` with the elbow method.
+
+    Small inputs get the plain sequential sweep. On large inputs the first
+    uncached k is fitted cold and every later k is seeded with the
+    centroids of the largest k fitted before it (seed_centers):
+    - "delta" can stop early, so it fits one k at a time, each seeded from
+      the previous k, and stops as soon as the rule is satisfied
+    - "gradient" needs the whole curve and never stops early; after the
+      first fit the remaining k values run in waves of `n_jobs` across a
+      process pool
+    Inertia curves are cached by data hash.
+    """
+    if rule not in ("gradient", "delta"):
+        raise ValueError(f"Unknown k selection rule: {rule}")
+
+    ks = list(k_range)
+    if not ks:
+        return {"k": k_range.start, "rule": rule, "ks": [], "inertias": [],
+                "fitted": 0, "cached": 0}
+
+    data_hash = _data_hash(features)
+    curve = dict(_load_curve(data_hash))
+    cached = sum(1 for k in ks if k in curve)
+
+    warm_start = features.shape[0] >= K_SELECT_PARALLEL_MIN_ROWS
+    n_jobs = max(1, n_jobs) if warm_start else 1
+
+    fitted = 0
+    best_centers = None
+    chosen = None
+    position = 0
+    with Parallel(n_jobs=n_jobs, backend="loky" if n_jobs > 1 else "sequential") as pool:
+        while position < len(ks):
+            # Resolve as much of the curve as the cache already covers
+            while position < len(ks) and ks[position] in curve:
+                position += 1
+            known = ks[:position]
+            chosen = _choose(rule, known, [curve[k] for k in known], threshold,
+                             complete=position == len(ks))
+            if chosen is not None or position == len(ks):
+                break
+
+            # One k at a time until there are centroids to seed from, and
+            # throughout for the delta rule so it can stop after any k
+            size = n_jobs if best_centers is not None and rule == "gradient" else 1
+            wave = [k for k in ks[position:position + size] if k not in curve]
+            inits = [
+                None if best_centers is None or not warm_start
+                else seed_centers(features, best_centers, k)
+                for k in wave
+            ]
+            results = pool(
+                delayed(_fit_inertia)(features, k, init) for k, init in zip(wave, inits)
+            )
+            for k, inertia, centers in results:
+                curve[k] = inertia
+                if best_centers is None or len(centers) > len(best_centers):
+                    best_centers = centers
+            fitted += len(wave)
+
+    if chosen is None:
+        chosen = _choose(rule, ks, [curve[k] for k in ks], threshold, complete=True)
+
+    if fitted:
+        _save_curve(data_hash, curve)
+
+    evaluated = [k for k in ks if k in curve]
+    return {
+        "k": int(chosen),
+        "rule": rule,
+        "ks": evaluated,
+        "inertias": [curve[k] for k in evaluated],
+        "fitted": fitted,
+        "cached": cached,
+    }
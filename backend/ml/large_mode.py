@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.metrics import adjusted_rand_score
+
+from features import center_distances
+
+# "auto" switches to the large-table path at LARGE_MODE_MIN_ROWS active
+# rows; "on"/"off" force it either way
+LARGE_MODE = os.getenv("LARGE_MODE", "auto")
+LARGE_MODE_MIN_ROWS = int(os.getenv("LARGE_MODE_MIN_ROWS", "200000"))
+# Rows (stratified by category) the elbow sweep runs on
+LARGE_MODE_SAMPLE_ROWS = int(os.getenv("LARGE_MODE_SAMPLE_ROWS", "50000"))
+MINIBATCH_BATCH_SIZE = int(os.getenv("MINIBATCH_BATCH_SIZE", "4096"))
+MINIBATCH_N_INIT = int(os.getenv("MINIBATCH_N_INIT", "3"))
+# Rows labelled per predict call
+PREDICT_CHUNK_ROWS = int(os.getenv("PREDICT_CHUNK_ROWS", "100000"))
+# Rows also fit with exact KMeans to report how close the mini-batch
+# clusters are (0 disables the comparison)
+LARGE_MODE_QUALITY_ROWS = int(os.getenv("LARGE_MODE_QUALITY_ROWS", "20000"))
+
+
+def use_large_mode(rows, mode=LARGE_MODE, min_rows=LARGE_MODE_MIN_ROWS):
+    if mode == "on":
+        return True
+    if mode == "off":
+        return False
+    return rows >= min_rows
+
+
+def stratified_sample(df, size, by="general_category", seed=42):
+    """
+    Sorted positions of about `size` random rows of df, keeping each
+    category's share (every category keeps at least one row).
+    """
+    n = len(df)
+    if n <= size:
+        return np.arange(n)
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(n)
+    codes = pd.factorize(df[by])[0][order]
+    counts = np.bincount(codes)
+    quota = np.maximum(1, np.round(counts * size / n)).astype(int)
+    # Rank of each row within its category, in the shuffled order
+    rank = pd.Series(codes).groupby(codes).cumcount().to_numpy()
+    return np.sort(order[rank < quota[codes]])
+
+
+def fit_minibatch(features, k, batch_size=MINIBATCH_BATCH_SIZE, init=None):
+    """MiniBatchKMeans fit, from k-means++ or from the given centroids."""
+    if init is not None:
+        return MiniBatchKMeans(
+            n_clusters=k, batch_size=batch_size, init=init, n_init=1, random_state=42
+        ).fit(features)
+    return MiniBatchKMeans(
+        n_clusters=k, batch_size=batch_size, n_init=MINIBATCH_N_INIT, random_state=42
+    ).fit(features)
+
+
+def predict_streamed(model, features, chunk_rows=PREDICT_CHUNK_ROWS):
+    """Cluster labels for every row, predicted chunk_rows at a time."""
+    n = features.shape[0]
+    labels = np.empty(n, dtype=np.int32)
+    for start in range(0, n, chunk_rows):
+        labels[start:start + chunk_rows] = model.predict(features[start:start + chunk_rows])
+    return labels
+
+
+def compare_with_exact(features, labels, model, k, rows=LARGE_MODE_QUALITY_ROWS, seed=42):
+    """
+    Fit exact KMeans on a random subset and compare it with the mini-batch
+    model there: inertia of both, their ratio, and the adjusted Rand index
+    of the two labellings (1.0 means identical clusters).
+    """
+    n = features.shape[0]
+    subset = np.sort(np.random.default_rng(seed).choice(n, size=min(rows, n), replace=False))
+    sample = features[subset]
+    exact = KMeans(n_clusters=k, random_state=42, n_init=10).fit(sample)
+    minibatch_inertia = float(
+        (center_distances(sample, model.cluster_centers_, labels[subset]) ** 2).sum()
+    )
+    return {
+        "sample_rows": len(subset),
+        "minibatch_inertia": minibatch_inertia,
+        "exact_inertia": float(exact.inertia_),
+        "inertia_ratio": minibatch_inertia / float(exact.inertia_) if exact.inertia_ else None,
+        "adjusted_rand": float(adjusted_rand_score(exact.labels_, labels[subset])),
+    }
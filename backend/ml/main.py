@@ -1,6 +1,30 @@
-from fastapi import FastAPI
-from fastapi.middleware.cors import CORSMiddleware
-from train import train_model
+import time
+
+_import_started = time.perf_counter()
+
+import os  # noqa: E402
+import threading  # noqa: E402
+from typing import List, Optional, Union  # noqa: E402
+
+from fastapi import Body, FastAPI, HTTPException, Query, Request  # noqa: E402
+from fastapi.middleware.cors import CORSMiddleware  # noqa: E402
+from fastapi.responses import FileResponse, PlainTextResponse, Response  # noqa: E402
+from pydantic import BaseModel  # noqa: E402
+from dotenv import load_dotenv  # noqa: E402
+
+# .env must be loaded before the modules below read their settings
+load_dotenv(override=True)
+
+from jobs import TrainingQueue  # noqa: E402
+from metrics import HTTP_LATENCY, log, observe_training, render_metrics  # noqa: E402
+from stats import get_stats  # noqa: E402
+from clusters import get_clusters  # noqa: E402
+
+# pandas, scikit-learn and the training modules are imported on first use
+# (see warm_up) so the service answers /health before they load.
+# "background" warms up in a thread at startup, "eager" before serving the
+# first request, "off" on the first request that needs a model.
+ML_WARMUP = os.getenv("ML_WARMUP", "background")
 
 app = FastAPI()
 
@@ -13,7 +37,374 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-@app.post("/train")
-def train_endpoint():
-    result = train_model()
-    return result
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # Label by route template so /train/{job_id} stays one series
+        route = request.scope.get("route")
+        HTTP_LATENCY.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=status,
+        )
+
+# Milliseconds spent importing this module and warming up, for /health
+startup_timings = {}
+_warm_lock = threading.Lock()
+
+def warm_up():
+    """Import the ML stack and load the last saved model, once."""
+    with _warm_lock:
+        if "warmup_ms" in startup_timings:
+            return
+        started = time.perf_counter()
+        try:
+            from partitioned import load_partitioned_index, partitioning_enabled
+            from train import load_latest_state
+            # Serve the last trained model instead of retraining. With
+            # PARTITION_BY set, a global artifact left on disk would predict
+            # cluster ids businesses doesn't use, so only partitions load.
+            if partitioning_enabled():
+                load_partitioned_index()
+            else:
+                load_latest_state()
+        except Exception as e:
+            startup_timings["warmup_error"] = f"{type(e).__name__}: {e}"
+            log.warning(f"warm-up failed: {e}")
+        startup_timings["warmup_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        log.info(f"ML stack warmed up in {startup_timings['warmup_ms']} ms")
+
+@app.on_event("startup")
+def start_warm_up():
+    if ML_WARMUP == "eager":
+        warm_up()
+    elif ML_WARMUP == "background":
+        threading.Thread(target=warm_up, name="ml-warmup", daemon=True).start()
+
+@app.get("/health")
+def health_endpoint():
+    # Never imports the ML stack; "warm" turns true once warm_up() is done
+    warm = "warmup_ms" in startup_timings
+    model_loaded = False
+    if warm:
+        from model_state import get_state
+        from spatial_index import get_index
+        model_loaded = get_state() is not None or get_index() is not None
+    return {"status": "ok", "warm": warm, "model_loaded": model_loaded, **startup_timings}
+
+def run_training(events, full, force, on_stage):
+    # Webhook payloads / changed IDs are applied incrementally; a trigger
+    # without them runs the full pipeline, which is skipped when
+    # business_raw is unchanged unless forced.
+    from incremental import train_incremental
+    from partitioned import partitioning_enabled
+    from train import train_model
+
+    warm_up()
+    started = time.perf_counter()
+    result = None
+    try:
+        if partitioning_enabled():
+            result = run_partitioned(events, full, force, on_stage)
+        elif not full and events:
+            result = train_incremental(events, on_stage=on_stage)
+        else:
+            result = train_model(force=force, on_stage=on_stage)
+        return result
+    finally:
+        observe_training(result, time.perf_counter() - started)
+
+def run_partitioned(events, full, force, on_stage):
+    # With PARTITION_BY set, changes and ?partition= requests retrain only
+    # the regions involved; a plain trigger retrains every changed region
+    from incremental import resolve_changes
+    from partitioned import train_partitioned
+
+    if full or not events:
+        return train_partitioned(force=force, on_stage=on_stage)
+    keys = [key for event in events for key in event.get("partitions", [])]
+    changes = [event for event in events if "partitions" not in event]
+    changed_ids = set()
+    if changes:
+        records, deleted = resolve_changes(changes)
+        changed_ids = set(records) | deleted
+    return train_partitioned(
+        force=force, changed_ids=changed_ids, partitions=keys, on_stage=on_stage
+    )
+
+training_queue = TrainingQueue(run_training)
+
+@app.post("/train", status_code=202)
+def train_endpoint(
+    payload: Optional[Union[dict, list]] = Body(default=None),
+    full: bool = False,
+    force: bool = False,
+    profile: bool = False,
+    partition: Optional[List[str]] = Query(default=None),
+):
+    from incremental import has_changes
+    from partitioned import partitioning_enabled
+
+    events = []
+    if has_changes(payload):
+        events = payload if isinstance(payload, list) else [payload]
+    if partition:
+        if not partitioning_enabled():
+            raise HTTPException(status_code=400, detail="Partitioned training is not enabled (PARTITION_BY)")
+        events = events + [{"partitions": partition}]
+    job, coalesced = training_queue.submit(events, full=full, force=force, profile=profile)
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "coalesced": coalesced,
+        "status_url": f"/train/{job['job_id']}",
+    }
+
+
+@app.get("/train/{job_id}")
+def train_status_endpoint(job_id: str):
+    job = training_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown training job")
+    return job
+
+
+@app.get("/train/{job_id}/profile")
+def train_profile_endpoint(job_id: str):
+    # cProfile stats of a job queued with ?profile=true (open with pstats/snakeviz)
+    job = training_queue.get(job_id)
+    report = job and job.get("profile_report")
+    if not report or not os.path.exists(report["path"]):
+        raise HTTPException(status_code=404, detail="No profile for this job")
+    return FileResponse(report["path"], filename=f"train-{job_id}.prof")
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+def cached_response(request, body, etag, media_type="application/json"):
+    # 304 when the client already holds this version (If-None-Match)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    match = request.headers.get("if-none-match", "")
+    tags = {tag.strip().removeprefix("W/") for tag in match.split(",")}
+    if etag in tags or "*" in tags:
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+@app.get("/stats")
+def stats_endpoint(request: Request):
+    # Counts from the last training run
+    snapshot = get_stats()
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="No stats yet (train a model first)")
+    return cached_response(request, snapshot.body, snapshot.etag)
+
+
+@app.get("/clusters")
+def clusters_endpoint(request: Request):
+    # One row per cluster: center, population, category shares, mean
+    # distance/densities (business rows only carry the cluster id)
+    snapshot = get_clusters()
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="No clusters yet (train a model first)")
+    return cached_response(request, snapshot.body, snapshot.etag)
+
+
+def require_grid():
+    from opportunity_grid import get_grid
+
+    grid = get_grid()
+    if grid is None:
+        raise HTTPException(status_code=404, detail="No opportunity grid yet (train a model first)")
+    return grid
+
+
+@app.get("/opportunity/grid")
+def opportunity_grid_endpoint():
+    grid = require_grid()
+    return dict(grid.metadata(), tiles="/opportunity/tiles/{category}/{z}/{x}/{y}.png")
+
+
+@app.get("/opportunity/tiles/{category}/{z}/{x}/{y}.png")
+def opportunity_tile_endpoint(category: str, z: int, x: int, y: int, request: Request):
+    # Heatmap tiles for map libraries; {category} is a slug from /opportunity/grid
+    from opportunity_grid import encode_png
+
+    grid = require_grid()
+    if category not in grid.slugs:
+        raise HTTPException(status_code=404, detail=f"Unknown category: {category}")
+    if not (0 <= z <= 22 and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail="Tile out of range")
+
+    etag = f'"{grid.version:x}-{category}-{z}-{x}-{y}"'
+    png = encode_png(grid.tile(category, z, x, y))
+    return cached_response(request, png, etag, media_type="image/png")
+
+
+class BusinessPoint(BaseModel):
+    latitude: float
+    longitude: float
+    general_category: str
+    # Only used by models trained with FEATURE_ZONE=1
+    zone_type: Optional[str] = None
+
+
+def require_state():
+    warm_up()
+    from model_state import get_state
+    from partitioned import partitioning_enabled
+
+    if partitioning_enabled():
+        raise HTTPException(
+            status_code=409,
+            detail="Not available with PARTITION_BY set: each partition has its own model",
+        )
+    state = get_state()
+    if state is None:
+        raise HTTPException(status_code=503, detail="No trained model loaded")
+    return state
+
+
+@app.post("/predict")
+def predict_endpoint(points: List[BusinessPoint]):
+    import pandas as pd
+    from features import build_feature_matrix, center_coordinates, center_distances
+
+    state = require_state()
+    known = set(state.encoder.categories_[0])
+    unknown = {p.general_category for p in points} - known
+    if unknown:
+        raise HTTPException(
+            status_code=422, detail=f"Unknown categories: {sorted(unknown)}"
+        )
+
+    df = pd.DataFrame([p.dict() for p in points])
+    df["zone_type"] = df["zone_type"].fillna("")
+    features = build_feature_matrix(df, state.encoder, state.feature_weights)
+    clusters = state.kmeans.predict(features)
+    centers = state.kmeans.cluster_centers_
+    distances = center_distances(features, centers, clusters)
+    coords = center_coordinates(centers, state.feature_weights)
+
+    return {
+        "optimal_k": state.optimal_k,
+        "snapshot_hash": state.snapshot_hash,
+        "predictions": [
+            {
+                "cluster": int(cl),
+                "distance_to_center": float(dist),
+                "cluster_center": {
+                    "latitude": float(coords[cl][0]),
+                    "longitude": float(coords[cl][1]),
+                },
+            }
+            for cl, dist in zip(clusters, distances)
+        ],
+    }
+
+
+class RecommendRequest(BaseModel):
+    category: str
+    seed: Optional[int] = None
+    include_points: bool = False
+
+
+@app.post("/recommend")
+def recommend_endpoint(request: RecommendRequest):
+    from partitioned import partitioning_enabled, served_rows
+    from recommend import find_optimal_location
+
+    if partitioning_enabled():
+        # Merged rows of every partition, with their density features
+        warm_up()
+        snapshot = served_rows()
+        if snapshot is None:
+            raise HTTPException(status_code=503, detail="No trained model loaded")
+    else:
+        snapshot = require_state().snapshot
+    active = snapshot[snapshot["status"].astype(str).str.lower() == "active"]
+    if len(active) < 2:
+        raise HTTPException(status_code=503, detail="Not enough active businesses")
+
+    return find_optimal_location(
+        active,
+        request.category,
+        seed=request.seed,
+        include_points=request.include_points,
+    )
+
+
+class Coordinate(BaseModel):
+    latitude: float
+    longitude: float
+
+
+class NearbyRequest(BaseModel):
+    points: List[Coordinate]
+    radius_m: float = 500
+    category: Optional[str] = None
+    limit: Optional[int] = None
+    count_only: bool = False
+
+
+class NearestRequest(BaseModel):
+    points: List[Coordinate]
+    k: int = 1
+    category: Optional[str] = None
+
+
+def require_index():
+    warm_up()
+    from spatial_index import get_index
+
+    index = get_index()
+    if index is None:
+        raise HTTPException(status_code=503, detail="No trained model loaded")
+    return index
+
+
+def point_array(points):
+    import numpy as np
+
+    return np.array([[p.latitude, p.longitude] for p in points], dtype=float).reshape(-1, 2)
+
+
+def neighbour_results(index, hits):
+    return [
+        [{"business": index.business(pos), "distance_m": dist} for pos, dist in point_hits]
+        for point_hits in hits
+    ]
+
+
+@app.post("/nearby")
+def nearby_endpoint(request: NearbyRequest):
+    index = require_index()
+    points = point_array(request.points)
+    if request.count_only:
+        counts = index.count_within(points, request.radius_m, request.category)
+        return {"radius_m": request.radius_m, "counts": [int(c) for c in counts]}
+
+    hits = index.nearby(points, request.radius_m, request.category, request.limit)
+    return {"radius_m": request.radius_m, "results": neighbour_results(index, hits)}
+
+
+@app.post("/nearest")
+def nearest_endpoint(request: NearestRequest):
+    if request.k < 1:
+        raise HTTPException(status_code=422, detail="k must be at least 1")
+    index = require_index()
+    hits = index.nearest(point_array(request.points), request.k, request.category)
+    return {"k": request.k, "results": neighbour_results(index, hits)}
+
+
+startup_timings["import_ms"] = round((time.perf_counter() - _import_started) * 1000, 1)
@@ -0,0 +1,242 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import resource
+import sys
+import threading
+import time
+import weakref
+from bisect import bisect_left
+
+# How often StageProfiler samples the process RSS
+RSS_SAMPLE_SECONDS = float(os.getenv("RSS_SAMPLE_SECONDS", "0.02"))
+# Functions listed in a /train?profile=true summary
+PROFILE_TOP_FUNCTIONS = int(os.getenv("PROFILE_TOP_FUNCTIONS", "25"))
+
+# Level of the "ml" logger (warm-up, artifact and grid save warnings)
+ML_LOG_LEVEL = os.getenv("ML_LOG_LEVEL", "INFO").upper()
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+log = logging.getLogger("ml")
+if not log.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(levelname)s [ml] %(message)s"))
+    log.addHandler(_handler)
+    log.setLevel(ML_LOG_LEVEL)
+    log.propagate = False
+
+
+def current_rss_mb():
+    """Resident set size now (falls back to the peak where /proc is missing)."""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10)
+
+
+class StageProfiler:
+    """
+    Times the numbered stages of a training run.
+
+    start(name, rows) closes the previous stage, forwards the name to the
+    job queue's on_stage callback and starts timing the next one. A
+    background thread samples RSS so every stage gets its own peak.
+    """
+
+    def __init__(self, on_stage, sample_seconds=RSS_SAMPLE_SECONDS):
+        self.on_stage = on_stage
+        self.sample_seconds = sample_seconds
+        self.stages = {}
+        self._current = None
+        self._started = None
+        self._rows = None
+        self._peak = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def _record(self, rss):
+        with self._lock:
+            self._peak = max(self._peak, rss)
+
+    def start(self, name, rows=None):
+        self._close()
+        self.on_stage(name)
+        if self._sampler is None:
+            self._sampler = threading.Thread(
+                target=_sample_rss,
+                args=(weakref.ref(self), self._stop, self.sample_seconds),
+                name="rss-sampler",
+                daemon=True,
+            )
+            self._sampler.start()
+        with self._lock:
+            self._peak = current_rss_mb()
+        self._current = name
+        self._rows = rows
+        self._started = time.perf_counter()
+
+    def set_rows(self, rows):
+        """Row count of the running stage, when only known once it finishes."""
+        self._rows = rows
+
+    def _close(self):
+        if self._current is None:
+            return
+        seconds = time.perf_counter() - self._started
+        with self._lock:
+            peak = max(self._peak, current_rss_mb())
+        self.stages[self._current] = {
+            "seconds": round(seconds, 4),
+            "rows": self._rows,
+            "peak_rss_mb": round(peak, 1),
+        }
+        self._current = None
+
+    def summary(self):
+        """Close the running stage, stop sampling and return the per-stage dict."""
+        self._close()
+        self._stop.set()
+        return dict(self.stages)
+
+
+def _sample_rss(profiler_ref, stop, interval):
+    # Holds only a weak reference, so a run that raised before summary()
+    # still lets the sampler exit once the profiler is garbage collected
+    while not stop.wait(interval):
+        profiler = profiler_ref()
+        if profiler is None:
+            return
+        profiler._record(current_rss_mb())
+        del profiler
+
+
+def profile_call(fn, path, top=PROFILE_TOP_FUNCTIONS):
+    """
+    Run fn() under cProfile, dump the stats to `path` and return
+    (fn result, summary). The summary lists the slowest functions by
+    cumulative time.
+    """
+    profiler = cProfile.Profile()
+    try:
+        result = profiler.runcall(fn)
+    finally:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        profiler.dump_stats(path)
+
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(top)
+    return result, {"path": path, "top": text.getvalue()}
+
+
+# -----------------------------------------------------------------------------
+# Prometheus exposition (text format 0.0.4)
+# -----------------------------------------------------------------------------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Histogram:
+    """Minimal labelled Prometheus histogram (cumulative buckets, sum, count)."""
+
+    def __init__(self, name, documentation, buckets, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = sorted(buckets)
+        self.labelnames = tuple(labelnames)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            counts, total = self._series.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._series[key] = (counts, total + value)
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted(self._series.items())
+        for key, (counts, total) in series:
+            running = 0
+            for bound, count in zip(self.buckets + [float("inf")], counts):
+                running += count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {running}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {running}")
+        return "\n".join(lines)
+
+
+TRAINING_DURATION = Histogram(
+    "ml_training_duration_seconds",
+    "Wall time of training runs.",
+    [0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800],
+    ["mode", "status"],
+)
+TRAINING_ROWS = Histogram(
+    "ml_training_rows_processed",
+    "Rows processed per training run (active rows for full runs, changed rows for incremental ones).",
+    [10, 100, 1000, 10000, 100000, 1000000, 10000000],
+    ["mode"],
+)
+TRAINING_K = Histogram(
+    "ml_training_k_chosen",
+    "Number of clusters chosen by full training runs.",
+    [2, 3, 4, 5, 6, 7, 8, 9, 10],
+)
+HTTP_LATENCY = Histogram(
+    "ml_http_request_duration_seconds",
+    "HTTP request latency by route.",
+    [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10],
+    ["method", "route", "status"],
+)
+
+REGISTRY = [TRAINING_DURATION, TRAINING_ROWS, TRAINING_K, HTTP_LATENCY]
+
+
+def observe_training(result, seconds):
+    """Record a finished training run from its result dict."""
+    result = result if isinstance(result, dict) else {}
+    mode = result.get("mode", "full")
+    TRAINING_DURATION.observe(seconds, mode=mode, status=result.get("status", "failed"))
+    if result.get("status") != "success":
+        return
+    rows = result.get("changed") if mode == "incremental" else result.get("active_processed")
+    if rows is not None:
+        TRAINING_ROWS.observe(rows, mode=mode)
+    if mode == "full" and result.get("optimal_k") is not None:
+        TRAINING_K.observe(result["optimal_k"])
+
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in REGISTRY) + "\n"
@@ -0,0 +1,54 @@
+from dataclasses import dataclass
+import threading
+
+import pandas as pd
+
+from features import LEGACY_ROW_COLUMNS
+
+
+@dataclass
+class ModelState:
+    """Everything the last full training run produced that later runs reuse."""
+    encoder: object
+    kmeans: object
+    snapshot: pd.DataFrame
+    fit_rows: int
+    baseline_distance: float
+    snapshot_hash: str = None
+    optimal_k: int = None
+    zone_categories: list = None
+    changed_since_fit: int = 0
+    # Block weights build_feature_matrix used at fit time (None: unweighted)
+    feature_weights: dict = None
+
+
+def state_from_artifact(artifact):
+    """Rebuild a ModelState from a dict written by artifacts.save_artifact."""
+    return ModelState(
+        encoder=artifact["encoder"],
+        kmeans=artifact["kmeans"],
+        # Older runs stored per-cluster dicts on every row
+        snapshot=artifact["snapshot"].drop(columns=LEGACY_ROW_COLUMNS, errors="ignore"),
+        fit_rows=artifact["fit_rows"],
+        baseline_distance=artifact["baseline_distance"],
+        snapshot_hash=artifact["snapshot_hash"],
+        optimal_k=artifact["optimal_k"],
+        zone_categories=artifact.get("zone_categories"),
+        feature_weights=artifact.get("feature_weights"),
+        changed_since_fit=artifact.get("changed_since_fit", 0),
+    )
+
+
+_state = None
+_lock = threading.Lock()
+
+
+def get_state():
+    with _lock:
+        return _state
+
+
+def set_state(state):
+    global _state
+    with _lock:
+        _state = state
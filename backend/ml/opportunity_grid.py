@@ -0,0 +1,260 @@
+"""
+Precomputed opportunity-score heatmap per category.
+
+After each full training run the service area (the active businesses'
+bounding box plus a margin) is cut into square cells, and every cell gets
+the score computeOpportunityScore (frontend/utils/kmeans.ts) would give a
+business of each category placed there. All inputs are counted for every
+cell at once: businesses are binned into the grid and the bins are
+convolved with a disk of each radius (FFT), per category for competitors
+and per cluster for cluster strength. Scores are stored as one compressed
+array in ARTIFACT_DIR and served as 256px map tiles (PNG) by main.py.
+"""
+import math
+import os
+import re
+import struct
+import threading
+import zlib
+from datetime import datetime
+
+import numpy as np
+from scipy.signal import fftconvolve
+
+from artifacts import ARTIFACT_DIR
+
+OPPORTUNITY_GRID = os.getenv("OPPORTUNITY_GRID", "1") == "1"
+# Cell edge in meters; grown when the area would need more than
+# OPPORTUNITY_MAX_CELLS cells
+OPPORTUNITY_CELL_M = float(os.getenv("OPPORTUNITY_CELL_M", "25"))
+OPPORTUNITY_MAX_CELLS = int(os.getenv("OPPORTUNITY_MAX_CELLS", "250000"))
+OPPORTUNITY_PADDING_M = float(os.getenv("OPPORTUNITY_PADDING_M", "200"))
+# competitorCount: same-category businesses within this radius
+OPPORTUNITY_COMPETITOR_RADIUS_M = float(os.getenv("OPPORTUNITY_COMPETITOR_RADIUS_M", "200"))
+# clusterStrength: businesses of one cluster within this radius (strongest cluster)
+OPPORTUNITY_CLUSTER_RADIUS_M = float(os.getenv("OPPORTUNITY_CLUSTER_RADIUS_M", "100"))
+
+GRID_FILE = "opportunity-grid.npz"
+TILE_SIZE = 256
+METERS_PER_DEGREE = 111320.0
+# Scores are kept to 3 decimals, like computeOpportunityScore
+SCORE_SCALE = 1000
+# Heatmap ramp, low to high score
+RAMP = np.array([[220, 38, 38], [245, 158, 11], [16, 185, 129]], dtype=float)
+TILE_ALPHA = 160
+
+
+def category_slug(category):
+    """URL-safe category name ("Merchandise / Trading" -> "merchandise-trading")."""
+    return re.sub(r"[^a-z0-9]+", "-", str(category).lower()).strip("-")
+
+
+def opportunity_score(competitors, density_50m, density_100m, density_200m, cluster_strength):
+    """computeOpportunityScore over arrays."""
+    comp = np.clip(1 - competitors / 5, 0, 1)
+    density = np.minimum(1, (density_50m * 0.5 + density_100m * 0.3 + density_200m * 0.2) / 20)
+    cluster = np.minimum(1, cluster_strength / 5)
+    return np.round(comp * 0.45 + density * 0.30 + cluster * 0.25, 3)
+
+
+def grid_spec(lat, lng, cell_m=OPPORTUNITY_CELL_M, padding_m=OPPORTUNITY_PADDING_M,
+              max_cells=OPPORTUNITY_MAX_CELLS):
+    """Origin, cell size (degrees) and shape of a grid covering the points."""
+    mid = math.radians((lat.min() + lat.max()) / 2)
+    height_m = (lat.max() - lat.min()) * METERS_PER_DEGREE + 2 * padding_m
+    width_m = (lng.max() - lng.min()) * METERS_PER_DEGREE * math.cos(mid) + 2 * padding_m
+    cell_m = max(cell_m, math.sqrt(height_m * width_m / max_cells))
+    dlat = cell_m / METERS_PER_DEGREE
+    dlng = cell_m / (METERS_PER_DEGREE * math.cos(mid))
+    return {
+        "lat0": float(lat.min() - padding_m / METERS_PER_DEGREE),
+        "lng0": float(lng.min() - padding_m / (METERS_PER_DEGREE * math.cos(mid))),
+        "dlat": dlat,
+        "dlng": dlng,
+        "cell_m": cell_m,
+        "rows": int(math.ceil(height_m / cell_m)) + 1,
+        "cols": int(math.ceil(width_m / cell_m)) + 1,
+    }
+
+
+def _disk(radius_m, cell_m):
+    reach = int(math.ceil(radius_m / cell_m))
+    offsets = np.arange(-reach, reach + 1) * cell_m
+    return (offsets[:, None] ** 2 + offsets[None, :] ** 2 <= radius_m ** 2).astype(float)
+
+
+def neighbour_counts(spec, lat, lng, radius_m, groups=None, n_groups=1):
+    """
+    (n_groups, rows, cols) counts of points within radius_m of each cell
+    center, per group. Points are snapped to their cell first, so counts
+    are exact to about half a cell.
+    """
+    rows, cols = spec["rows"], spec["cols"]
+    r = np.clip(((lat - spec["lat0"]) / spec["dlat"]).astype(int), 0, rows - 1)
+    c = np.clip(((lng - spec["lng0"]) / spec["dlng"]).astype(int), 0, cols - 1)
+    groups = np.zeros(len(lat), dtype=int) if groups is None else groups
+    bins = np.bincount(
+        (groups * rows + r) * cols + c, minlength=n_groups * rows * cols
+    ).reshape(n_groups, rows, cols).astype(float)
+    kernel = _disk(radius_m, spec["cell_m"])[None]
+    return np.maximum(np.rint(fftconvolve(bins, kernel, mode="same", axes=(1, 2))), 0)
+
+
+class OpportunityGrid:
+    """Scores (categories x rows x cols, uint16 thousandths) plus the grid spec."""
+
+    def __init__(self, spec, categories, scores, snapshot_hash=None, generated_at=None):
+        self.spec = spec
+        self.categories = list(categories)
+        self.slugs = {category_slug(c): i for i, c in enumerate(self.categories)}
+        self.scores = scores
+        self.snapshot_hash = snapshot_hash
+        self.generated_at = generated_at or datetime.utcnow().isoformat() + "Z"
+        self.version = zlib.crc32(f"{snapshot_hash}:{self.generated_at}".encode("utf-8"))
+
+    def metadata(self):
+        spec = self.spec
+        return {
+            "categories": [
+                {"name": c, "slug": category_slug(c)} for c in self.categories
+            ],
+            "bounds": {
+                "south": spec["lat0"],
+                "west": spec["lng0"],
+                "north": spec["lat0"] + spec["rows"] * spec["dlat"],
+                "east": spec["lng0"] + spec["cols"] * spec["dlng"],
+            },
+            "cell_m": round(spec["cell_m"], 2),
+            "rows": spec["rows"],
+            "cols": spec["cols"],
+            "snapshot_hash": self.snapshot_hash,
+            "generated_at": self.generated_at,
+        }
+
+    def tile(self, slug, z, x, y, size=TILE_SIZE):
+        """RGBA heatmap of one web-mercator tile (transparent outside the grid)."""
+        index = self.slugs[slug]
+        if not self.intersects(z, x, y):
+            return np.zeros((size, size, 4), dtype=np.uint8)
+        n = 2 ** z
+        px = (x + (np.arange(size) + 0.5) / size) / n
+        py = (y + (np.arange(size) + 0.5) / size) / n
+        lng = px * 360 - 180
+        lat = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * py))))
+        r = np.floor((lat - self.spec["lat0"]) / self.spec["dlat"]).astype(int)
+        c = np.floor((lng - self.spec["lng0"]) / self.spec["dlng"]).astype(int)
+        inside = ((r >= 0) & (r < self.spec["rows"]))[:, None] & ((c >= 0) & (c < self.spec["cols"]))[None, :]
+
+        score = self.scores[index][
+            np.clip(r, 0, self.spec["rows"] - 1)[:, None], np.clip(c, 0, self.spec["cols"] - 1)[None, :]
+        ] / SCORE_SCALE
+        # Piecewise-linear ramp between the RAMP stops
+        position = score * (len(RAMP) - 1)
+        low = np.minimum(position.astype(int), len(RAMP) - 2)
+        frac = (position - low)[..., None]
+        rgb = RAMP[low] * (1 - frac) + RAMP[low + 1] * frac
+        rgba = np.zeros((size, size, 4), dtype=np.uint8)
+        rgba[..., :3] = np.rint(rgb)
+        rgba[..., 3] = np.where(inside, TILE_ALPHA, 0)
+        return rgba
+
+    def intersects(self, z, x, y):
+        n = 2 ** z
+        west, east = x / n * 360 - 180, (x + 1) / n * 360 - 180
+        north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+        south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+        bounds = self.metadata()["bounds"]
+        return not (east < bounds["west"] or west > bounds["east"]
+                    or north < bounds["south"] or south > bounds["north"])
+
+
+def build_grid(df_active, snapshot_hash=None):
+    """Score every cell of the service area for every category of df_active."""
+    lat = df_active["latitude"].to_numpy(dtype=float)
+    lng = df_active["longitude"].to_numpy(dtype=float)
+    spec = grid_spec(lat, lng)
+
+    density = {
+        radius: neighbour_counts(spec, lat, lng, radius)[0]
+        for radius in (50, 100, 200)
+    }
+    categories, category_codes = np.unique(
+        df_active["general_category"].astype(str).to_numpy(), return_inverse=True
+    )
+    competitors = neighbour_counts(
+        spec, lat, lng, OPPORTUNITY_COMPETITOR_RADIUS_M, category_codes, len(categories)
+    )
+    cluster_codes = np.unique(df_active["cluster"].astype(int).to_numpy(), return_inverse=True)[1]
+    strength = neighbour_counts(
+        spec, lat, lng, OPPORTUNITY_CLUSTER_RADIUS_M, cluster_codes, cluster_codes.max() + 1
+    ).max(axis=0)
+
+    scores = opportunity_score(
+        competitors, density[50][None], density[100][None], density[200][None], strength[None]
+    )
+    return OpportunityGrid(
+        spec, categories, np.rint(scores * SCORE_SCALE).astype(np.uint16), snapshot_hash
+    )
+
+
+def encode_png(rgba):
+    """Minimal 8-bit RGBA PNG (no Pillow needed)."""
+    height, width, _ = rgba.shape
+    # Filter type 0 (none) in front of every scanline
+    raw = np.concatenate(
+        [np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)], axis=1
+    ).tobytes()
+
+    def chunk(tag, data):
+        return (struct.pack(">I", len(data)) + tag + data
+                + struct.pack(">I", zlib.crc32(tag + data) & 0xFFFFFFFF))
+
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(raw, 6))
+            + chunk(b"IEND", b""))
+
+
+_grid = None
+_loaded = False
+_lock = threading.Lock()
+
+
+def _path(artifact_dir):
+    return os.path.join(artifact_dir or ARTIFACT_DIR, GRID_FILE)
+
+
+def save_grid(grid, artifact_dir=None):
+    """Make `grid` current and write it next to the model artifacts (atomically)."""
+    global _grid, _loaded
+    with _lock:
+        _grid, _loaded = grid, True
+    path = _path(artifact_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp.npz"
+    np.savez_compressed(
+        tmp,
+        scores=grid.scores,
+        categories=np.array(grid.categories, dtype=object),
+        spec=np.array([grid.spec], dtype=object),
+        meta=np.array([grid.snapshot_hash, grid.generated_at], dtype=object),
+    )
+    os.replace(tmp, path)
+    return path
+
+
+def get_grid(artifact_dir=None):
+    """Current OpportunityGrid (read from disk on first use), or None."""
+    global _grid, _loaded
+    with _lock:
+        if not _loaded:
+            _loaded = True
+            try:
+                with np.load(_path(artifact_dir), allow_pickle=True) as data:
+                    snapshot, generated_at = data["meta"]
+                    _grid = OpportunityGrid(
+                        data["spec"][0], data["categories"], data["scores"], snapshot, generated_at
+                    )
+            except (OSError, KeyError, ValueError):
+                _grid = None
+        return _grid
@@ -0,0 +1,476 @@
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from artifacts import ARTIFACT_DIR, snapshot_hash
+from data_source import RAW_COLUMNS, load_business_raw
+from features import (
+    ENHANCED_COLUMNS,
+    LEGACY_ROW_COLUMNS,
+    build_enhanced_features,
+    build_feature_matrix,
+    default_feature_weights,
+    fit_encoder,
+    radius_densities,
+)
+from kselect import select_k
+from large_mode import LARGE_MODE_SAMPLE_ROWS, stratified_sample, use_large_mode
+from metrics import StageProfiler, log, peak_rss_mb
+from model_state import ModelState, set_state
+from opportunity_grid import OPPORTUNITY_GRID, build_grid, save_grid
+from spatial_index import build_index, set_index
+from normalize import normalize_businesses, write_quarantine
+from publish import (
+    load_published_rows,
+    publish_clusters,
+    publish_snapshot,
+    upsert_changed_rows,
+)
+from snapshot_cache import load_snapshot
+from stats import carry_clusters, compute_stats, get_stats, save_stats
+from clusters import (
+    carry_summaries,
+    cluster_centers,
+    cluster_summaries,
+    get_clusters,
+    save_clusters,
+)
+from supabase_client import get_client
+from train import QUARANTINE_PATH, ignore_stage
+from warm_start import fit_clusters, previous_clusters
+
+# "" trains one global model (train_model). "tiles" partitions by a lat/lng
+# grid; any other value names a business_raw column (e.g. barangay) whose
+# values are the partitions.
+PARTITION_BY = os.getenv("PARTITION_BY", "")
+# Tile edge in degrees (0.05 is about 5.5 km). The grid is anchored at 0,0
+# rather than at the data's bounding box so tile keys stay stable as the
+# covered area grows.
+PARTITION_TILE_DEGREES = float(os.getenv("PARTITION_TILE_DEGREES", "0.05"))
+PARTITION_WORKERS = int(os.getenv("PARTITION_WORKERS", str(os.cpu_count() or 1)))
+PARTITION_DIR = os.getenv("ML_PARTITION_DIR", os.path.join(ARTIFACT_DIR, "partitions"))
+# Published cluster = partition index * stride + cluster within the partition
+PARTITION_CLUSTER_STRIDE = 100
+
+MANIFEST = "manifest.json"
+MEMBERSHIP = "membership.joblib"
+
+_served_rows = None
+_served_lock = threading.Lock()
+
+
+def partitioning_enabled():
+    return bool(PARTITION_BY)
+
+
+def partition_keys(df, by=PARTITION_BY, tile_degrees=PARTITION_TILE_DEGREES):
+    """Partition key of every row: "tile:<row>:<col>" or the `by` column's value."""
+    if by != "tiles":
+        return df[by].astype(str).to_numpy(dtype=object)
+    cells = np.column_stack([
+        np.floor(df["latitude"].to_numpy(dtype=float) / tile_degrees),
+        np.floor(df["longitude"].to_numpy(dtype=float) / tile_degrees),
+    ]).astype(np.int64)
+    tiles, inverse = np.unique(cells, axis=0, return_inverse=True)
+    names = np.array([f"tile:{row}:{col}" for row, col in tiles], dtype=object)
+    return names[inverse.ravel()]
+
+
+def _file_name(key, digest):
+    return f"{re.sub(r'[^A-Za-z0-9_.-]', '_', key)}-{digest[:12]}.joblib"
+
+
+def load_manifest(partition_dir=None):
+    """Partitions of the last run ({} when the partitioning setting changed)."""
+    partition_dir = partition_dir or PARTITION_DIR
+    path = os.path.join(partition_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("by") != PARTITION_BY or manifest.get("tile_degrees") != PARTITION_TILE_DEGREES:
+        return {}
+    return manifest["partitions"]
+
+
+def partition_rows(partition_dir=None, manifest=None):
+    """Every saved partition's rows, merged (None without saved partitions)."""
+    partition_dir = partition_dir or PARTITION_DIR
+    manifest = load_manifest(partition_dir) if manifest is None else manifest
+    frames = []
+    for info in manifest.values():
+        path = os.path.join(partition_dir, info.get("file", ""))
+        if os.path.isfile(path):
+            rows = joblib.load(path)["rows"]
+            frames.append(rows.drop(columns=LEGACY_ROW_COLUMNS, errors="ignore"))
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def serve_partitions(rows):
+    """
+    Serve the merged partition rows: /recommend scores them, the spatial
+    index (/nearby, /nearest) is built from them, and no ModelState is set,
+    since partition-scoped cluster ids have no single model to predict them.
+    """
+    global _served_rows
+    set_state(None)
+    with _served_lock:
+        _served_rows = rows
+    set_index(None if rows is None else build_index(rows))
+
+
+def served_rows():
+    """The merged rows of every partition being served, or None."""
+    with _served_lock:
+        return _served_rows
+
+
+def load_partitioned_index(partition_dir=None):
+    """Warm-load the last partitioned run (instead of any global artifact)."""
+    rows = partition_rows(partition_dir)
+    serve_partitions(rows)
+    return rows
+
+
+def _load_membership(partition_dir):
+    path = os.path.join(partition_dir, MEMBERSHIP)
+    if not os.path.exists(path):
+        return pd.Series([], dtype=object)
+    return joblib.load(path)
+
+
+def _save(partition_dir, partitions, membership, models):
+    os.makedirs(partition_dir, exist_ok=True)
+    for key, (model, rows) in models.items():
+        joblib.dump({**model, "rows": rows}, os.path.join(partition_dir, partitions[key]["file"]))
+    joblib.dump(membership, os.path.join(partition_dir, MEMBERSHIP))
+
+    path = os.path.join(partition_dir, MANIFEST)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({
+            "by": PARTITION_BY,
+            "tile_degrees": PARTITION_TILE_DEGREES,
+            "partitions": partitions,
+        }, f)
+    os.replace(tmp, path)
+
+    keep = {info["file"] for info in partitions.values()} | {MANIFEST, MEMBERSHIP}
+    for name in os.listdir(partition_dir):
+        if name.endswith(".joblib") and name not in keep:
+            try:
+                os.remove(os.path.join(partition_dir, name))
+            except OSError:
+                pass
+
+
+def previous_partition(path, offset):
+    """
+    The partition model saved at `path` as a ModelState with local cluster
+    ids (published id - offset), or None when there is none.
+    """
+    if path is None or not os.path.isfile(path):
+        return None
+    try:
+        stored = joblib.load(path)
+    except (OSError, EOFError, ValueError):
+        return None
+    if "kmeans" not in stored:
+        return None
+    rows = stored["rows"].drop(columns=LEGACY_ROW_COLUMNS, errors="ignore").copy()
+    rows["cluster"] = pd.to_numeric(rows["cluster"], errors="coerce") - offset
+    return ModelState(
+        encoder=stored["encoder"],
+        kmeans=stored["kmeans"],
+        snapshot=rows,
+        fit_rows=len(rows),
+        baseline_distance=float("nan"),
+        feature_weights=stored["feature_weights"],
+    )
+
+
+def fit_partition(key, active, previous_path=None, offset=0):
+    """
+    Cluster one partition's active rows with its own encoder and k
+    selection (runs in a worker process). The fit starts from the model
+    saved at previous_path and keeps its cluster ids, like train_model.
+    Returns (key, active rows with the cluster-level enhanced columns,
+    model dict).
+    """
+    weights = default_feature_weights()
+    encoder = fit_encoder(active)
+    features = build_feature_matrix(active, encoder, weights)
+    n = len(active)
+
+    large = use_large_mode(n)
+    if n < 2:
+        k_selection = {"k": 1, "rule": None, "ks": [], "inertias": [], "fitted": 0, "cached": 0}
+    else:
+        sample = stratified_sample(active, LARGE_MODE_SAMPLE_ROWS) if large else None
+        # Partitions already run in parallel, so each sweep stays sequential
+        k_selection = select_k(
+            features if sample is None else features[sample], range(2, min(10, n)), n_jobs=1
+        )
+    k = k_selection["k"]
+
+    previous_centers, previous_counts = previous_clusters(
+        previous_partition(previous_path, offset), encoder, weights
+    )
+    kmeans, clusters, warm_start = fit_clusters(
+        features, k, large, previous_centers, previous_counts
+    )
+
+    zone_categories = sorted(active["zone_type"].astype(object).unique())
+    build_enhanced_features(active, features, kmeans.cluster_centers_, clusters, zone_categories)
+    return key, active, {
+        "encoder": encoder,
+        "kmeans": kmeans,
+        "k": int(k),
+        "k_selection": k_selection,
+        "zone_categories": zone_categories,
+        "feature_weights": weights,
+        "fit_mode": "minibatch" if large else "exact",
+        "warm_start": warm_start,
+    }
+
+
+def _fit_all(jobs, workers=PARTITION_WORKERS):
+    workers = max(1, min(workers, len(jobs)))
+    with Parallel(n_jobs=workers, backend="loky" if workers > 1 else "sequential") as pool:
+        return pool(delayed(fit_partition)(*job) for job in jobs)
+
+
+def train_partitioned(force=False, changed_ids=None, partitions=None, on_stage=ignore_stage,
+                      client=None, partition_dir=None):
+    """
+    Cluster every partition (region or tile) separately and merge the
+    results into businesses with partition-scoped cluster ids.
+
+    A plain run retrains only partitions whose rows changed since the last
+    run (all of them with `force`) and republishes the whole table
+    atomically. With `changed_ids` or `partitions` only the partitions
+    holding those businesses (now or at the last run) are retrained, and
+    only their rows are upserted; other regions are left untouched.
+    """
+    client = client or get_client()
+    partition_dir = partition_dir or PARTITION_DIR
+    stages = StageProfiler(on_stage)
+    targeted = changed_ids is not None or partitions is not None
+
+    stages.start("fetch")
+    if PARTITION_BY == "tiles":
+        df = load_snapshot(client)
+    else:
+        # The snapshot cache only holds RAW_COLUMNS
+        df = load_business_raw(client, f"{RAW_COLUMNS}, {PARTITION_BY}")
+    stages.set_rows(0 if df is None else len(df))
+    if df is None or len(df) == 0:
+        return {
+            "status": "error",
+            "trigger": "raw_data_change",
+            "mode": "partitioned",
+            "stages": stages.summary(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "message": "No rows found in business_raw"
+        }
+
+    stages.start("normalize", rows=len(df))
+    df, rejected = normalize_businesses(df)
+    quarantined = write_quarantine(rejected, QUARANTINE_PATH)
+    df["partition_key"] = partition_keys(df)
+    if PARTITION_BY != "tiles":
+        df = df.drop(columns=[PARTITION_BY])
+
+    stages.start("partition", rows=len(df))
+    known = load_manifest(partition_dir)
+    membership = _load_membership(partition_dir) if known else pd.Series([], dtype=object)
+    groups = df.groupby("partition_key", sort=True).indices
+    hashes = {key: snapshot_hash(df.iloc[positions]) for key, positions in groups.items()}
+
+    if targeted:
+        targets = set(partitions or [])
+        if changed_ids:
+            ids = pd.Index(list(changed_ids))
+            targets |= set(df.loc[df["business_id"].isin(ids), "partition_key"])
+            targets |= set(membership[membership.index.isin(ids)])
+    else:
+        targets = {
+            key for key in groups
+            if force or known.get(key, {}).get("hash") != hashes[key]
+            or not os.path.exists(os.path.join(partition_dir, known[key]["file"]))
+        }
+    dropped = set(known) - set(groups) if not targeted else targets - set(groups)
+    retrain = sorted(targets & set(groups))
+
+    if not targeted and not retrain and not dropped:
+        return {
+            "status": "skipped",
+            "trigger": "raw_data_change",
+            "mode": "partitioned",
+            "partitions": len(groups),
+            "stages": stages.summary(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "message": "business_raw unchanged since last training run"
+        }
+
+    # Stable partition indices keep published cluster ids unchanged for
+    # regions that are not retrained
+    next_index = max((info["index"] for info in known.values()), default=-1) + 1
+    manifest = {key: dict(info) for key, info in known.items() if key not in dropped}
+    for key in retrain:
+        if key not in manifest:
+            manifest[key] = {"index": next_index}
+            next_index += 1
+
+    stages.start("fit", rows=sum(len(groups[key]) for key in retrain))
+    jobs = []
+    for key in retrain:
+        part = df.iloc[groups[key]]
+        # Each fit starts from the partition's last model (same index, so
+        # the same published ids)
+        previous = known.get(key, {}).get("file")
+        jobs.append((
+            key,
+            part[part["status"] == "active"].copy(),
+            previous and os.path.join(partition_dir, previous),
+            manifest[key]["index"] * PARTITION_CLUSTER_STRIDE,
+        ))
+    models = {}
+    fitted = {}
+    centers = {}
+    for key, active, model in _fit_all([job for job in jobs if len(job[1])]):
+        offset = manifest[key]["index"] * PARTITION_CLUSTER_STRIDE
+        active["cluster"] = active["cluster"] + offset
+        fitted[key] = active
+        models[key] = model
+        centers.update(cluster_centers(model["kmeans"], model["feature_weights"], offset))
+
+    # Partitions with no active rows still publish their inactive ones
+    frames = {}
+    for key in retrain:
+        part = df.iloc[groups[key]]
+        # No all-None ML columns: the concat leaves them empty (see train.py)
+        inactive = part[part["status"] != "active"]
+        frames[key] = pd.concat(
+            [frame for frame in (fitted.get(key), inactive) if frame is not None and len(frame)],
+            ignore_index=True,
+        )
+    if not targeted:
+        # Unchanged partitions reuse their last results
+        for key in sorted(set(groups) - set(retrain)):
+            stored = joblib.load(os.path.join(partition_dir, manifest[key]["file"]))
+            frames[key] = stored["rows"].drop(columns=LEGACY_ROW_COLUMNS, errors="ignore")
+            if "kmeans" in stored:
+                centers.update(cluster_centers(
+                    stored["kmeans"], stored["feature_weights"],
+                    manifest[key]["index"] * PARTITION_CLUSTER_STRIDE,
+                ))
+
+    stages.start("densities")
+    # Radius densities are counted against every active business, so
+    # neighbours across a partition border still count
+    basis = df[df["status"] == "active"].reset_index(drop=True)
+    rows = pd.concat(list(frames.values()), ignore_index=True)
+    # Runs that only touched inactive rows still publish (empty) ML columns
+    rows = rows.reindex(columns=[
+        *rows.columns, *[column for column in ENHANCED_COLUMNS if column not in rows.columns]
+    ])
+    active_rows = np.flatnonzero((rows["status"] == "active").to_numpy())
+    positions = pd.Index(basis["business_id"]).get_indexer(rows["business_id"].to_numpy()[active_rows])
+    stages.set_rows(len(positions))
+    for column, values in radius_densities(basis, positions).items():
+        column_values = np.full(len(rows), None, dtype=object)
+        column_values[active_rows] = values
+        rows[column] = column_values
+    summaries = cluster_summaries(rows.iloc[active_rows], centers)
+
+    stages.start("publish", rows=len(rows))
+    if targeted:
+        previous = set(membership[membership.isin(targets)].index) | set(changed_ids or ())
+        removed = previous - set(df["business_id"])
+        # Only rows that differ from what businesses holds are written
+        published = load_published_rows(
+            client, ", ".join(rows.columns), set(rows["business_id"]) | removed
+        )
+        publish = upsert_changed_rows(client, rows, published, deleted_ids=removed)
+    else:
+        publish = publish_snapshot(client, rows)
+    # Targeted runs only own the clusters of the partitions they replaced
+    replaced = {manifest[key]["index"] for key in retrain}
+    replaced |= {known[key]["index"] for key in dropped if key in known}
+    owned = (lambda cluster: cluster // PARTITION_CLUSTER_STRIDE in replaced) if targeted else None
+    cluster_publish = publish_clusters(client, summaries, owned)
+
+    stages.start("persist", rows=len(rows))
+    for key in retrain:
+        manifest[key].update(
+            hash=hashes[key],
+            rows=len(groups[key]),
+            k=models[key]["k"] if key in models else 0,
+            file=_file_name(key, hashes[key]),
+            trained_at=datetime.utcnow().isoformat() + "Z",
+        )
+    saved = {key: (models.get(key, {}), frames[key]) for key in retrain}
+    membership = pd.Series(df["partition_key"].to_numpy(), index=df["business_id"].to_numpy())
+    try:
+        _save(partition_dir, manifest, membership, saved)
+    except OSError as e:
+        log.warning(f"could not save partition models: {e}")
+    stats = compute_stats(df, clustered=rows)
+    if targeted:
+        # Clusters of partitions this run did not touch keep their counts
+        # and summaries
+        previous = get_stats()
+        carry_clusters(
+            stats, previous and previous.stats,
+            lambda cluster: cluster // PARTITION_CLUSTER_STRIDE not in replaced,
+        )
+        previous = get_clusters()
+        summaries = carry_summaries(
+            summaries, previous and previous.stats["clusters"],
+            lambda cluster: cluster // PARTITION_CLUSTER_STRIDE not in replaced,
+        )
+    save_stats(stats)
+    save_clusters(summaries)
+    # Targeted runs only hold their own partitions' rows
+    merged = partition_rows(partition_dir, manifest) if targeted else rows
+    serve_partitions(merged)
+
+    grid_shape = None
+    if OPPORTUNITY_GRID and merged is not None:
+        stages.start("opportunity", rows=len(merged))
+        grid = build_grid(merged[merged["status"] == "active"])
+        grid_shape = list(grid.scores.shape)
+        try:
+            save_grid(grid)
+        except OSError as e:
+            log.warning(f"could not save opportunity grid: {e}")
+
+    return {
+        "status": "success",
+        "trigger": "raw_data_change",
+        "mode": "partitioned",
+        "partition_by": PARTITION_BY,
+        "partitions": len(groups),
+        "retrained": retrain,
+        "dropped": sorted(dropped),
+        "partition_k": {key: manifest[key]["k"] for key in retrain},
+        "partition_warm_start": {key: models[key]["warm_start"] for key in sorted(models)},
+        "active_processed": int(sum(len(frame) for frame in fitted.values())),
+        "quarantined": quarantined,
+        "rows_written": publish["rows"],
+        "rows_unchanged": publish["unchanged"],
+        "clusters_written": cluster_publish["clusters"],
+        "opportunity_grid": grid_shape,
+        "enhanced_table": "businesses",
+        "stages": stages.summary(),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "timestamp": datetime.utcnow().isoformat() + "Z"
+    }
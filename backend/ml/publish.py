@@ -0,0 +1,388 @@
+import math
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_source import iter_business_raw_pages
+
+STAGING_TABLE = "businesses_staging"
+SWAP_FUNCTION = "swap_businesses_staging"
+MERGE_FUNCTION = "merge_businesses_staging"
+# One row per cluster (clusters.py), keyed on cluster_id
+CLUSTER_TABLE = "business_clusters"
+
+PUBLISH_BATCH_SIZE = int(os.getenv("PUBLISH_BATCH_SIZE", "1000"))
+PUBLISH_CONCURRENCY = int(os.getenv("PUBLISH_CONCURRENCY", "4"))
+PUBLISH_RETRIES = int(os.getenv("PUBLISH_RETRIES", "3"))
+PUBLISH_BACKOFF_SECONDS = float(os.getenv("PUBLISH_BACKOFF_SECONDS", "0.5"))
+# Full publishes write only the rows that differ from what businesses
+# already holds (0: stage and swap in every row)
+PUBLISH_DIFF = os.getenv("PUBLISH_DIFF", "1") == "1"
+# Numbers (distances, coordinates, shares inside JSON columns) closer than
+# this count as unchanged
+PUBLISH_FLOAT_TOLERANCE = float(os.getenv("PUBLISH_FLOAT_TOLERANCE", "1e-6"))
+
+
+def _clean_value(value):
+    """JSON can't carry NaN, so missing ML columns are sent as null."""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _chunks(rows, size):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+
+def _with_retries(fn, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            return fn()
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+
+def _is_missing(value):
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def same_value(a, b, tolerance=PUBLISH_FLOAT_TOLERANCE):
+    """Equality for published values: floats within tolerance, JSON recursively."""
+    if _is_missing(a) or _is_missing(b):
+        return _is_missing(a) and _is_missing(b)
+    if isinstance(a, (int, float, np.number)) and isinstance(b, (int, float, np.number)):
+        return abs(float(a) - float(b)) <= tolerance
+    if isinstance(a, dict) and isinstance(b, dict):
+        return a.keys() == b.keys() and all(same_value(a[k], b[k], tolerance) for k in a)
+    if isinstance(a, (list, tuple)) and isinstance(b, (list, tuple)):
+        return len(a) == len(b) and all(same_value(x, y, tolerance) for x, y in zip(a, b))
+    return a == b
+
+
+def _numeric(values):
+    """values as a float array, or None if the column isn't numeric."""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return None
+    try:
+        return pd.to_numeric(values, errors="raise").to_numpy(dtype=float)
+    except (TypeError, ValueError):
+        return None
+
+
+def diff_published(df, published, tolerance=PUBLISH_FLOAT_TOLERANCE):
+    """
+    Compare new rows with the rows businesses holds now, by business_id.
+
+    Returns (changed, removed): a boolean mask over df of rows that are new
+    or differ in any of df's columns, and the business_ids only published
+    has.
+    """
+    new_ids = df["business_id"].to_numpy()
+    if published is None or len(published) == 0:
+        return np.ones(len(df), dtype=bool), []
+
+    published = published[published["business_id"].notna()]
+    published = published.drop_duplicates("business_id", keep="last").reset_index(drop=True)
+    positions = pd.Index(published["business_id"].astype("int64")).get_indexer(new_ids)
+    changed = positions == -1
+    matched = np.flatnonzero(~changed)
+    removed = sorted(set(published["business_id"].astype("int64")) - set(new_ids.tolist()))
+
+    for column in df.columns:
+        if column == "business_id":
+            continue
+        if column not in published.columns:
+            changed[:] = True
+            break
+        ours = df[column].iloc[matched].reset_index(drop=True)
+        theirs = published[column].iloc[positions[matched]].reset_index(drop=True)
+        a, b = _numeric(ours), _numeric(theirs)
+        if a is not None and b is not None:
+            with np.errstate(invalid="ignore"):
+                same = (np.isnan(a) & np.isnan(b)) | (np.abs(a - b) <= tolerance)
+        else:
+            a, b = ours.astype(object).to_numpy(), theirs.astype(object).to_numpy()
+            same = a == b
+            # Exact equality settles most rows; the rest (NaN, floats in
+            # JSON) are compared one by one
+            for i in np.flatnonzero(~same):
+                same[i] = same_value(a[i], b[i], tolerance)
+        changed[matched[~same]] = True
+    return changed, [int(i) for i in removed]
+
+
+def load_published(client, columns):
+    """Every row of businesses (the given columns) as a DataFrame."""
+    frames = [
+        pd.DataFrame.from_records(page)
+        for page in iter_business_raw_pages(client, columns, table="businesses")
+    ]
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def _stage(client, rows, run_id, batch_size, concurrency, retries, backoff):
+    """Write rows to the staging table under run_id; returns the batch count."""
+    staged = [
+        {**{k: _clean_value(v) for k, v in row.items()}, "run_id": run_id}
+        for row in rows
+    ]
+    batches = list(_chunks(staged, max(1, batch_size)))
+
+    def write(batch):
+        return _with_retries(
+            lambda: client.table(STAGING_TABLE).insert(batch).execute(),
+            retries,
+            backoff,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        # list() re-raises the first failed batch
+        list(pool.map(write, batches))
+    return len(batches)
+
+
+def _drop_run(client, run_id):
+    try:
+        client.table(STAGING_TABLE).delete().eq("run_id", run_id).execute()
+    except Exception:
+        pass
+
+
+def publish_changed_rows(
+    client,
+    df,
+    tolerance=PUBLISH_FLOAT_TOLERANCE,
+    batch_size=PUBLISH_BATCH_SIZE,
+    concurrency=PUBLISH_CONCURRENCY,
+    retries=PUBLISH_RETRIES,
+    backoff=PUBLISH_BACKOFF_SECONDS,
+):
+    """
+    Publish a full snapshot (a DataFrame of enhanced rows) by writing only
+    what changed.
+
+    businesses is read back and diffed with diff_published(). Changed and
+    new rows are staged under a fresh run_id and merged in, together with
+    the deletions, by one database call, so the publish stays atomic while
+    realtime subscribers only see events for rows that really changed. An
+    unchanged snapshot makes no writes at all.
+    """
+    published = load_published(client, ", ".join(df.columns))
+    changed, removed = diff_published(df, published, tolerance)
+    result = {
+        "run_id": None,
+        "rows": int(changed.sum()),
+        "deleted": len(removed),
+        "unchanged": int(len(df) - changed.sum()),
+        "batches": 0,
+        "published": 0,
+    }
+    if result["rows"] == 0 and not removed:
+        return result
+
+    run_id = uuid.uuid4().hex
+    try:
+        result["batches"] = _stage(
+            client, df[changed].to_dict(orient="records"), run_id,
+            batch_size, concurrency, retries, backoff,
+        )
+        resp = _with_retries(
+            lambda: client.rpc(
+                MERGE_FUNCTION, {"p_run_id": run_id, "p_deleted": removed}
+            ).execute(),
+            retries,
+            backoff,
+        )
+    except Exception:
+        # Leave businesses untouched and drop the half-written run
+        _drop_run(client, run_id)
+        raise
+
+    result["run_id"] = run_id
+    result["published"] = resp.data if resp.data is not None else result["rows"]
+    return result
+
+
+def publish_enhanced_rows(
+    client,
+    rows,
+    batch_size=PUBLISH_BATCH_SIZE,
+    concurrency=PUBLISH_CONCURRENCY,
+    retries=PUBLISH_RETRIES,
+    backoff=PUBLISH_BACKOFF_SECONDS,
+):
+    """
+    Publish a full snapshot of enhanced rows to the businesses table.
+
+    Rows are written to the staging table in chunked batches (several in
+    flight at once, each retried with backoff) under a fresh run_id, then
+    swapped into businesses by one database call. Readers never see a
+    partially written table.
+    """
+    run_id = uuid.uuid4().hex
+    try:
+        batches = _stage(client, rows, run_id, batch_size, concurrency, retries, backoff)
+        resp = _with_retries(
+            lambda: client.rpc(SWAP_FUNCTION, {"p_run_id": run_id}).execute(),
+            retries,
+            backoff,
+        )
+    except Exception:
+        # Leave businesses untouched and drop the half-written run
+        _drop_run(client, run_id)
+        raise
+
+    return {
+        "run_id": run_id,
+        "rows": len(rows),
+        "batches": batches,
+        "published": resp.data if resp.data is not None else len(rows),
+    }
+
+
+def publish_snapshot(client, df, diff=None):
+    """Publish a full snapshot: changed rows only (PUBLISH_DIFF) or a full swap."""
+    if PUBLISH_DIFF if diff is None else diff:
+        return publish_changed_rows(client, df)
+    result = publish_enhanced_rows(client, df.to_dict(orient="records"))
+    return dict(result, deleted=None, unchanged=None)
+
+
+def upsert_enhanced_rows(
+    client,
+    rows,
+    deleted_ids=(),
+    batch_size=PUBLISH_BATCH_SIZE,
+    concurrency=PUBLISH_CONCURRENCY,
+    retries=PUBLISH_RETRIES,
+    backoff=PUBLISH_BACKOFF_SECONDS,
+):
+    """
+    Write a handful of changed rows straight into businesses, keyed on
+    business_id, and remove rows whose business is gone. Used by
+    incremental training where a full snapshot swap would be wasteful;
+    upsert_changed_rows() first drops the rows that did not change.
+    """
+    cleaned = [{k: _clean_value(v) for k, v in row.items()} for row in rows]
+    upserts = list(_chunks(cleaned, max(1, batch_size)))
+    deletes = list(_chunks(list(deleted_ids), max(1, batch_size)))
+
+    def write(batch):
+        return _with_retries(
+            lambda: client.table("businesses")
+            .upsert(batch, on_conflict="business_id")
+            .execute(),
+            retries,
+            backoff,
+        )
+
+    def remove(ids):
+        return _with_retries(
+            lambda: client.table("businesses")
+            .delete()
+            .in_("business_id", ids)
+            .execute(),
+            retries,
+            backoff,
+        )
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(write, upserts))
+        list(pool.map(remove, deletes))
+
+    return {
+        "rows": len(cleaned),
+        "deleted": len(deleted_ids),
+        "batches": len(upserts) + len(deletes),
+    }
+
+
+def load_published_rows(client, columns, ids, batch_size=PUBLISH_BATCH_SIZE):
+    """The businesses rows (the given columns) of some business_ids, or None."""
+    frames = []
+    for chunk in _chunks(sorted(int(i) for i in ids), max(1, batch_size)):
+        rows = (
+            client.table("businesses").select(columns).in_("business_id", chunk).execute().data
+        )
+        if rows:
+            frames.append(pd.DataFrame.from_records(rows))
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def upsert_changed_rows(client, df, published, deleted_ids=(),
+                        tolerance=PUBLISH_FLOAT_TOLERANCE):
+    """
+    upsert_enhanced_rows() limited to the rows of df that differ from
+    `published` (what businesses holds for them now, e.g. the last
+    snapshot) and to the deleted ids published still has. Unchanged rows
+    are not written, so they fire no realtime events.
+    """
+    deleted_ids = list(deleted_ids)
+    if published is not None:
+        published = published[
+            published["business_id"].isin(df["business_id"].tolist() + deleted_ids)
+        ]
+        present = set(published["business_id"].tolist())
+        deleted_ids = [i for i in deleted_ids if i in present]
+    changed, _ = diff_published(df, published, tolerance)
+    result = {"rows": 0, "deleted": 0, "batches": 0}
+    if changed.any() or deleted_ids:
+        result = upsert_enhanced_rows(
+            client, df[changed].to_dict(orient="records"), deleted_ids=deleted_ids
+        )
+    result["unchanged"] = int(len(df) - changed.sum())
+    return result
+
+
+def load_cluster_ids(client, page_size=PUBLISH_BATCH_SIZE):
+    """Every cluster_id business_clusters holds now."""
+    ids = []
+    while True:
+        query = client.table(CLUSTER_TABLE).select("cluster_id").order("cluster_id").limit(page_size)
+        if ids:
+            query = query.gt("cluster_id", ids[-1])
+        rows = query.execute().data or []
+        if not rows:
+            return ids
+        ids.extend(int(row["cluster_id"]) for row in rows)
+
+
+def publish_clusters(
+    client,
+    records,
+    owned=None,
+    batch_size=PUBLISH_BATCH_SIZE,
+    retries=PUBLISH_RETRIES,
+    backoff=PUBLISH_BACKOFF_SECONDS,
+):
+    """
+    Upsert one row per cluster into business_clusters and delete the
+    clusters this run no longer produces. `owned(cluster_id)` limits the
+    deletions to the clusters the run was responsible for (all by default).
+    """
+    fresh = {record["cluster_id"] for record in records}
+    stale = [
+        cluster for cluster in load_cluster_ids(client)
+        if cluster not in fresh and (owned is None or owned(cluster))
+    ]
+    cleaned = [{k: _clean_value(v) for k, v in record.items()} for record in records]
+    for batch in _chunks(cleaned, max(1, batch_size)):
+        _with_retries(
+            lambda: client.table(CLUSTER_TABLE).upsert(batch, on_conflict="cluster_id").execute(),
+            retries,
+            backoff,
+        )
+    for ids in _chunks(stale, max(1, batch_size)):
+        _with_retries(
+            lambda: client.table(CLUSTER_TABLE).delete().in_("cluster_id", ids).execute(),
+            retries,
+            backoff,
+        )
+    return {"clusters": len(cleaned), "deleted": len(stale)}
@@ -0,0 +1,443 @@
+"""
+Server-side port of findOptimalLocation (frontend/utils/kmeans.ts).
+
+Same algorithm as the browser version: haversine k-means over all active
+businesses with delta-threshold k selection, traffic-scored cluster choice,
+multi-candidate location selection and the 5-factor opportunity score. All
+distance work is done with NumPy distance matrices instead of per-point
+loops, so clients receive the result instead of the whole dataset.
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from kselect import delta_threshold_elbow
+
+EARTH_RADIUS_KM = 6371
+
+CLUSTER_COLORS = [
+    "#3B82F6", "#10B981", "#F59E0B", "#EF4444",
+    "#8B5CF6", "#06B6D4", "#F97316", "#84CC16",
+]
+
+BRGY_BOUNDS = {
+    "minLat": 14.8338,   # South boundary
+    "maxLat": 14.8413,   # North boundary
+    "minLng": 120.9518,  # West boundary
+    "maxLng": 120.9608,  # East boundary
+}
+
+# Approximate polygon for Sta. Cruz, Santa Maria, Bulacan (lat, lng)
+STA_CRUZ_POLYGON = np.array([
+    [14.8340, 120.9520],
+    [14.8340, 120.9605],
+    [14.8380, 120.9608],
+    [14.8410, 120.9600],
+    [14.8413, 120.9560],
+    [14.8405, 120.9520],
+    [14.8370, 120.9518],
+])
+
+ELBOW_KS = [2, 3, 4, 5, 6]
+
+BUSINESS_FIELDS = [
+    "business_id", "business_name", "general_category", "latitude", "longitude",
+    "street", "zone_type",
+    "business_density_50m", "business_density_100m", "business_density_200m",
+    "competitor_density_50m", "competitor_density_100m", "competitor_density_200m",
+    "zone_encoded", "status",
+]
+
+
+# -----------------------------------------------------------------------------
+# GEOMETRY
+# -----------------------------------------------------------------------------
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    """Great-circle distance in km; broadcasts like any NumPy expression."""
+    lat1, lng1, lat2, lng2 = (np.radians(v) for v in (lat1, lng1, lat2, lng2))
+    a = (
+        np.sin((lat2 - lat1) / 2) ** 2
+        + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distance_matrix(points, lat, lng):
+    """(len(points), len(lat)) km distances from (lat, lng) points to businesses."""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return haversine_km(points[:, :1], points[:, 1:], lat[None, :], lng[None, :])
+
+
+def geographic_centroid(lat, lng):
+    if len(lat) == 1:
+        return np.array([lat[0], lng[0]])
+    lat_r, lng_r = np.radians(lat), np.radians(lng)
+    x = np.mean(np.cos(lat_r) * np.cos(lng_r))
+    y = np.mean(np.cos(lat_r) * np.sin(lng_r))
+    z = np.mean(np.sin(lat_r))
+    return np.degrees([np.arctan2(z, np.sqrt(x * x + y * y)), np.arctan2(y, x)])
+
+
+def clamp_to_barangay(point):
+    return np.array([
+        min(max(point[0], BRGY_BOUNDS["minLat"]), BRGY_BOUNDS["maxLat"]),
+        min(max(point[1], BRGY_BOUNDS["minLng"]), BRGY_BOUNDS["maxLng"]),
+    ])
+
+
+def in_bounds(lat, lng):
+    return (
+        (lat >= BRGY_BOUNDS["minLat"]) & (lat <= BRGY_BOUNDS["maxLat"])
+        & (lng >= BRGY_BOUNDS["minLng"]) & (lng <= BRGY_BOUNDS["maxLng"])
+    )
+
+
+def points_in_polygon(points, polygon=STA_CRUZ_POLYGON):
+    """Ray casting, vectorized over points."""
+    y, x = points[:, 0], points[:, 1]
+    inside = np.zeros(len(points), dtype=bool)
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        yi, xi = polygon[i]
+        yj, xj = polygon[j]
+        # Horizontal edges never cross; silence their division by zero
+        with np.errstate(divide="ignore", invalid="ignore"):
+            crosses = ((yi > y) != (yj > y)) & (x < (xj - xi) * (y - yi) / (yj - yi) + xi)
+        inside ^= crosses
+        j = i
+    return inside
+
+
+def add_jitter(point, max_jitter_meters, rng):
+    return np.array([
+        point[0] + (rng.random() - 0.5) * 2 * (max_jitter_meters / 111000),
+        point[1] + (rng.random() - 0.5) * 2 * (max_jitter_meters / 107000),
+    ])
+
+
+# -----------------------------------------------------------------------------
+# HAVERSINE K-MEANS
+# -----------------------------------------------------------------------------
+
+def kmeans_plus_plus(lat, lng, k, rng):
+    chosen = [int(rng.integers(len(lat)))]
+    closest = haversine_km(lat, lng, lat[chosen[0]], lng[chosen[0]]) ** 2
+    while len(chosen) < k:
+        total = closest.sum()
+        idx = int(rng.choice(len(lat), p=closest / total)) if total > 0 else int(rng.integers(len(lat)))
+        chosen.append(idx)
+        closest = np.minimum(closest, haversine_km(lat, lng, lat[idx], lng[idx]) ** 2)
+    return np.column_stack([lat[chosen], lng[chosen]])
+
+
+def haversine_kmeans(lat, lng, k, max_iter, rng):
+    """
+    Returns (centroids, members): the centroids the final assignment used and
+    one index array per cluster. Empty clusters borrow a random business,
+    as in the browser version.
+    """
+    centroids = kmeans_plus_plus(lat, lng, k, rng)
+    members = []
+    for _ in range(max_iter):
+        assigned = centroids
+        distances = haversine_km(lat[:, None], lng[:, None], assigned[None, :, 0], assigned[None, :, 1])
+        labels = np.argmin(distances, axis=1)
+        members = [np.flatnonzero(labels == i) for i in range(k)]
+        members = [m if len(m) else np.array([int(rng.integers(len(lat)))]) for m in members]
+
+        new_centroids = np.array([geographic_centroid(lat[m], lng[m]) for m in members])
+        if np.array_equal(new_centroids, centroids):
+            break
+        centroids = new_centroids
+    return assigned, members
+
+
+def inertia(lat, lng, centroids, members):
+    return float(sum(
+        (haversine_km(lat[m], lng[m], c[0], c[1]) ** 2).sum()
+        for c, m in zip(centroids, members)
+    ))
+
+
+def select_optimal_k(lat, lng, rng):
+    inertias = [
+        inertia(lat, lng, *haversine_kmeans(lat, lng, k, 25, rng)) for k in ELBOW_KS
+    ]
+    return delta_threshold_elbow(ELBOW_KS, inertias, threshold=0.25) or ELBOW_KS[-1]
+
+
+# -----------------------------------------------------------------------------
+# SCORING
+# -----------------------------------------------------------------------------
+
+def _street_keys(df):
+    keys = df["street"].astype(object).fillna("").astype(str).str.strip().str.lower()
+    return keys.where(keys != "", "unknown").to_numpy()
+
+
+def traffic_scores(df, street_keys, street_stats):
+    def col(name):
+        # Rows published before the radius densities existed count as 0
+        if name not in df:
+            return np.zeros(len(df))
+        return pd.to_numeric(df[name], errors="coerce").fillna(0).to_numpy(dtype=float)
+    popularity = np.array([street_stats.get(k, 0) for k in street_keys], dtype=float)
+    return (
+        col("business_density_50m") * 0.3
+        + col("business_density_100m") * 0.2
+        + col("business_density_200m") * 0.1
+        - col("competitor_density_50m") * 0.25
+        - col("competitor_density_100m") * 0.1
+        - col("competitor_density_200m") * 0.05
+        + col("zone_encoded") * 0.1
+        + popularity * 0.15
+    )
+
+
+def valid_locations(points, lat, lng, max_distance_km):
+    """isValidLocation for several candidate points at once."""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    distances = distance_matrix(points, lat, lng)
+    ok = in_bounds(points[:, 0], points[:, 1])
+    outside = ~points_in_polygon(points)
+    ok &= ~(outside & (distances.min(axis=1) > 0.05))
+    ok &= (distances <= max_distance_km).sum(axis=1) >= 1
+    return ok
+
+
+def location_scores(points, lat, lng, zones, road_mask, competitor_mask):
+    """computeLocationScore totals for several candidate points at once."""
+    distances = distance_matrix(points, lat, lng)
+
+    road_proximity = np.zeros(len(points))
+    if road_mask.any():
+        nearest_road = distances[:, road_mask].min(axis=1)
+        road_proximity = np.maximum(0, 25 * (1 - nearest_road / 0.25))
+
+    poi_density = np.minimum(30, (distances <= 0.1).sum(axis=1) * 3)
+
+    comp = distances[:, competitor_mask]
+    competitor_penalty = -((comp <= 0.1).sum(axis=1) * 8 + (comp <= 0.2).sum(axis=1) * 2)
+
+    nearest = np.argmin(distances, axis=1)
+    zone_bonus = np.zeros(len(points))
+    for i, idx in enumerate(nearest):
+        if distances[i, idx] < 0.1:
+            zone = zones[idx]
+            if "commercial" in zone or "business" in zone:
+                zone_bonus[i] = 20
+            elif "mixed" in zone or "residential" in zone:
+                zone_bonus[i] = 10
+
+    return road_proximity + poi_density + competitor_penalty + zone_bonus
+
+
+def _js_round(value):
+    return math.floor(value + 0.5)
+
+
+# -----------------------------------------------------------------------------
+# FINAL FUNCTION — find_optimal_location
+# -----------------------------------------------------------------------------
+
+def _business_dict(df, i):
+    row = df.iloc[i]
+    out = {}
+    for field in BUSINESS_FIELDS:
+        value = row.get(field)
+        if isinstance(value, np.generic):
+            value = value.item()
+        if isinstance(value, float) and math.isnan(value):
+            value = 0 if field.endswith(("_50m", "_100m", "_200m", "_encoded")) else None
+        out[field] = value
+    return out
+
+
+def find_optimal_location(df, category, seed=None, include_points=False):
+    """
+    Recommend a location for `category` among the active businesses in df
+    and return the ClusteringResult shape used by the frontend. With
+    include_points=False clusters carry only their size, which keeps the
+    response small.
+    """
+    rng = np.random.default_rng(seed)
+    df = df.reset_index(drop=True)
+    lat = df["latitude"].to_numpy(dtype=float)
+    lng = df["longitude"].to_numpy(dtype=float)
+    n = len(df)
+
+    normalized_category = category.strip().lower()
+    categories = df["general_category"].astype(object).fillna("").astype(str).str.strip().str.lower().to_numpy()
+    zones = df["zone_type"].astype(object).fillna("").astype(str).str.lower().to_numpy()
+
+    # Street popularity map
+    street_keys = _street_keys(df)
+    unique_streets, street_counts = np.unique(street_keys, return_counts=True)
+    street_stats = dict(zip(unique_streets.tolist(), street_counts.tolist()))
+
+    k = select_optimal_k(lat, lng, rng)
+    centroids, members = haversine_kmeans(lat, lng, k, 40, rng)
+
+    # Score clusters and choose the best one, avoiding low-traffic clusters
+    traffic = traffic_scores(df, street_keys, street_stats)
+    cluster_scores = np.array([traffic[m].mean() for m in members])
+    order = np.argsort(-cluster_scores, kind="stable")
+    best = order[0]
+    if cluster_scores[best] < 1 and len(order) > 1:
+        best = order[1]
+
+    threshold = max(3, math.floor(sum(street_stats.values()) / len(street_stats)))
+    major_roads = {street for street, count in street_stats.items() if count >= threshold}
+    raw_streets = df["street"].astype(object).fillna("").astype(str).str.lower().to_numpy()
+    road_mask = np.isin(raw_streets, list(major_roads))
+    competitor_mask = categories == normalized_category
+
+    centroid = centroids[best]
+
+    # Candidate locations
+    candidates = [add_jitter(centroid, 20, rng), add_jitter(centroid, 40, rng)]
+    for i in rng.permutation(members[best])[:2]:
+        candidates.append(add_jitter((lat[i], lng[i]), 15, rng))
+    road_in_bounds = np.flatnonzero(road_mask & in_bounds(lat, lng))
+    if len(road_in_bounds):
+        to_centroid = haversine_km(lat[road_in_bounds], lng[road_in_bounds], centroid[0], centroid[1])
+        top3 = road_in_bounds[np.argsort(to_centroid, kind="stable")[:3]]
+        for i in rng.permutation(top3)[:2]:
+            candidates.append(add_jitter((lat[i], lng[i]), 10, rng))
+    candidates = np.array([clamp_to_barangay(c) for c in candidates])
+
+    # Select the best candidate (weighted pick among the top 3)
+    valid = valid_locations(candidates, lat, lng, 0.2)
+    scores = np.full(len(candidates), -1000.0)
+    if valid.any():
+        scores[valid] = location_scores(
+            candidates[valid], lat, lng, zones, road_mask, competitor_mask
+        ) + rng.random(valid.sum()) * 5
+    ranked = np.argsort(-scores, kind="stable")
+    top = [i for i in ranked if scores[i] > -500][:3]
+    if not top:
+        recommended = candidates[0]
+    elif len(top) == 1:
+        recommended = candidates[top[0]]
+    else:
+        weights = np.array([0.60, 0.30, 0.10][:len(top)])
+        recommended = candidates[top[rng.choice(len(top), p=weights / weights.sum())]]
+
+    recommended = clamp_to_barangay(recommended)
+
+    # Fall back to the nearest valid business if needed
+    if not valid_locations(recommended, lat, lng, 0.2)[0]:
+        inside = np.flatnonzero(in_bounds(lat, lng))
+        if len(inside):
+            to_centroid = haversine_km(lat[inside], lng[inside], centroid[0], centroid[1])
+            nearest_valid = inside[np.argmin(to_centroid)]
+            recommended = clamp_to_barangay(
+                add_jitter((lat[nearest_valid], lng[nearest_valid]), 15, rng)
+            )
+
+    distances = haversine_km(lat, lng, recommended[0], recommended[1])
+    by_distance = np.argsort(distances, kind="stable")
+    inferred_zone_type = df["zone_type"].iloc[by_distance[0]]
+
+    nearby_businesses = [
+        {"business": _business_dict(df, i), "distance": float(distances[i])}
+        for i in by_distance[:10]
+    ]
+
+    # Competitor analysis (same category only)
+    competitor_idx = np.flatnonzero(competitor_mask)
+    competitor_distances = distances[competitor_idx]
+    competitor_count = len(competitor_idx)
+    nearest_competitor = None
+    distance_to_nearest = 0.0
+    if competitor_count:
+        j = int(np.argmin(competitor_distances))
+        nearest_competitor = _business_dict(df, competitor_idx[j])
+        distance_to_nearest = float(competitor_distances[j])
+
+    within_500m = int((competitor_distances <= 0.5).sum())
+    within_1km = int((competitor_distances <= 1).sum())
+    within_2km = int((competitor_distances <= 2).sum())
+    businesses_within_1km = int((distances <= 1).sum())
+    market_saturation = within_1km / businesses_within_1km if businesses_within_1km > 0 else 0
+
+    # 5-factor opportunity score
+    nearby_mask = distances <= 0.3
+    all_nearby = int(nearby_mask.sum())
+    business_count_score = min(1, all_nearby / 30) * 0.30
+    _, category_counts = np.unique(categories[nearby_mask], return_counts=True)
+    diversity_score = min(1, len(category_counts) / 6) * 0.25
+    max_category_share = category_counts.max() / all_nearby if all_nearby > 0 else 0
+    saturation_balance = (1 - max_category_share) * 0.20
+
+    zone_type = str(inferred_zone_type).lower()
+    zone_compatibility = 0.05
+    if "commercial" in zone_type:
+        zone_compatibility = 0.15
+    elif "mixed" in zone_type:
+        zone_compatibility = 0.10
+
+    category_context_score = 0.10 if within_500m <= 2 else 0.05 if within_500m <= 5 else 0.02
+
+    opportunity_score = _js_round(
+        (business_count_score + diversity_score + saturation_balance
+         + zone_compatibility + category_context_score) * 100
+    )
+    confidence = opportunity_score / 100
+
+    if opportunity_score >= 85:
+        label = "Highly Recommended"
+    elif opportunity_score >= 70:
+        label = "Good Choice"
+    elif opportunity_score >= 55:
+        label = "Fair Option"
+    else:
+        label = "Not Recommended"
+    opportunity = f"{label} — Based on business density, category diversity, and zone compatibility."
+
+    clusters = []
+    for i, (c, m) in enumerate(zip(centroids, members)):
+        clusters.append({
+            "id": i,
+            "color": CLUSTER_COLORS[i % len(CLUSTER_COLORS)],
+            "centroid": {"latitude": float(c[0]), "longitude": float(c[1])},
+            "size": int(len(m)),
+            "points": [
+                {"latitude": float(lat[j]), "longitude": float(lng[j]),
+                 "business": _business_dict(df, j)}
+                for j in m
+            ] if include_points else [],
+        })
+
+    return {
+        "clusters": clusters,
+        "recommendedLocation": {
+            "latitude": float(recommended[0]),
+            "longitude": float(recommended[1]),
+        },
+        "nearbyBusinesses": nearby_businesses,
+        "competitorAnalysis": {
+            "competitorCount": competitor_count,
+            "nearestCompetitor": nearest_competitor,
+            "distanceToNearest": distance_to_nearest,
+            "competitorsWithin500m": within_500m,
+            "competitorsWithin1km": within_1km,
+            "competitorsWithin2km": within_2km,
+            "marketSaturation": market_saturation,
+            "recommendedStrategy": (
+                "Ideal location for business entry."
+                if confidence >= 0.8
+                else "There is some competition in this area, but new businesses can still succeed with a unique offering."
+            ),
+        },
+        "zoneType": inferred_zone_type,
+        "analysis": {
+            "confidence": confidence,
+            "opportunity": opportunity,
+            "opportunity_score": opportunity_score,
+            "competitorCount": competitor_count,
+        },
+        "totalBusinesses": n,
+    }
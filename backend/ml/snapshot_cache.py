@@ -0,0 +1,210 @@
+import json
+import os
+import threading
+import uuid
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+from artifacts import ARTIFACT_DIR
+from data_source import (
+    RAW_COLUMNS,
+    concat_typed,
+    iter_business_raw_pages,
+    load_business_raw,
+    typed_frame,
+)
+
+try:
+    import pyarrow as pa
+except ImportError:  # the cache is optional; without pyarrow we fetch over HTTP
+    pa = None
+
+# Local Arrow copy of business_raw, refreshed by updated_at
+SNAPSHOT_CACHE = os.getenv("SNAPSHOT_CACHE", "1") == "1"
+SNAPSHOT_DIR = os.getenv("ML_SNAPSHOT_DIR", os.path.join(ARTIFACT_DIR, "snapshot"))
+# Read the cached file as-is, without asking Supabase for changes
+SNAPSHOT_OFFLINE = os.getenv("SNAPSHOT_OFFLINE", "0") == "1"
+# Look for deleted rows on every refresh (an id-only pass over the table)
+SNAPSHOT_CHECK_DELETES = os.getenv("SNAPSHOT_CHECK_DELETES", "1") == "1"
+# Re-read rows updated this long before the newest seen updated_at, so rows
+# from transactions that committed late are not missed
+SNAPSHOT_OVERLAP_SECONDS = float(os.getenv("SNAPSHOT_OVERLAP_SECONDS", "300"))
+
+SNAPSHOT_POINTER = "snapshot.json"
+SNAPSHOT_COLUMNS = RAW_COLUMNS + ", updated_at"
+
+_lock = threading.Lock()
+
+
+def snapshot_available():
+    return SNAPSHOT_CACHE and pa is not None
+
+
+def _field_list(columns):
+    if columns is None or isinstance(columns, (list, tuple)):
+        return columns
+    return [c.strip() for c in columns.split(",")]
+
+
+def _read_pointer(snapshot_dir):
+    path = os.path.join(snapshot_dir, SNAPSHOT_POINTER)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        pointer = json.load(f)
+    if not os.path.exists(os.path.join(snapshot_dir, pointer["file"])):
+        return None
+    return pointer
+
+
+def read_snapshot(columns=None, snapshot_dir=None):
+    """
+    Read the cached business_raw snapshot (None if there is none).
+
+    The Arrow file is memory-mapped and only `columns` are materialized;
+    numeric columns are handed to pandas without copying and text columns
+    come back as categoricals.
+    """
+    snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+    pointer = _read_pointer(snapshot_dir)
+    if pointer is None:
+        return None
+
+    source = pa.memory_map(os.path.join(snapshot_dir, pointer["file"]), "r")
+    table = pa.ipc.open_file(source).read_all()
+    fields = _field_list(columns)
+    if fields is not None:
+        table = table.select(fields)
+    return table.to_pandas(split_blocks=True)
+
+
+def _fetch_frame(client, since=None):
+    frames = [
+        typed_frame(page, SNAPSHOT_COLUMNS)
+        for page in iter_business_raw_pages(client, SNAPSHOT_COLUMNS, since=since)
+    ]
+    df = concat_typed(frames)
+    if df is not None:
+        df["updated_at"] = pd.to_datetime(df["updated_at"], utc=True, errors="coerce")
+    return df
+
+
+def _current_ids(client):
+    ids = []
+    for page in iter_business_raw_pages(client, "business_id"):
+        ids.extend(row["business_id"] for row in page)
+    return pd.Index(ids, dtype="int64")
+
+
+def _row_hashes(df):
+    fields = _field_list(RAW_COLUMNS)
+    ordered = df[fields].astype(
+        {c: object for c in fields if c not in ("business_id", "latitude", "longitude")}
+    )
+    return pd.Series(
+        pd.util.hash_pandas_object(ordered, index=False).to_numpy(),
+        index=df["business_id"].to_numpy(),
+    )
+
+
+def _write_snapshot(df, snapshot_dir):
+    os.makedirs(snapshot_dir, exist_ok=True)
+    name = f"business_raw-{uuid.uuid4().hex[:12]}.arrow"
+    table = pa.Table.from_pandas(df.reset_index(drop=True), preserve_index=False)
+    with pa.OSFile(os.path.join(snapshot_dir, name), "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+    watermark = df["updated_at"].max()
+    pointer = {
+        "file": name,
+        "rows": len(df),
+        "watermark": None if pd.isna(watermark) else watermark.isoformat(),
+        "refreshed_at": datetime.utcnow().isoformat() + "Z",
+    }
+    path = os.path.join(snapshot_dir, SNAPSHOT_POINTER)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(pointer, f)
+    os.replace(tmp, path)
+
+    # Older files may still be mapped by a reader (and can't be removed on
+    # Windows); they are retried on the next refresh
+    for old in os.listdir(snapshot_dir):
+        if old.endswith(".arrow") and old != name:
+            try:
+                os.remove(os.path.join(snapshot_dir, old))
+            except OSError:
+                pass
+    return pointer
+
+
+def refresh_snapshot(client, snapshot_dir=None):
+    """
+    Bring the local snapshot up to date with business_raw.
+
+    The first run downloads the whole table. Later runs fetch only rows
+    with a newer updated_at (plus an id-only pass to notice deletions) and
+    rewrite the file only if something actually changed.
+    """
+    snapshot_dir = snapshot_dir or SNAPSHOT_DIR
+    with _lock:
+        pointer = _read_pointer(snapshot_dir)
+        if pointer is None or pointer.get("watermark") is None:
+            df = _fetch_frame(client)
+            if df is None:
+                return {"mode": "full", "fetched": 0, "deleted": 0, "rows": 0}
+            _write_snapshot(df.sort_values("business_id"), snapshot_dir)
+            return {"mode": "full", "fetched": len(df), "deleted": 0, "rows": len(df)}
+
+        since = pd.Timestamp(pointer["watermark"]) - timedelta(seconds=SNAPSHOT_OVERLAP_SECONDS)
+        changed = _fetch_frame(client, since=since.isoformat())
+        old = read_snapshot(snapshot_dir=snapshot_dir)
+
+        deleted = pd.Index([], dtype="int64")
+        if SNAPSHOT_CHECK_DELETES:
+            deleted = pd.Index(old["business_id"]).difference(_current_ids(client))
+
+        if changed is not None:
+            # Rows re-read because of the overlap window are not changes
+            before = _row_hashes(old[old["business_id"].isin(changed["business_id"])])
+            after = _row_hashes(changed)
+            same = after.index.isin(before.index)
+            same[same] = after.to_numpy()[same] == before.loc[after.index[same]].to_numpy()
+            changed = changed[~same]
+
+        fetched = 0 if changed is None else len(changed)
+        if fetched == 0 and len(deleted) == 0:
+            return {"mode": "unchanged", "fetched": 0, "deleted": 0, "rows": pointer["rows"]}
+
+        drop = deleted
+        if fetched:
+            drop = drop.union(pd.Index(changed["business_id"]))
+        keep = old[~old["business_id"].isin(drop)]
+        frames = [keep] + ([changed[list(keep.columns)]] if fetched else [])
+        df = concat_typed(frames).sort_values("business_id")
+        pointer = _write_snapshot(df, snapshot_dir)
+        return {
+            "mode": "incremental",
+            "fetched": fetched,
+            "deleted": len(deleted),
+            "rows": pointer["rows"],
+        }
+
+
+def load_snapshot(client, columns=RAW_COLUMNS, snapshot_dir=None):
+    """
+    business_raw as a DataFrame of `columns`: refreshed and read from the
+    local snapshot when the cache is enabled, otherwise fetched directly.
+    `columns` is a comma-separated string or a list.
+    """
+    if not snapshot_available():
+        fields = _field_list(RAW_COLUMNS if columns is None else columns)
+        # Pages are keyset-paginated on business_id, so it is always fetched
+        fetched = fields if "business_id" in fields else ["business_id", *fields]
+        df = load_business_raw(client, ", ".join(fetched))
+        return df if df is None or fetched is fields else df[fields]
+    if not SNAPSHOT_OFFLINE:
+        refresh_snapshot(client, snapshot_dir)
+    return read_snapshot(columns, snapshot_dir)
@@ -0,0 +1,126 @@
+import threading
+
+import numpy as np
+from sklearn.neighbors import BallTree
+
+from features import EARTH_RADIUS_M
+
+# Business fields returned by /nearby and /nearest
+INDEX_FIELDS = [
+    "business_id", "business_name", "general_category",
+    "latitude", "longitude", "street", "zone_type",
+]
+
+
+def category_key(category):
+    return str(category).strip().lower()
+
+
+class SpatialIndex:
+    """
+    Haversine BallTrees over the active businesses of a training snapshot:
+    one over every business plus one per category (so nearest-competitor
+    lookups never have to filter). Queries take batches of (lat, lng)
+    points in degrees and distances are in meters.
+    """
+
+    def __init__(self, df):
+        df = df.reset_index(drop=True)
+        self.size = len(df)
+        self.records = df[[c for c in INDEX_FIELDS if c in df]].astype(object)
+        self.records = self.records.where(self.records.notna(), None)
+
+        coords = np.radians(df[["latitude", "longitude"]].to_numpy(dtype=float))
+        self.tree = BallTree(coords, metric="haversine") if len(df) else None
+
+        keys = df["general_category"].astype(object).map(category_key).to_numpy()
+        self.categories = {}
+        for key in np.unique(keys):
+            positions = np.flatnonzero(keys == key)
+            self.categories[key] = (BallTree(coords[positions], metric="haversine"), positions)
+
+    def _tree(self, category):
+        """(tree, positions) for a category, or the full index when None."""
+        if category is None:
+            return self.tree, None
+        return self.categories.get(category_key(category), (None, None))
+
+    def nearby(self, points, radius_m, category=None, limit=None):
+        """
+        Per point: [(position, distance_m)] within radius_m, nearest first,
+        truncated to `limit`.
+        """
+        tree, positions = self._tree(category)
+        # BallTree rejects an empty query
+        if tree is None or len(points) == 0:
+            return [[] for _ in points]
+
+        found, distances = tree.query_radius(
+            np.radians(np.asarray(points, dtype=float)),
+            r=radius_m / EARTH_RADIUS_M,
+            return_distance=True,
+            sort_results=True,
+        )
+        results = []
+        for hits, dists in zip(found, distances):
+            if limit is not None:
+                hits, dists = hits[:limit], dists[:limit]
+            if positions is not None:
+                hits = positions[hits]
+            results.append(list(zip(hits.tolist(), (dists * EARTH_RADIUS_M).tolist())))
+        return results
+
+    def count_within(self, points, radius_m, category=None):
+        """Number of businesses within radius_m of each point."""
+        tree, _ = self._tree(category)
+        if tree is None or len(points) == 0:
+            return np.zeros(len(points), dtype=int)
+        return tree.query_radius(
+            np.radians(np.asarray(points, dtype=float)),
+            r=radius_m / EARTH_RADIUS_M,
+            count_only=True,
+        )
+
+    def nearest(self, points, k=1, category=None):
+        """Per point: the k nearest [(position, distance_m)], nearest first."""
+        tree, positions = self._tree(category)
+        if tree is None or len(points) == 0:
+            return [[] for _ in points]
+
+        k = min(k, tree.data.shape[0])
+        distances, found = tree.query(np.radians(np.asarray(points, dtype=float)), k=k)
+        if positions is not None:
+            found = positions[found]
+        return [
+            list(zip(hits.tolist(), (dists * EARTH_RADIUS_M).tolist()))
+            for hits, dists in zip(found, distances)
+        ]
+
+    def business(self, position):
+        return self.records.iloc[position].to_dict()
+
+
+def build_index(snapshot):
+    """Index the active businesses of a training snapshot."""
+    active = snapshot[snapshot["status"].astype(str).str.lower() == "active"]
+    return SpatialIndex(active)
+
+
+_index = None
+_lock = threading.Lock()
+
+
+def get_index():
+    with _lock:
+        return _index
+
+
+def set_index(index):
+    global _index
+    with _lock:
+        _index = index
+
+
+def refresh_index(state):
+    """Rebuild the index from a ModelState's snapshot (or clear it)."""
+    set_index(build_index(state.snapshot) if state is not None else None)
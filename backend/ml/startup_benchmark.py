@@ -0,0 +1,97 @@
+"""
+Measure the ML service's cold start.
+
+Starts uvicorn for each entry point several times and records how long it
+takes from spawning the process to the first 200 from GET /health, and to
+/health reporting the ML stack as warm:
+
+    python startup_benchmark.py
+    python startup_benchmark.py --targets fast_start:app --runs 10
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from urllib.request import urlopen
+
+ML_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TARGETS = ["main:app", "fast_start:app"]
+TARGET_FIRST_RESPONSE_MS = 200
+POLL_SECONDS = 0.005
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def get_health(port):
+    try:
+        with urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
+
+
+def measure(target, timeout):
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        cwd=ML_DIR,
+    )
+    result = {"first_response_ms": None, "warm_ms": None}
+    try:
+        while time.perf_counter() - started < timeout and process.poll() is None:
+            health = get_health(port)
+            elapsed = round((time.perf_counter() - started) * 1000, 1)
+            if health is not None:
+                if result["first_response_ms"] is None:
+                    result["first_response_ms"] = elapsed
+                if health.get("warm"):
+                    result["warm_ms"] = elapsed
+                    result["health"] = health
+                    break
+            time.sleep(POLL_SECONDS)
+    finally:
+        process.terminate()
+        process.wait()
+    return result
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure ML service cold start.")
+    parser.add_argument("--targets", default=",".join(DEFAULT_TARGETS),
+                        help="comma-separated uvicorn app paths")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    for target in args.targets.split(","):
+        runs = [measure(target, args.timeout) for _ in range(args.runs)]
+        first = [r["first_response_ms"] for r in runs if r["first_response_ms"] is not None]
+        warm = [r["warm_ms"] for r in runs if r["warm_ms"] is not None]
+        if not first:
+            print(f"{target:16s} no response within {args.timeout}s")
+            continue
+        first_ms = statistics.median(first)
+        verdict = "ok" if first_ms < TARGET_FIRST_RESPONSE_MS else "over target"
+        print(
+            f"{target:16s} first /health {first_ms:8.1f} ms ({verdict}), "
+            f"warm {statistics.median(warm) if warm else float('nan'):8.1f} ms "
+            f"(median of {len(first)})"
+        )
+        if runs[-1].get("health"):
+            print(f"{'':16s} {runs[-1]['health']}")
+
+
+if __name__ == "__main__":
+    main()
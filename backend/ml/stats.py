@@ -0,0 +1,159 @@
+"""
+Aggregate counts of the businesses table.
+
+Every training run (full, incremental or partitioned) recomputes the counts
+by category, zone, status, cluster and category x cluster from the frame it
+just published, keeps them in memory and writes them to
+ARTIFACT_DIR/stats.json, so /stats and the diagnostic scripts never have to
+page through the table to count it.
+"""
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+
+from artifacts import ARTIFACT_DIR
+from metrics import log
+
+STATS_FILE = "stats.json"
+# Where the scripts reach the ML service
+ML_SERVICE_URL = os.getenv("ML_SERVICE_URL", "http://localhost:8000")
+
+
+def _counts(values):
+    counts = values.astype(object).fillna("(none)").value_counts()
+    return {str(key): int(n) for key, n in sorted(counts.items(), key=lambda item: str(item[0]))}
+
+
+def compute_stats(df, snapshot_hash=None, clustered=None):
+    """
+    Counts over a businesses frame. Clusters only count active rows (of
+    `clustered` when the cluster labels live in another frame); the
+    category x cluster table is keyed by cluster, then category.
+    """
+    clustered = df if clustered is None else clustered
+    active = clustered[clustered["status"].astype(object) == "active"]
+    by_category_cluster = {}
+    if "cluster" in active.columns and len(active):
+        pairs = active.groupby(
+            [active["cluster"].astype(int), active["general_category"].astype(object)]
+        ).size()
+        for (cluster, category), n in sorted(pairs.items()):
+            by_category_cluster.setdefault(str(cluster), {})[str(category)] = int(n)
+    return {
+        "total": int(len(df)),
+        "by_category": _counts(df["general_category"]),
+        "by_zone": _counts(df["zone_type"]),
+        "by_status": _counts(df["status"]),
+        "by_cluster": {
+            cluster: sum(categories.values())
+            for cluster, categories in by_category_cluster.items()
+        },
+        "by_category_cluster": by_category_cluster,
+        "snapshot_hash": snapshot_hash,
+        "generated_at": datetime.utcnow().isoformat() + "Z",
+    }
+
+
+def carry_clusters(stats, previous, keep):
+    """
+    Copy the cluster rows of `previous` whose cluster id passes keep(id)
+    into `stats` (for runs that only recomputed some clusters).
+    """
+    if not previous:
+        return stats
+    for cluster, categories in previous.get("by_category_cluster", {}).items():
+        if keep(int(cluster)) and cluster not in stats["by_category_cluster"]:
+            stats["by_category_cluster"][cluster] = dict(categories)
+            stats["by_cluster"][cluster] = sum(categories.values())
+    stats["by_cluster"] = dict(sorted(stats["by_cluster"].items(), key=lambda item: int(item[0])))
+    stats["by_category_cluster"] = dict(
+        sorted(stats["by_category_cluster"].items(), key=lambda item: int(item[0]))
+    )
+    return stats
+
+
+class StatsSnapshot:
+    """Stats plus their serialized body and ETag, ready to serve."""
+
+    def __init__(self, stats):
+        self.stats = stats
+        self.body = json.dumps(stats, sort_keys=True).encode("utf-8")
+        # The ETag covers the content only, so a retrain that reproduces the
+        # same counts keeps it and clients still get 304s
+        content = {key: value for key, value in stats.items() if key != "generated_at"}
+        digest = hashlib.sha256(json.dumps(content, sort_keys=True).encode("utf-8"))
+        self.etag = '"' + digest.hexdigest()[:32] + '"'
+
+
+class JsonSnapshotStore:
+    """
+    The current StatsSnapshot of one JSON document, kept in memory and in
+    ARTIFACT_DIR/<filename> (read back from disk on first use).
+    """
+
+    def __init__(self, filename, label):
+        self.filename = filename
+        self.label = label
+        self._current = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _path(self, artifact_dir):
+        return os.path.join(artifact_dir or ARTIFACT_DIR, self.filename)
+
+    def save(self, document, artifact_dir=None):
+        """Make `document` current and write it to disk (atomically)."""
+        snapshot = StatsSnapshot(document)
+        with self._lock:
+            self._current = snapshot
+            self._loaded = True
+        try:
+            path = self._path(artifact_dir)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(snapshot.body)
+            os.replace(tmp, path)
+        except OSError as e:
+            log.warning(f"could not save {self.label}: {e}")
+        return snapshot
+
+    def get(self, artifact_dir=None):
+        """Current StatsSnapshot, or None."""
+        with self._lock:
+            if not self._loaded:
+                self._loaded = True
+                try:
+                    with open(self._path(artifact_dir), "r", encoding="utf-8") as f:
+                        self._current = StatsSnapshot(json.load(f))
+                except (OSError, ValueError):
+                    self._current = None
+            return self._current
+
+
+_store = JsonSnapshotStore(STATS_FILE, "stats")
+
+
+def save_stats(stats, artifact_dir=None):
+    """Make `stats` current and write them to stats.json (atomically)."""
+    return _store.save(stats, artifact_dir)
+
+
+def get_stats(artifact_dir=None):
+    """Current StatsSnapshot (read from stats.json on first use), or None."""
+    return _store.get(artifact_dir)
+
+
+def fetch_stats(url=None, timeout=5):
+    """GET /stats from the ML service; None when it is unreachable or has none."""
+    # Only the scripts call this; urllib.request is slow to import
+    from urllib.request import Request, urlopen
+
+    try:
+        request = Request((url or ML_SERVICE_URL).rstrip("/") + "/stats")
+        with urlopen(request, timeout=timeout) as response:
+            return json.load(response)
+    except (OSError, ValueError):
+        return None
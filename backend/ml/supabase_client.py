@@ -0,0 +1,29 @@
+"""
+The service's Supabase client, created on first use and then shared.
+
+supabase-py and its HTTP stack are slow to import, and creating a client
+needs credentials, so neither happens at import time: the service starts
+and answers /health without them.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv(override=True)
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _lock:
+        if _client is None:
+            url = os.getenv("SUPABASE_URL")
+            key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
+            if not url or not key:
+                raise RuntimeError("SUPABASE_URL and SUPABASE_SERVICE_ROLE_KEY must be set")
+            from supabase import create_client
+            _client = create_client(url, key)
+        return _client
@@ -0,0 +1,88 @@
+"""
+Synthetic business_raw rows for benchmarks.
+
+Businesses are scattered around the streets of Sta. Cruz, Santa Maria,
+Bulacan with the category, zone and street mix of rawbusinessdata.csv.
+Large tables repeat that street layout over a grid of barangay-sized tiles
+around it (BUSINESSES_PER_TILE each) instead of packing every row into one
+square kilometer, so neighbourhood densities stay realistic at any size.
+"""
+import numpy as np
+import pandas as pd
+
+# (street, latitude, longitude, share of businesses, share commercial, spread in m)
+STREET_ANCHORS = [
+    ("Provincial Road", 14.83948, 120.95625, 0.29, 0.75, 250),
+    ("Bukid St.", 14.83672, 120.96133, 0.12, 0.42, 200),
+    ("Sonoma Residences", 14.83650, 120.95044, 0.12, 0.00, 80),
+    ("Mapayapa St.", 14.83145, 120.96289, 0.09, 0.44, 60),
+    ("Luwasan St.", 14.83482, 120.95509, 0.05, 1.00, 25),
+    ("Gulod St.", 14.83358, 120.95486, 0.05, 1.00, 30),
+    ("Centro St.", 14.83600, 120.95551, 0.05, 1.00, 40),
+    ("Pag-asa St.", 14.83727, 120.95711, 0.05, 0.60, 60),
+    ("Housing Project", 14.83888, 120.95611, 0.05, 1.00, 60),
+    ("Matahimik St.", 14.83477, 120.96261, 0.03, 0.33, 70),
+    ("Maunlad St.", 14.83507, 120.96088, 0.03, 0.67, 80),
+    ("Maligaya St.", 14.83340, 120.95922, 0.03, 0.00, 30),
+    ("Matimyas St.", 14.84034, 120.95485, 0.04, 0.33, 35),
+]
+
+CATEGORY_MIX = {
+    "Retail": 0.39,
+    "Services": 0.24,
+    "Restaurant": 0.14,
+    "Merchandise / Trading": 0.12,
+    "Food & Beverages": 0.08,
+    "Entertainment / Leisure": 0.02,
+    "Pet Store": 0.01,
+}
+
+METERS_PER_DEGREE_LAT = 111000
+METERS_PER_DEGREE_LNG = 107000
+
+BUSINESSES_PER_TILE = 1000
+# Distance between neighbouring tiles, in degrees (about 1.1 km)
+TILE_STEP_DEGREES = 0.01
+
+
+def tile_offsets(count):
+    """Grid offsets (lat, lng) of `count` tiles, nearest to the original first."""
+    side = int(np.ceil(np.sqrt(count)))
+    grid = np.array([(i, j) for i in range(side) for j in range(side)], dtype=float)
+    grid -= (side - 1) // 2
+    order = np.argsort(np.abs(grid).max(axis=1), kind="stable")
+    return grid[order][:count] * TILE_STEP_DEGREES
+
+
+def generate_businesses(n, seed=42, inactive_share=0.05, per_tile=BUSINESSES_PER_TILE):
+    """A business_raw-shaped DataFrame of n synthetic businesses."""
+    rng = np.random.default_rng(seed)
+    tile_count = max(1, int(np.ceil(n / per_tile)))
+    tiles = tile_offsets(tile_count)[rng.integers(tile_count, size=n)]
+
+    streets, lats, lngs, weights, commercial, spread = map(np.array, zip(*STREET_ANCHORS))
+    street_idx = rng.choice(len(streets), size=n, p=weights / weights.sum())
+
+    offsets = rng.normal(size=(n, 2)) * spread[street_idx, None]
+    latitude = lats[street_idx].astype(float) + tiles[:, 0] + offsets[:, 0] / METERS_PER_DEGREE_LAT
+    longitude = lngs[street_idx].astype(float) + tiles[:, 1] + offsets[:, 1] / METERS_PER_DEGREE_LNG
+
+    categories = np.array(list(CATEGORY_MIX))
+    shares = np.array(list(CATEGORY_MIX.values()))
+    category = categories[rng.choice(len(categories), size=n, p=shares / shares.sum())]
+
+    is_commercial = rng.random(n) < commercial[street_idx].astype(float)
+    zone = np.where(is_commercial, "Commercial", "Residential")
+    status = np.where(rng.random(n) < inactive_share, "Inactive", "Active")
+
+    business_id = np.arange(1, n + 1)
+    return pd.DataFrame({
+        "business_id": business_id,
+        "business_name": [f"Business {i}" for i in business_id],
+        "general_category": category,
+        "latitude": latitude.round(6),
+        "longitude": longitude.round(6),
+        "street": streets[street_idx],
+        "zone_type": zone,
+        "status": status,
+    })
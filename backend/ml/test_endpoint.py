@@ -1,21 +1,38 @@
 import requests
 import json
+import time
 
 url = "http://localhost:8000/train"
 
 print("Testing ML training endpoint...")
 try:
-    response = requests.post(url, timeout=30)
+    # /train only queues the job, so this returns immediately
+    response = requests.post(url, timeout=10)
     print(f"Status: {response.status_code}")
     print(f"Headers: {response.headers.get('content-type')}")
     print(f"Raw Response: {response.text[:500]}")
-    
-    if response.status_code == 200:
-        print(f"\n✓ SUCCESS!\n{json.dumps(response.json(), indent=2)}")
-    else:
+
+    if response.status_code != 202:
         print(f"\n✗ ERROR {response.status_code}")
         print(response.text)
+        raise SystemExit(1)
+
+    job_id = response.json()["job_id"]
+    print(f"\nQueued training job {job_id}, polling status...")
+
+    while True:
+        job = requests.get(f"{url}/{job_id}", timeout=10).json()
+        print(f"   {job['status']} (stage: {job['stage']})")
+        if job["status"] in ("succeeded", "failed"):
+            break
+        time.sleep(1)
+
+    if job["status"] == "succeeded":
+        print(f"\n✓ SUCCESS!\n{json.dumps(job, indent=2)}")
+    else:
+        print(f"\n✗ FAILED: {job['error']}")
+        print(json.dumps(job, indent=2))
 except requests.exceptions.Timeout:
-    print("Request timed out (ML processing takes time)")
+    print("Request timed out (is the ML service running?)")
 except Exception as e:
     print(f"Error: {type(e).__name__}: {e}")
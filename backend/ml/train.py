@@ -1,48 +1,101 @@
-from supabase import create_client, Client
-from dotenv import load_dotenv
 import os
 import pandas as pd
-from sklearn.cluster import KMeans
-from sklearn.preprocessing import OneHotEncoder
-import numpy as np
-
-load_dotenv(override=True)
-
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
-
-def train_model():
+from features import (
+    add_radius_densities,
+    build_enhanced_features,
+    build_feature_matrix,
+    default_feature_weights,
+    fit_encoder,
+)
+from model_state import ModelState, get_state, set_state, state_from_artifact
+from artifacts import ARTIFACT_DIR, load_latest_artifact, save_artifact, snapshot_hash
+from kselect import select_k
+from publish import publish_clusters, publish_snapshot
+from snapshot_cache import load_snapshot
+from spatial_index import refresh_index
+from metrics import StageProfiler, log, peak_rss_mb
+from normalize import normalize_businesses, write_quarantine
+from stats import compute_stats, save_stats
+from clusters import cluster_centers, cluster_summaries, save_clusters
+from supabase_client import get_client
+from large_mode import (
+    LARGE_MODE_QUALITY_ROWS,
+    LARGE_MODE_SAMPLE_ROWS,
+    compare_with_exact,
+    stratified_sample,
+    use_large_mode,
+)
+from warm_start import fit_clusters, previous_clusters
+from opportunity_grid import OPPORTUNITY_GRID, build_grid, save_grid
+
+# business_raw rows rejected by normalize_businesses() in the last run
+QUARANTINE_PATH = os.getenv("ML_QUARANTINE_PATH", os.path.join(ARTIFACT_DIR, "quarantine.csv"))
+
+def load_latest_state():
+    """Warm-load the newest saved model into memory (None if there is none)."""
+    artifact = load_latest_artifact()
+    if artifact is None:
+        return None
+    state = state_from_artifact(artifact)
+    set_state(state)
+    refresh_index(state)
+    return state
+
+def ignore_stage(name):
+    pass
+
+def train_model(force=False, on_stage=ignore_stage, client=None):
     from datetime import datetime
-    
-    # 1. Fetch ALL businesses from business_raw
-    resp = supabase.table("business_raw").select(
-        "business_id, business_name, general_category, latitude, longitude, street, zone_type, status"
-    ).execute()
 
-    rows = resp.data
+    # Benchmarks pass an in-process stand-in instead of the real client
+    client = client or get_client()
+    # Per-stage wall time, rows and peak RSS, returned as result["stages"]
+    stages = StageProfiler(on_stage)
+
+    stages.start("fetch")
+    # 1. Fetch ALL businesses from business_raw (local Arrow snapshot,
+    #    refreshed by updated_at; paginated HTTP fetch without pyarrow)
+    df = load_snapshot(client)
+    stages.set_rows(0 if df is None else len(df))
 
-    if not rows or len(rows) == 0:
+    if df is None or len(df) == 0:
         return {
             "status": "error",
             "trigger": "raw_data_change",
             "active_processed": 0,
             "inactive_ignored_in_ml": 0,
             "enhanced_table": "businesses",
+            "stages": stages.summary(),
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "message": "No rows found in business_raw"
         }
 
-    df = pd.DataFrame(rows)
-    
-    # Normalize status to lowercase for comparison
-    df["status"] = df["status"].str.lower()
+    stages.start("hash", rows=len(df))
+    # Skip the refit entirely when the input hasn't changed since the last run
+    input_hash = snapshot_hash(df)
+    previous = get_state() or load_latest_state()
+    if not force and previous is not None and previous.snapshot_hash == input_hash:
+        return {
+            "status": "skipped",
+            "trigger": "raw_data_change",
+            "enhanced_table": "businesses",
+            "snapshot_hash": input_hash,
+            "optimal_k": previous.optimal_k,
+            "stages": stages.summary(),
+            "timestamp": datetime.utcnow().isoformat() + "Z",
+            "message": "business_raw unchanged since last training run"
+        }
+
+    stages.start("normalize", rows=len(df))
+    # Canonical categories/zones, lowercase status, valid coordinates, one
+    # row per business_id; everything else is quarantined
+    df, rejected = normalize_businesses(df)
+    quarantined = write_quarantine(rejected, QUARANTINE_PATH)
 
     # Separate active and inactive businesses
     df_active = df[df["status"] == "active"].copy()
     df_inactive = df[df["status"] == "inactive"].copy()
-    
+
     active_count = len(df_active)
     inactive_count = len(df_inactive)
 
@@ -52,104 +105,132 @@ def train_model():
             "trigger": "raw_data_change",
             "active_processed": active_count,
             "inactive_ignored_in_ml": inactive_count,
+            "quarantined": quarantined,
             "enhanced_table": "businesses",
+            "stages": stages.summary(),
             "timestamp": datetime.utcnow().isoformat() + "Z",
             "message": "Not enough active businesses to train model (need at least 2)"
         }
 
-    # 2. Prepare features (ONLY for active businesses)
-    encoder = OneHotEncoder(sparse=False)
-    cat_encoded = encoder.fit_transform(df_active[["general_category"]])
+    stages.start("encode", rows=active_count)
+    # 2. Prepare features (ONLY for active businesses): weighted lat/lng and
+    #    one-hot category (+ zone with FEATURE_ZONE=1), kept sparse (CSR)
+    encoder = fit_encoder(df_active)
+    feature_weights = default_feature_weights()
+    features = build_feature_matrix(df_active, encoder, feature_weights)
 
-    features = np.column_stack([
-        df_active["latitude"].astype(float),
-        df_active["longitude"].astype(float),
-        cat_encoded
-    ])
+    # Large tables: elbow on a stratified sample, MiniBatchKMeans fit and a
+    # chunked predict pass instead of exact KMeans on every row
+    large = use_large_mode(active_count)
+    sample = stratified_sample(df_active, LARGE_MODE_SAMPLE_ROWS) if large else None
 
-    # 3. Determine optimal k using elbow method
-    inertia_vals = []
+    stages.start("select_k", rows=active_count if sample is None else len(sample))
+    # 3. Determine optimal k using elbow method (parallel, early-stopping)
     K_RANGE = range(2, min(10, active_count))
-
-    for k in K_RANGE:
-        kmeans = KMeans(n_clusters=k, random_state=42)
-        kmeans.fit(features)
-        inertia_vals.append(kmeans.inertia_)
-
-    # Best elbow (simple approach)
-    optimal_k = K_RANGE[np.argmin(np.gradient(inertia_vals))]
-
-    # 4. Train final model
-    kmeans = KMeans(n_clusters=optimal_k, random_state=42)
-    clusters = kmeans.fit_predict(features)
-
-    df_active["cluster"] = clusters
-
-    # 5. Generate enhanced ML columns for ACTIVE businesses
-    df_active["distance_to_center"] = [
-        float(np.linalg.norm(features[i] - kmeans.cluster_centers_[clusters[i]]))
-        for i in range(len(df_active))
-    ]
-
-    # Business density (cluster population)
-    cluster_counts = df_active["cluster"].value_counts().to_dict()
-    df_active["business_density"] = df_active["cluster"].map(cluster_counts)
-
-    # Competitor density (same category, same cluster)
-    competitor_density = []
-    for i, row in df_active.iterrows():
-        same = df_active[
-            (df_active["cluster"] == row["cluster"]) &
-            (df_active["general_category"] == row["general_category"])
-        ]
-        competitor_density.append(len(same))
-    df_active["competitor_density"] = competitor_density
-
-    # Category distribution (per cluster)
-    category_distribution = {}
-    for cl in sorted(df_active["cluster"].unique()):
-        subset = df_active[df_active["cluster"] == cl]
-        category_distribution[cl] = (
-            subset["general_category"].value_counts(normalize=True).to_dict()
-        )
-
-    df_active["category_distribution"] = df_active["cluster"].map(category_distribution)
-
-    # Add cluster center (lat, lng only)
-    df_active["cluster_center"] = [
-        {
-            "latitude": float(kmeans.cluster_centers_[cluster][0]),
-            "longitude": float(kmeans.cluster_centers_[cluster][1])
-        }
-        for cluster in df_active["cluster"]
-    ]
-
-    # 6. Handle INACTIVE businesses (store but mark as inactive, no ML features)
-    if inactive_count > 0:
-        # Add placeholder ML columns to inactive rows
-        df_inactive["cluster"] = None
-        df_inactive["distance_to_center"] = None
-        df_inactive["business_density"] = None
-        df_inactive["competitor_density"] = None
-        df_inactive["category_distribution"] = None
-        df_inactive["cluster_center"] = None
-
+    k_selection = select_k(features if sample is None else features[sample], K_RANGE)
+    optimal_k = k_selection["k"]
+
+    stages.start("fit", rows=active_count)
+    # 4. Train final model, starting from the previous centroids when k is
+    #    close and renumbering clusters to match the previous ids
+    previous_centers, previous_counts = previous_clusters(previous, encoder, feature_weights)
+    kmeans, clusters, warm_start = fit_clusters(
+        features, optimal_k, large, previous_centers, previous_counts
+    )
+    fit_quality = None
+    if large and LARGE_MODE_QUALITY_ROWS > 0:
+        stages.start("quality", rows=min(LARGE_MODE_QUALITY_ROWS, active_count))
+        fit_quality = compare_with_exact(features, clusters, kmeans, optimal_k)
+
+    stages.start("features", rows=active_count)
+    # 5. Generate enhanced ML columns for ACTIVE businesses (vectorized)
+    zone_categories = sorted(df_active["zone_type"].astype(object).unique())
+    build_enhanced_features(
+        df_active, features, kmeans.cluster_centers_, clusters, zone_categories
+    )
+
+    stages.start("densities", rows=active_count)
+    # 5b. 50/100/200m business and competitor densities (batched BallTree)
+    add_radius_densities(df_active)
+    # 5c. Center, category shares and mean distance/densities, once per
+    #     cluster instead of on every row
+    summaries = cluster_summaries(df_active, cluster_centers(kmeans, feature_weights))
+
+    stages.start("inactive", rows=inactive_count)
+    # 6. INACTIVE businesses are stored without ML features: the concat
+    #    leaves their ML columns empty (published as null). Adding all-None
+    #    placeholder columns first, or passing an empty frame, makes pandas
+    #    warn that such entries will affect the result dtypes.
     # 7. Combine active and inactive
-    df_all = pd.concat([df_active, df_inactive], ignore_index=True)
-
-    # 8. Clear existing enhanced table
-    supabase.table("businesses").delete().neq("business_id", "").execute()
-
-    # 9. UPSERT enhanced rows
-    enhanced_rows = df_all.to_dict(orient="records")
-    for row in enhanced_rows:
-        supabase.table("businesses").insert(row).execute()
+    parts = [part for part in (df_active, df_inactive) if len(part)]
+    df_all = pd.concat(parts or [df_active], ignore_index=True)
+
+    stages.start("publish", rows=len(df_all))
+    # 8/9. Stage the rows that differ from businesses (every row with
+    #      PUBLISH_DIFF=0) and apply them atomically
+    publish = publish_snapshot(client, df_all)
+    cluster_publish = publish_clusters(client, summaries)
+
+    stages.start("persist", rows=len(df_all))
+    # 10. Keep the fitted model for incremental edits, and persist it so the
+    #     next process can warm-load it instead of retraining
+    state = ModelState(
+        encoder=encoder,
+        kmeans=kmeans,
+        snapshot=df_all,
+        fit_rows=len(df_all),
+        baseline_distance=float(df_active["distance_to_center"].mean()),
+        snapshot_hash=input_hash,
+        optimal_k=int(optimal_k),
+        zone_categories=zone_categories,
+        feature_weights=feature_weights,
+    )
+    set_state(state)
+    # Radius / nearest lookups are served from the new snapshot
+    refresh_index(state)
+    try:
+        artifact_path = save_artifact(state)
+    except OSError as e:
+        artifact_path = None
+        log.warning(f"could not save model artifact: {e}")
+    # Category/zone/status/cluster counts served by /stats
+    save_stats(compute_stats(df_all, input_hash))
+    save_clusters(summaries, input_hash)
+
+    grid_shape = None
+    if OPPORTUNITY_GRID:
+        stages.start("opportunity", rows=active_count)
+        # 11. Opportunity-score heatmap per category, served as map tiles
+        grid = build_grid(df_active, input_hash)
+        grid_shape = list(grid.scores.shape)
+        try:
+            save_grid(grid)
+        except OSError as e:
+            log.warning(f"could not save opportunity grid: {e}")
 
     return {
         "status": "success",
         "trigger": "raw_data_change",
         "active_processed": active_count,
         "inactive_ignored_in_ml": inactive_count,
+        "quarantined": quarantined,
         "enhanced_table": "businesses",
+        "publish_run_id": publish["run_id"],
+        "publish_batches": publish["batches"],
+        "rows_written": publish["rows"],
+        "rows_deleted": publish["deleted"],
+        "rows_unchanged": publish["unchanged"],
+        "clusters_written": cluster_publish["clusters"],
+        "optimal_k": int(optimal_k),
+        "k_selection": k_selection,
+        "fit_mode": "minibatch" if large else "exact",
+        "k_sample_rows": None if sample is None else len(sample),
+        "fit_quality": fit_quality,
+        "warm_start": warm_start,
+        "opportunity_grid": grid_shape,
+        "snapshot_hash": input_hash,
+        "artifact": artifact_path,
+        "stages": stages.summary(),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
         "timestamp": datetime.utcnow().isoformat() + "Z"
     }
@@ -0,0 +1,163 @@
+"""
+Warm-started final fits with stable cluster ids.
+
+The previous run's centroids are carried into the current feature columns
+(categories matched by name, block weights re-applied) and used as the
+KMeans init when k moved by at most WARM_START_MAX_K_CHANGE, so a retrain
+on slightly changed data converges in a few iterations. Whatever the init,
+the new clusters are matched to the old ones by an optimal assignment
+(Hungarian, on centroid distance) and renumbered, so unchanged clusters
+keep their ids and their rows don't look changed to change-only publishing.
+"""
+import os
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from sklearn.cluster import KMeans
+
+from features import ENCODED_BLOCKS
+from kselect import seed_centers
+from large_mode import fit_minibatch, predict_streamed
+
+WARM_START = os.getenv("WARM_START", "1") == "1"
+WARM_START_MAX_K_CHANGE = int(os.getenv("WARM_START_MAX_K_CHANGE", "2"))
+
+
+def _encoded_columns(encoder):
+    # Encoders from older artifacts were fit on general_category alone
+    return list(getattr(encoder, "feature_names_in_", ["general_category"]))
+
+
+def feature_names(encoder):
+    """Names of the build_feature_matrix columns for an encoder."""
+    return ["latitude", "longitude"] + [
+        f"{column}={category}"
+        for column, categories in zip(_encoded_columns(encoder), encoder.categories_)
+        for category in categories
+    ]
+
+
+def _column_scale(encoder, weights):
+    if not weights:
+        return np.ones(len(feature_names(encoder)))
+    return np.concatenate([
+        np.full(2, weights["geo"]),
+        *[
+            np.full(len(categories), weights[ENCODED_BLOCKS[column]])
+            for column, categories in zip(_encoded_columns(encoder), encoder.categories_)
+        ],
+    ])
+
+
+def align_centers(centers, old_encoder, old_weights, encoder, weights):
+    """
+    Centroids fitted with old_encoder/old_weights, expressed in the columns
+    of encoder/weights. Categories the old model never saw start at 0.
+    """
+    unweighted = np.asarray(centers, dtype=float) / _column_scale(old_encoder, old_weights)
+    position = {name: i for i, name in enumerate(feature_names(old_encoder))}
+    names = feature_names(encoder)
+    aligned = np.zeros((len(unweighted), len(names)))
+    for j, name in enumerate(names):
+        if name in position:
+            aligned[:, j] = unweighted[:, position[name]]
+    return aligned * _column_scale(encoder, weights)
+
+
+def previous_clusters(state, encoder, weights):
+    """
+    (centroids in the current columns, active rows per cluster) of the
+    model in `state`, or (None, None) without one.
+    """
+    if state is None or state.kmeans is None:
+        return None, None
+    centers = align_centers(
+        state.kmeans.cluster_centers_, state.encoder, state.feature_weights, encoder, weights
+    )
+    counts = None
+    snapshot = state.snapshot
+    if snapshot is not None and "cluster" in snapshot.columns:
+        labels = snapshot.loc[snapshot["status"] == "active", "cluster"].dropna().astype(int)
+        counts = np.bincount(labels.to_numpy(), minlength=len(centers))[:len(centers)]
+    return centers, counts
+
+
+def initial_centers(features, previous, k, counts=None):
+    """
+    k starting centroids from the previous ones: all of them when k is
+    unchanged, plus k-means++ picks when k grew, merged (weighted by
+    cluster size) when it shrank.
+    """
+    if len(previous) == k:
+        return previous
+    if len(previous) < k:
+        return seed_centers(features, previous, k)
+    weights = np.ones(len(previous)) if counts is None else np.maximum(counts, 1)
+    largest = np.sort(np.argsort(-weights, kind="stable")[:k])
+    merged = KMeans(n_clusters=k, init=previous[largest], n_init=1, random_state=42)
+    return merged.fit(previous, sample_weight=weights).cluster_centers_
+
+
+def match_labels(previous, centers):
+    """
+    New id for each new cluster: the old cluster it is matched to (minimum
+    total squared centroid distance), or a free id in range(k) when it has
+    no partner or its partner's id is out of range (k shrank). Returns
+    (mapping, number of clusters that kept an old id).
+    """
+    k = len(centers)
+    cost = ((centers[:, None, :] - previous[None, :, :]) ** 2).sum(axis=2)
+    rows, cols = linear_sum_assignment(cost)
+    mapping = np.full(k, -1)
+    for new, old in zip(rows, cols):
+        if old < k:
+            mapping[new] = old
+    kept = int((mapping >= 0).sum())
+    free = iter(sorted(set(range(k)) - set(mapping[mapping >= 0].tolist())))
+    for new in np.flatnonzero(mapping == -1):
+        mapping[new] = next(free)
+    return mapping, kept
+
+
+def relabel(model, mapping):
+    """Renumber a fitted model's clusters: cluster i becomes mapping[i]."""
+    order = np.argsort(mapping)
+    model.cluster_centers_ = model.cluster_centers_[order]
+    if hasattr(model, "labels_"):
+        model.labels_ = mapping[model.labels_]
+    if hasattr(model, "_counts"):
+        # MiniBatchKMeans keeps per-center counts for partial_fit
+        model._counts = model._counts[order]
+    return model
+
+
+def fit_clusters(features, k, large=False, previous=None, counts=None):
+    """
+    Fit the final model. Returns (model, labels, info); info reports
+    whether the fit was warm-started, the previous k, the iteration count
+    and how many clusters kept an old id.
+    """
+    warm = (
+        WARM_START and previous is not None
+        and abs(len(previous) - k) <= WARM_START_MAX_K_CHANGE
+    )
+    init = initial_centers(features, previous, k, counts) if warm else None
+
+    if large:
+        model = fit_minibatch(features, k, init=init)
+    elif init is not None:
+        model = KMeans(n_clusters=k, init=init, n_init=1, random_state=42).fit(features)
+    else:
+        model = KMeans(n_clusters=k, random_state=42).fit(features)
+
+    stable = 0
+    if previous is not None:
+        mapping, stable = match_labels(previous, model.cluster_centers_)
+        relabel(model, mapping)
+    labels = predict_streamed(model, features) if large else model.labels_
+    return model, labels, {
+        "warm_start": bool(warm),
+        "previous_k": None if previous is None else len(previous),
+        "n_iter": int(model.n_iter_),
+        "stable_ids": stable,
+    }